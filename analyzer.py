@@ -0,0 +1,148 @@
+"""
+Analyzer לטקסט של BM25: אותה פונקציה בדיוק באינדוקס ובשאילתה.
+  - NFKC + אותיות קטנות (m³ → m3), הסרת סימני פיסוק צמודים ("(m3)," → m3)
+  - מספרים: 1,180,000 → 1180000 | 1.180 m → 1.18 m | 1.18 mio / million / MCM → 1180000
+  - יחידות: cubic meters / cu.m / cbm / MCM → m3
+  - מספרי סעיפים (6.2.3, 6.10) נשמרים כטוקן אחד כפי שהם – מספר עם נקודה מנורמל כעשרוני
+    רק כשאחריו יחידה או מילת קנה מידה (אחרת 6.10 היה הופך ל-6.1)
+  - עברית: אותיות שימוש (ו/ה/ב/ל/מ/ש/כ) – אופציונלי. מילה נשמרת כפי שהיא ובנוסף הגזע אחרי
+    הסרת תחילית אחת (לכל תחילית אפשרית): "המאגר" → המאגר + מאגר, "מאגר" → מאגר + אגר.
+    בלי מילון אי אפשר לדעת אם האות הראשונה שייכת לשורש – כך שתי הצורות תמיד חולקות מונח
+  - מילות עצירה באנגלית ובעברית
+שינוי בכללים מחייב העלאת ANALYZER_VERSION – אינדקס ה-BM25 נבנה מחדש אוטומטית.
+"""
+import os
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+ANALYZER_VERSION = 3
+STRIP_HEBREW_PREFIXES = os.environ.get("RAG_HEBREW_PREFIXES", "1") != "0"
+
+# ── ביטויים מקומפלים פעם אחת ─────────────────────────────────────────────────
+# צירופי יחידות מרובי מילים – מוחלפים לפני הפיצול
+_UNIT_PHRASES = [
+    (re.compile(r"\bmillion\s+cubic\s+met(?:er|re)s?\b"), " mio m3 "),
+    (re.compile(r"\bcubic\s+met(?:er|re)s?\b"), " m3 "),
+    (re.compile(r"\bcu\.?\s?m\b"), " m3 "),
+    (re.compile(r"\bm\s?\^\s?3\b"), " m3 "),
+    (re.compile(r"\bmcm\b"), " mio m3 "),
+]
+
+# סדר החלופות חשוב: מספר עם פסיקי אלפים → מספר עם נקודה (סעיף או עשרוני) → שלם → מילה
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?)
+    | (?P<section>\d+(?:\.\d+)+)
+    | (?P<integer>\d+)
+    | (?P<word>[a-z]+\d*[a-z\d]* | [א-ת]+(?:["״׳'][א-ת]+)*)
+    """,
+    re.VERBOSE,
+)
+
+# מילות קנה מידה אחרי מספר – מתקפלות לתוך המספר
+_SCALES = {
+    "mio": Decimal(10) ** 6, "million": Decimal(10) ** 6, "millions": Decimal(10) ** 6,
+    "mil": Decimal(10) ** 6, "mln": Decimal(10) ** 6,
+    "thousand": Decimal(10) ** 3, "k": Decimal(10) ** 3,
+    "billion": Decimal(10) ** 9, "bn": Decimal(10) ** 9,
+    "מיליון": Decimal(10) ** 6, "אלף": Decimal(10) ** 3, "מיליארד": Decimal(10) ** 9,
+}
+
+# יחידות (אחרי נרמול) – מספר עם נקודה לפניהן הוא ערך עשרוני ולא מספר סעיף
+_UNITS = frozenset(
+    """
+    m m2 m3 mm cm km kg g t ton tons kn n mpa kpa pa bar kw mw kwh mwh kv v hz l s sec min
+    """.split()
+)
+
+_UNIT_ALIASES = {
+    "cbm": "m3",
+    "meters": "m", "meter": "m", "metres": "m", "metre": "m",
+    "מ\"ק": "m3", "מק": "m3", "קוב": "m3", "מטר": "m",
+}
+
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be by for from has have in is it its of on or that the this to was
+    were which with what how many much does do
+    של את על עם זה זו זאת הוא היא הם הן כי אם או גם לא יש אין מה אשר כל בין לפי
+    """.split()
+)
+
+# אותיות שימוש – צירוף (וה, שב...) הוא תחילית אחת
+_HEBREW_PREFIXES = ("וכש", "וש", "וה", "וב", "ול", "ומ", "שה", "שב", "של", "מה", "כש",
+                    "ו", "ה", "ב", "ל", "מ", "ש", "כ")
+_MIN_HEBREW_STEM = 3
+
+
+def _canonical_number(value: Decimal) -> str:
+    """1180000 / 1.18 – בלי אפסים מיותרים ובלי מעריך."""
+    טקסט = format(value.normalize(), "f")
+    return טקסט.rstrip("0").rstrip(".") if "." in טקסט else טקסט
+
+
+@lru_cache(maxsize=200_000)
+def _word_forms(word: str) -> tuple[str, ...]:
+    """
+    צורות המילה לאינדקס: הצורה עצמה (אחרי יחידות נרדפות) ולעברית גם הגזע אחרי הסרת
+    תחילית אחת – פעם אחת לכל תחילית שמתאימה. נשמר במטמון – מילים חוזרות הרבה.
+    """
+    צורות = [_UNIT_ALIASES.get(word, word)]
+    if STRIP_HEBREW_PREFIXES and "א" <= word[0] <= "ת":
+        for תחילית in _HEBREW_PREFIXES:
+            if word.startswith(תחילית) and len(word) - len(תחילית) >= _MIN_HEBREW_STEM:
+                שורש = word[len(תחילית):]
+                שורש = _UNIT_ALIASES.get(שורש, שורש)
+                if שורש not in צורות:
+                    צורות.append(שורש)
+    return tuple(צורה for צורה in צורות if צורה not in _STOPWORDS)
+
+
+def _is_quantity_word(match: re.Match) -> bool:
+    """מילת קנה מידה או יחידה – המספר שלפניה הוא כמות ולא מספר סעיף."""
+    if match.lastgroup != "word":
+        return False
+    return match.group() in _SCALES or any(צורה in _UNITS for צורה in _word_forms(match.group()))
+
+
+def analyze(text: str) -> list[str]:
+    """מחזיר את רשימת המונחים של הטקסט – לאינדוקס ולשאילתה כאחד."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    for ביטוי, החלפה in _UNIT_PHRASES:
+        text = ביטוי.sub(החלפה, text)
+
+    מונחים: list[str] = []
+    מספר_אחרון: Decimal | None = None  # המספר האחרון שנוסף – מילת קנה מידה אחריו מכפילה אותו
+    התאמות = list(_TOKEN_RE.finditer(text))
+    for i, m in enumerate(התאמות):
+        סוג = m.lastgroup
+        if סוג == "section":
+            # 6.10 / 6.2.3 – מספר סעיף כפי שהוא; x.y עם יחידה או קנה מידה אחריו – ערך עשרוני
+            הבא = התאמות[i + 1] if i + 1 < len(התאמות) else None
+            if m.group().count(".") > 1 or not (הבא and _is_quantity_word(הבא)):
+                מונחים.append(m.group())
+                מספר_אחרון = None
+                continue
+            סוג = "number"
+        if סוג in ("number", "integer"):
+            try:
+                מספר_אחרון = Decimal(m.group().replace(",", ""))
+            except InvalidOperation:
+                מספר_אחרון = None
+                continue
+            מונחים.append(_canonical_number(מספר_אחרון))
+        else:
+            מילה = m.group()
+            if מספר_אחרון is not None and מילה in _SCALES:
+                מספר_אחרון *= _SCALES[מילה]
+                מונחים[-1] = _canonical_number(מספר_אחרון)
+                מספר_אחרון = None
+                continue
+            מספר_אחרון = None
+            # מילת קנה מידה בלי מספר לפניה ("mio m3" בשאילתה) – אין לה משמעות לבד
+            if מילה in _STOPWORDS or מילה in _SCALES:
+                continue
+            מונחים.extend(_word_forms(מילה))
+    return מונחים
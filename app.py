@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 import streamlit as st
 import streamlit_authenticator as stauth
 from dotenv import load_dotenv
@@ -13,12 +15,41 @@ from rag import (
     save_to_chromadb,
     get_existing_sources,
     list_sources,
-    search_and_answer,
+    search_and_answer_stream,
     summarize_file,
     count_pdf_pages,
-    process_large_pdf,
     delete_source,
+    scan_pdf_folder,
+    migrate_page_store,
 )
+from store import get_store
+from chat_history import ChatHistory
+from index_jobs import get_job_queue, start_index_worker
+
+
+@st.cache_resource
+def _shared_store():
+    """
+    לקוח ChromaDB + אוסף + אינדקסים – נפתחים פעם אחת לתהליך ומשותפים לכל ה-sessions.
+    chroma_db שהגיע במבנה קודם (למשל האינדקס המוכן מראש) מוסב כאן, לפני השאלה הראשונה.
+    """
+    מאגר = get_store()
+    הוסבו = migrate_page_store()
+    if הוסבו:
+        print(f"[CHECK] Page store migration: {הוסבו} chunks updated")
+    return מאגר
+
+
+_shared_store()
+
+
+@st.cache_resource
+def _index_worker():
+    """worker האינדוקס – אחד לתהליך, חי מעבר ל-reruns ולרענון הלשונית."""
+    return start_index_worker()
+
+
+_index_worker()
 
 # ========================
 # מילון תרגומים – כל מחרוזות ה-UI
@@ -40,17 +71,21 @@ TRANSLATIONS = {
         "upload_label":      "Select PDF file",
         "upload_btn":        "📥 Load into System",
         "already_exists":    "Already exists: {}",
-        "processing":        "**Processing:** {}",
-        "saved_chunks":      "✅ Saved {} chunks",
-        "upload_success":    "Added {} file(s) successfully!",
+        "upload_changed":    "{} has changed – only modified pages will be re-indexed",
+        "upload_success":    "Queued {} file(s) for indexing.",
         "scan_header":       "🔍 Scan pdfs folder",
         "scan_caption":      "Index files copied manually to the folder",
         "scan_btn":          "🔄 Scan & Index New Files",
         "scan_no_folder":    "pdfs folder does not exist.",
-        "scan_all_indexed":  "All files in folder are already indexed.",
-        "scan_found":        "Found {} new files to index.",
-        "scan_chunks":       "✅ {} chunks",
-        "scan_success":      "Indexed {} files successfully!",
+        "scan_all_indexed":  "All files in folder are already indexed and unchanged.",
+        "scan_found":        "Found {} new or changed files to index.",
+        "scan_success":      "Queued {} file(s) for indexing.",
+        "jobs_header":       "⚙️ Indexing Jobs",
+        "job_queued":        "🕒 {} – waiting",
+        "job_running":       "⏳ {} – {} / {} pages",
+        "job_done":          "✅ {} – {} chunks",
+        "job_failed":        "❌ {} – {}",
+        "jobs_clear_btn":    "🧹 Clear finished",
         "mode_subheader":    "🔧 Select Mode",
         "mode_qa":           "❓ Free Question",
         "mode_summarize":    "📋 Summarize Document",
@@ -63,6 +98,10 @@ TRANSLATIONS = {
         "chat_placeholder":  "Ask a question (Hebrew or English)...",
         "no_docs_error":     "No documents loaded. Please upload a PDF first.",
         "searching":         "Searching for answer...",
+        "stage_rewrite":     "🔤 Translating and expanding the question...",
+        "stage_search":      "🔍 Searching the documents...",
+        "stage_rerank":      "📊 Ranking the relevant pages...",
+        "stage_answer":      "✍️ Writing the answer...",
         "summarize_header":  "📋 Summarize Document",
         "summarize_select":  "Select document to summarize:",
         "summarize_btn":     "✍️ Summarize",
@@ -93,17 +132,21 @@ TRANSLATIONS = {
         "upload_label":      "בחר קובץ PDF",
         "upload_btn":        "📥 טען לתוך המערכת",
         "already_exists":    "כבר קיים: {}",
-        "processing":        "**מעבד:** {}",
-        "saved_chunks":      "✅ נשמרו {} חלקים",
-        "upload_success":    "נוספו {} קובץ/קבצים בהצלחה!",
+        "upload_changed":    "{} השתנה – רק העמודים ששונו יאונדקסו מחדש",
+        "upload_success":    "{} קובץ/קבצים נוספו לתור האינדוקס.",
         "scan_header":       "🔍 סרוק תיקיית pdfs",
         "scan_caption":      "מאנדקס קבצים שהועתקו ידנית לתיקייה",
         "scan_btn":          "🔄 סרוק ואנדקס קבצים חדשים",
         "scan_no_folder":    "תיקיית pdfs לא קיימת.",
-        "scan_all_indexed":  "כל הקבצים בתיקייה כבר מאונדקסים.",
-        "scan_found":        "נמצאו {} קבצים חדשים לאינדוקס.",
-        "scan_chunks":       "✅ {} חלקים",
-        "scan_success":      "אונדקסו {} קבצים בהצלחה!",
+        "scan_all_indexed":  "כל הקבצים בתיקייה כבר מאונדקסים וללא שינוי.",
+        "scan_found":        "נמצאו {} קבצים חדשים או שהשתנו לאינדוקס.",
+        "scan_success":      "{} קובץ/קבצים נוספו לתור האינדוקס.",
+        "jobs_header":       "⚙️ עבודות אינדוקס",
+        "job_queued":        "🕒 {} – ממתין",
+        "job_running":       "⏳ {} – {} / {} עמודים",
+        "job_done":          "✅ {} – {} חלקים",
+        "job_failed":        "❌ {} – {}",
+        "jobs_clear_btn":    "🧹 נקה שהסתיימו",
         "mode_subheader":    "🔧 בחר מצב",
         "mode_qa":           "❓ שאלה חופשית",
         "mode_summarize":    "📋 סכם מסמך",
@@ -116,6 +159,10 @@ TRANSLATIONS = {
         "chat_placeholder":  "שאל שאלה (עברית או אנגלית)...",
         "no_docs_error":     "אין מסמכים טעונים. העלה PDF תחילה.",
         "searching":         "מחפש תשובה...",
+        "stage_rewrite":     "🔤 מתרגם ומרחיב את השאלה...",
+        "stage_search":      "🔍 מחפש במסמכים...",
+        "stage_rerank":      "📊 מדרג את העמודים הרלוונטיים...",
+        "stage_answer":      "✍️ כותב תשובה...",
         "summarize_header":  "📋 סכם מסמך",
         "summarize_select":  "בחר מסמך לסיכום:",
         "summarize_btn":     "✍️ סכם",
@@ -325,36 +372,31 @@ with st.sidebar:
         if קבצים_שהועלו:
             if st.button(t("upload_btn"), use_container_width=True):
                 os.makedirs("pdfs", exist_ok=True)
-                מקורות_קיימים = get_existing_sources()
+                קטלוג = get_store().catalog
                 נוספו = 0
 
                 for קובץ in קבצים_שהועלו:
-                    if קובץ.name in מקורות_קיימים:
-                        st.warning(t("already_exists", קובץ.name))
-                        continue
-
-                    # שמירה לדיסק בתיקיית pdfs
+                    # שם קיים: אותו תוכן – מדולג; תוכן אחר – אינדוקס חוזר של העמודים ששונו בלבד
+                    רשומה = קטלוג.get(קובץ.name)
+                    if רשומה is not None:
+                        if רשומה["content_hash"] == hashlib.sha256(קובץ.getbuffer()).hexdigest():
+                            st.warning(t("already_exists", קובץ.name))
+                            continue
+                        st.info(t("upload_changed", קובץ.name))
+
+                    # שמירה לקובץ זמני בתיקיית pdfs – הוא מחליף את pdfs/<name> רק כשה-worker
+                    # לוקח את העבודה, כך שאינדוקס שרץ על הגרסה הקודמת לא קורא קובץ שהוחלף
                     נתיב = os.path.join("pdfs", קובץ.name)
-                    with open(נתיב, "wb") as f:
+                    fd, זמני = tempfile.mkstemp(dir="pdfs", prefix=f".{קובץ.name}.", suffix=".upload")
+                    with os.fdopen(fd, "wb") as f:
                         f.write(קובץ.getbuffer())
 
-                    # מציג שורת סטטוס + progress bar לקבצים גדולים
-                    st.markdown(t("processing", קובץ.name))
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-
-                    def progress_callback(עמוד, סה_כ, _bar=progress_bar, _txt=status_text):
-                        _bar.progress(עמוד / סה_כ)
-                        _txt.caption(f"{עמוד} / {סה_כ}")
-
-                    chunks = process_large_pdf(נתיב, קובץ.name, progress_callback=progress_callback)
-                    progress_bar.progress(1.0)
-                    status_text.caption(t("saved_chunks", chunks))
+                    # האינדוקס עצמו רץ ב-worker ברקע – ההתקדמות מוצגת ב"עבודות אינדוקס"
+                    get_job_queue().enqueue(נתיב, קובץ.name, staged_path=זמני)
                     נוספו += 1
 
                 if נוספו > 0:
                     st.success(t("upload_success", נוספו))
-                    st.rerun()
 
         st.markdown("---")
 
@@ -369,36 +411,59 @@ with st.sidebar:
             if not os.path.isdir(תיקיית_pdf):
                 st.error(t("scan_no_folder"))
             else:
-                # מוצא קבצים בתיקייה שעוד לא ב-ChromaDB
-                מקורות_קיימים = get_existing_sources()
-                כל_קבצי_pdf = [
-                    ש for ש in os.listdir(תיקיית_pdf)
-                    if ש.lower().endswith(".pdf")
+                # קבצים חדשים או שהשתנו (שם + גודל + mtime מול הקטלוג) שעוד לא בתור
+                סריקה = scan_pdf_folder(תיקיית_pdf)
+                בתור = {ע["source"] for ע in get_job_queue().active()}
+                קבצים_חדשים = [
+                    ש for ש in סריקה["new"] + סריקה["changed"] if ש not in בתור
                 ]
-                קבצים_חדשים = [ש for ש in כל_קבצי_pdf if ש not in מקורות_קיימים]
 
                 if not קבצים_חדשים:
                     st.info(t("scan_all_indexed"))
                 else:
                     st.info(t("scan_found", len(קבצים_חדשים)))
-                    נוספו = 0
-                    for שם_קובץ in קבצים_חדשים:
-                        נתיב = os.path.join(תיקיית_pdf, שם_קובץ)
-                        st.markdown(t("processing", שם_קובץ))
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-
-                        def progress_callback(עמוד, סה_כ, _bar=progress_bar, _txt=status_text):
-                            _bar.progress(עמוד / סה_כ)
-                            _txt.caption(f"{עמוד} / {סה_כ}")
-
-                        chunks = process_large_pdf(נתיב, שם_קובץ, progress_callback=progress_callback)
-                        progress_bar.progress(1.0)
-                        status_text.caption(t("scan_chunks", chunks))
-                        נוספו += 1
-
+                    נוספו = sum(
+                        get_job_queue().enqueue(os.path.join(תיקיית_pdf, שם_קובץ), שם_קובץ) is not None
+                        for שם_קובץ in קבצים_חדשים
+                    )
                     st.success(t("scan_success", נוספו))
-                    st.rerun()
+
+        st.markdown("---")
+
+        # ========================
+        # עבודות אינדוקס – מתעדכן מהטבלה כל 2 שניות, בלי להריץ מחדש את כל הדף
+        # ========================
+        @st.fragment(run_every=2)
+        def _index_jobs_panel():
+            תור = get_job_queue()
+            עבודות = list(reversed(תור.recent(limit=8)))
+            פעילות = {ע["id"] for ע in עבודות if ע["status"] in ("queued", "running")}
+
+            # עבודה שהסתיימה מאז הבדיקה הקודמת – רענון מלא כדי שרשימת המסמכים תתעדכן
+            קודמות = st.session_state.get("active_index_jobs", set())
+            st.session_state["active_index_jobs"] = פעילות
+            if קודמות - פעילות:
+                st.rerun(scope="app")
+
+            if not עבודות:
+                return
+            st.header(t("jobs_header"))
+            for עבודה in עבודות:
+                if עבודה["status"] == "queued":
+                    st.caption(t("job_queued", עבודה["source"]))
+                elif עבודה["status"] == "running":
+                    st.caption(t("job_running", עבודה["source"], עבודה["pages_done"], עבודה["pages_total"] or "?"))
+                    st.progress(עבודה["pages_done"] / עבודה["pages_total"] if עבודה["pages_total"] else 0.0)
+                elif עבודה["status"] == "done":
+                    st.caption(t("job_done", עבודה["source"], עבודה["chunks"]))
+                else:
+                    st.caption(t("job_failed", עבודה["source"], עבודה["error"]))
+            if len(פעילות) < len(עבודות):
+                if st.button(t("jobs_clear_btn"), key="clear_jobs", use_container_width=True):
+                    תור.clear_finished()
+                    st.rerun(scope="fragment")
+
+        _index_jobs_panel()
 
     else:
         st.caption(t("admin_locked"))
@@ -425,8 +490,9 @@ if מצב == t("mode_qa"):
     st.subheader(t("qa_header"))
 
     # אתחול היסטוריית שיחה ב-session_state
+    # (N סבבים אחרונים כלשונם + סיכום מצטבר של הישנים – ChatHistory)
     if "chat_history" not in st.session_state:
-        st.session_state["chat_history"] = []
+        st.session_state["chat_history"] = ChatHistory()
 
     # סינון לפי מסמכים נבחרים + כפתור ניקוי היסטוריה
     col_filter, col_clear = st.columns([3, 1])
@@ -442,7 +508,7 @@ if מצב == t("mode_qa"):
     with col_clear:
         if st.session_state["chat_history"]:
             if st.button(t("clear_btn"), key="clear_history", use_container_width=True):
-                st.session_state["chat_history"] = []
+                st.session_state["chat_history"].clear()
                 st.rerun()
 
     # ממיר את הבחירה לפרמטר סינון (None = כל המסמכים, רשימה = סינון מרובה)
@@ -474,17 +540,27 @@ if מצב == t("mode_qa"):
                 st.markdown(שאלה)
 
             # שולח לClaude עם כל ההיסטוריה + סינון קובץ
+            # התשובה נבנית בבועה תוך כדי הזרמה – קודם שלבי השליפה, אחר כך הטקסט
             with st.chat_message("assistant"):
-                with st.spinner(t("searching")):
-                    תשובה = search_and_answer(
-                        שאלה,
-                        history=st.session_state["chat_history"],
-                        filter_source=סינון_פעיל,
-                    )
-                st.markdown(תשובה)
-
-            # שומר ב-session_state
-            st.session_state["chat_history"].append((שאלה, תשובה))
+                בועה = st.empty()
+                בועה.caption(t("searching"))
+                תשובה = ""
+                סיכום_שיחה, סבבים_אחרונים = st.session_state["chat_history"].snapshot()
+                for סוג, ערך in search_and_answer_stream(
+                    שאלה,
+                    history=סבבים_אחרונים,
+                    filter_source=סינון_פעיל,
+                    history_summary=סיכום_שיחה,
+                ):
+                    if סוג == "stage":
+                        בועה.caption(t(f"stage_{ערך}"))
+                    elif סוג == "token":
+                        תשובה += ערך
+                        בועה.markdown(תשובה + "▌")
+                בועה.markdown(תשובה)
+
+            # שומר ב-session_state – הקיפול לסיכום (אם סבב יצא מהחלון) רץ ברקע
+            st.session_state["chat_history"].add_turn(שאלה, תשובה)
 
 # ========================
 # מצב: סיכום מסמך
@@ -0,0 +1,54 @@
+"""
+מדידה: פרופילי חילוץ הטקסט (RAG_EXTRACTION_PROFILE) על קבצי ה-PDF שב-pdfs/.
+לכל פרופיל – עמודים לשנייה, בכמה עמודים רץ extract_tables, וכמה עמודים יצאו
+זהים לחלוטין לפלט של full-tables (ההתנהגות המקורית של _page_to_text).
+רץ בתהליך אחד (ללא ProcessPool) – כדי שהזמנים ישקפו את העבודה לעמוד.
+הרץ: python bench_extraction.py [עמודים_לקובץ]
+"""
+import os
+import sys
+import time
+
+import pdfplumber
+
+from rag import EXTRACTION_PROFILES, _needs_table_extraction, _page_to_text
+
+PAGES_PER_FILE = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+PDF_FOLDER = "pdfs"
+
+קבצים = sorted(
+    os.path.join(PDF_FOLDER, f) for f in os.listdir(PDF_FOLDER) if f.lower().endswith(".pdf")
+)
+
+
+def _run(profile: str) -> tuple[list[str], float, int]:
+    """מחלץ את כל העמודים בפרופיל אחד. כל קובץ נפתח מחדש – בלי אובייקטים שכבר פוענחו."""
+    טקסטים: list[str] = []
+    עם_טבלאות = 0
+    זמן = 0.0
+    for קובץ in קבצים:
+        with pdfplumber.open(קובץ) as pdf:
+            for page in pdf.pages[:PAGES_PER_FILE]:
+                t0 = time.perf_counter()
+                טקסטים.append(_page_to_text(page, profile))
+                זמן += time.perf_counter() - t0
+                עם_טבלאות += _needs_table_extraction(page, profile)
+    return טקסטים, זמן, עם_טבלאות
+
+
+# full-tables ראשון – הוא הבסיס להשוואה
+תוצאות = {profile: _run(profile) for profile in reversed(EXTRACTION_PROFILES)}
+בסיס, זמן_בסיס, _ = תוצאות["full-tables"]
+
+print(f"{'='*72}")
+print(f"קבצים: {len(קבצים)} | עמודים: {len(בסיס)} (עד {PAGES_PER_FILE} לקובץ)")
+print(f"{'profile':<12} {'pages/s':>9} {'ms/page':>9} {'speedup':>8} {'tables run':>11} {'identical':>10}")
+for profile in EXTRACTION_PROFILES:
+    טקסטים, זמן, עם_טבלאות = תוצאות[profile]
+    זהים = sum(a == b for a, b in zip(טקסטים, בסיס))
+    print(
+        f"{profile:<12} {len(טקסטים) / זמן:9.2f} {זמן * 1000 / len(טקסטים):9.1f} "
+        f"{זמן_בסיס / זמן:7.2f}x {עם_טבלאות:5}/{len(טקסטים):<5} "
+        f"{זהים / len(טקסטים):9.1%}"
+    )
+print(f"{'='*72}")
@@ -0,0 +1,86 @@
+"""
+מדידה: שלב האיחוד של hybrid_search על קורפוס סינתטי של 100k chunks –
+צבירת ציוני BM25 + RRF ב-dict ומיון מלא (הדרך הקודמת), מול NumPy + argpartition
+(accumulate_scores + rrf_fuse). רשימות ההופעה נבנות בזיכרון – בלי SQLite ובלי ChromaDB,
+כך שנמדד רק האיחוד. בודק גם שהתוצאות זהות.
+הרץ: python bench_fusion.py [מספר_chunks]
+"""
+import sys
+import time
+
+import numpy as np
+
+from bm25_index import accumulate_scores
+from rag import rrf_fuse
+
+N_CHUNKS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+N_QUERIES = 20
+TERMS_PER_QUERY = 6
+N_RESULTS = 50
+K_RRF = 60
+
+rng = np.random.default_rng(7)
+
+
+def שאילתה_סינתטית():
+    """לכל מונח: (מזהי chunks, ציונים, חזרות) – מונחים נפוצים ונדירים (df מ-50 עד 40% מהקורפוס)."""
+    מונחים = []
+    for _ in range(TERMS_PER_QUERY):
+        df = int(N_CHUNKS * rng.choice([0.0005, 0.01, 0.05, 0.2, 0.4]))
+        מזהים = rng.choice(N_CHUNKS, size=df, replace=False).astype(np.int64)
+        # ציונים מעוגלים – יוצרים שוויונות, כדי לבדוק גם את שבירת השוויון
+        ציונים = np.round(rng.gamma(2.0, 1.5, size=df), 2)
+        מונחים.append((מזהים, ציונים, int(rng.integers(1, 3))))
+    סמנטי = [f"c{i}" for i in rng.choice(N_CHUNKS, size=N_RESULTS, replace=False)]
+    return מונחים, סמנטי
+
+
+def איחוד_ישן(מונחים, סמנטי):
+    """הדרך הקודמת: dict לכל ה-chunks, מיון מלא, RRF ב-dict ומיון נוסף."""
+    ציונים: dict[str, float] = {}
+    for מזהים, ציוני_מונח, חזרות in מונחים:
+        for מזהה, ציון in zip(מזהים.tolist(), ציוני_מונח.tolist()):
+            מפתח = f"c{מזהה}"
+            ציונים[מפתח] = ציונים.get(מפתח, 0.0) + חזרות * ציון
+    דירוג_bm25 = sorted(ציונים.items(), key=lambda x: x[1], reverse=True)
+
+    ציוני_rrf: dict[str, float] = {}
+    for דרגה, (מזהה, _) in enumerate(דירוג_bm25):
+        ציוני_rrf[מזהה] = ציוני_rrf.get(מזהה, 0.0) + 0.5 / (דרגה + K_RRF)
+    for דרגה, מזהה in enumerate(סמנטי):
+        ציוני_rrf[מזהה] = ציוני_rrf.get(מזהה, 0.0) + 0.5 / (דרגה + K_RRF)
+    מוויינים = sorted(ציוני_rrf, key=ציוני_rrf.__getitem__, reverse=True)[:N_RESULTS]
+    return מוויינים, {מזהה: ציוני_rrf[מזהה] for מזהה in מוויינים}
+
+
+def איחוד_חדש(מונחים, סמנטי):
+    """NumPy: top_k ב-argpartition, דרגות BM25 רק לתוצאות הסמנטיות, RRF על מערכים."""
+    מספרי_סם = np.array([int(m[1:]) for m in סמנטי], dtype=np.int64)
+    מזהים, _, דרגות = accumulate_scores(מונחים, N_RESULTS, rank_of=מספרי_סם)
+    return rrf_fuse(
+        [f"c{m}" for m in מזהים.tolist()],
+        סמנטי,
+        K_RRF,
+        N_RESULTS,
+        {f"c{m}": d for m, d in דרגות.items()},
+    )
+
+
+שאילתות = [שאילתה_סינתטית() for _ in range(N_QUERIES)]
+
+t0 = time.perf_counter()
+ישנים = [איחוד_ישן(*ש) for ש in שאילתות]
+זמן_ישן = (time.perf_counter() - t0) / N_QUERIES
+
+t0 = time.perf_counter()
+חדשים = [איחוד_חדש(*ש) for ש in שאילתות]
+זמן_חדש = (time.perf_counter() - t0) / N_QUERIES
+
+הופעות = np.mean([sum(len(m) for m, _, _ in ש[0]) for ש in שאילתות])
+print(f"{'='*60}")
+print(f"chunks: {N_CHUNKS:,} | שאילתות: {N_QUERIES} | הופעות לשאילתה: {הופעות:,.0f}")
+print(f"dict + מיון מלא     : {זמן_ישן * 1000:8.1f} ms לשאילתה")
+print(f"NumPy + argpartition: {זמן_חדש * 1000:8.1f} ms לשאילתה")
+print(f"האצה: x{זמן_ישן / זמן_חדש:.1f}")
+print(f"תוצאות זהות: {'כן' if ישנים == חדשים else 'לא'}")
+print(f"{'='*60}")
@@ -0,0 +1,53 @@
+"""
+מדידה: זמן עד תחילת החיפוש (תרגום + הרחבה) – שתי קריאות סדרתיות מול קריאה משולבת אחת.
+רץ מול StubAnthropic עם השהייה קבועה לכל קריאה – ללא רשת וללא מפתח API.
+המטמון (get_query_cache) לא משתתף במדידה – נמדדות הפונקציות שמאחוריו.
+הרץ: python bench_rewrite.py [השהייה_בשניות]
+"""
+import json
+import sys
+import time
+
+from rag import _expand_query, _rewrite_query_single_call, _translate_query
+from stub_clients import StubAnthropic
+
+LATENCY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.4
+N_QUESTIONS = 5
+QUESTION = "מה הנפח של המאגר העליון והמאגר התחתון"
+
+
+def תשובת_stub(kwargs) -> str:
+    """תשובה קבועה לפי סוג הפרומפט: JSON משולב / שתי גרסאות / תרגום."""
+    פרומפט = kwargs["messages"][0]["content"]
+    if "Return ONLY a JSON object" in פרומפט:
+        return json.dumps({
+            "translation": "What is the volume of the upper and lower reservoirs",
+            "alternatives": ["upper reservoir volume mio m3", "upper reservoir storage capacity million cubic meters"],
+        })
+    if "alternative English search queries" in פרומפט:
+        return "upper reservoir volume mio m3\nupper reservoir storage capacity million cubic meters"
+    return "What is the volume of the upper and lower reservoirs"
+
+
+לקוח = StubAnthropic(reply=תשובת_stub, latency=LATENCY)
+
+# ── 1. המסלול הישן: תרגום ואז הרחבה (תלויה בתרגום) ───────────────────────────
+t0 = time.perf_counter()
+for _ in range(N_QUESTIONS):
+    שאלה_באנגלית = _translate_query(לקוח, QUESTION)
+    _expand_query(לקוח, שאלה_באנגלית)
+זמן_שני_שלבים = (time.perf_counter() - t0) / N_QUESTIONS
+
+# ── 2. קריאה משולבת אחת ─────────────────────────────────────────────────────
+t0 = time.perf_counter()
+for _ in range(N_QUESTIONS):
+    תוצאה = _rewrite_query_single_call(לקוח, QUESTION)
+זמן_משולב = (time.perf_counter() - t0) / N_QUESTIONS
+
+print(f"{'='*60}")
+print(f"השהייה מוזרקת לקריאה: {LATENCY:.2f}s | שאלות: {N_QUESTIONS}")
+print(f"תרגום + הרחבה (2 קריאות) : {זמן_שני_שלבים:.3f}s לשאלה")
+print(f"קריאה משולבת אחת         : {זמן_משולב:.3f}s לשאלה")
+print(f"נחסך עד תחילת החיפוש     : {זמן_שני_שלבים - זמן_משולב:.3f}s לשאלה")
+print(f"תוצאה לדוגמה: {תוצאה}")
+print(f"{'='*60}")
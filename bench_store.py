@@ -0,0 +1,53 @@
+"""
+מדידה: עלות פתיחת PersistentClient + get_or_create_collection בכל קריאה,
+לעומת ידית משותפת מ-store.get_store() (כפי שכל הפונקציות ב-rag.py עובדות היום).
+רץ על תיקייה זמנית עם אוסף סינתטי – לא נוגע ב-chroma_db האמיתי.
+הרץ: python bench_store.py [מספר_קריאות]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+import chromadb
+
+from store import RagStore
+
+N_CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+N_CHUNKS = 2000
+
+תיקייה = tempfile.mkdtemp(prefix="bench_store_")
+try:
+    # ── אוסף סינתטי עם וקטורים מוכנים (ללא מודל embedding) ──────────────────
+    אוסף = chromadb.PersistentClient(path=תיקייה).get_or_create_collection(name="pdf_collection")
+    for התחלה in range(0, N_CHUNKS, 500):
+        מזהים = [f"doc__p{i}__s{i}" for i in range(התחלה, התחלה + 500)]
+        אוסף.add(
+            ids=מזהים,
+            embeddings=[[float(i % 7), float(i % 11), 1.0] for i in range(התחלה, התחלה + 500)],
+            documents=[f"chunk {i}" for i in range(התחלה, התחלה + 500)],
+            metadatas=[{"source": f"doc{i % 20}.pdf", "page_number": i} for i in range(התחלה, התחלה + 500)],
+        )
+
+    # ── 1. פתיחה מחדש בכל קריאה (הדפוס הישן) ───────────────────────────────
+    t0 = time.perf_counter()
+    for _ in range(N_CALLS):
+        לקוח = chromadb.PersistentClient(path=תיקייה)
+        לקוח.get_or_create_collection(name="pdf_collection").count()
+    זמן_ישן = time.perf_counter() - t0
+
+    # ── 2. מאגר משותף – נפתח פעם אחת ───────────────────────────────────────
+    מאגר = RagStore(path=תיקייה)
+    t0 = time.perf_counter()
+    for _ in range(N_CALLS):
+        מאגר.collection.count()
+    זמן_חדש = time.perf_counter() - t0
+
+    print(f"{'='*60}")
+    print(f"קריאות: {N_CALLS} | chunks באוסף: {N_CHUNKS}")
+    print(f"פתיחה בכל קריאה : {זמן_ישן * 1000 / N_CALLS:8.3f} ms לקריאה")
+    print(f"מאגר משותף      : {זמן_חדש * 1000 / N_CALLS:8.3f} ms לקריאה")
+    print(f"עלות פתיחה שנחסכה: {(זמן_ישן - זמן_חדש) * 1000 / N_CALLS:8.3f} ms לקריאה")
+    print(f"{'='*60}")
+finally:
+    shutil.rmtree(תיקייה, ignore_errors=True)
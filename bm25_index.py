@@ -0,0 +1,517 @@
+"""
+אינדקס BM25 הפוך ושמור על הדיסק – מתוחזק לצד chroma_db.
+
+במקום לבנות BM25Okapi מחדש על כל ה-chunks בכל שאילתה, נשמרים ב-SQLite:
+  - bm25_postings: (מונח, מקור, doc, tf, אורך) – רשימות ההופעה, מחולקות לפי מקור:
+                   המפתח (term, source, doc) כך ששאילתה מסוננת קוראת רק את המקטעים
+                   של המסמכים שנבחרו, בלי JOIN ובלי לעבור על הופעות של מסמכים אחרים
+  - bm25_docs:     doc (מזהה שלם) ↔ chunk_id, שם המקור ואורך כל chunk
+  - bm25_terms:    df – מספר ה-chunks שמכילים כל מונח (בסיס ל-IDF)
+  - bm25_stats:    מספר ה-chunks ואורך כולל (בסיס ל-avgdl) + גרסת ה-analyzer שבנה את האינדקס
+                   + generation – עולה בסוף כל כתיבה לאוסף ולאינדקס (writing())
+  - bm25_writes:   כתיבות שבאמצע – בין collection.add/delete לעדכון התואם כאן הספירות שונות
+שאילתה קוראת רק את רשימות ההופעה של מונחי השאילתה – לא את כל הקורפוס.
+הטקסט עובר analyzer.analyze פעם אחת באינדוקס (המונחים נשמרים ב-postings), ואותו analyzer
+רץ על השאילתה.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+from analyzer import ANALYZER_VERSION, analyze
+
+INDEX_PATH = os.path.join("chroma_db", "rag_index.sqlite3")
+
+# מבנה הטבלאות – קובץ במבנה ישן (postings בלי source) נמחק ונבנה מחדש מהאוסף
+LAYOUT_VERSION = 2
+
+# כתיבה שלא הסתיימה זמן כזה – התהליך שכתב נפל; ensure_synced כבר לא ממתין לה
+WRITE_STALE_SECONDS = 600
+
+# פרמטרי BM25 – זהים לברירות המחדל של BM25Okapi
+K1 = 1.5
+B = 0.75
+
+
+def ranked_order(scores: np.ndarray, first_seen: np.ndarray, k: int | None = None) -> np.ndarray:
+    """
+    אינדקסים לפי ציון יורד, ובשוויון – לפי first_seen עולה (כמו sorted(..., reverse=True)
+    יציב על סדר ההכנסה). עם k: argpartition בוחר את המועמדים ורק הם ממוינים –
+    כולל כל מי שבשוויון עם הציון ה-k, כדי שהתוצאה תהיה זהה למיון המלא.
+    """
+    if k is not None and k < len(scores):
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        סף = np.partition(scores, len(scores) - k)[len(scores) - k]
+        מועמדים = np.flatnonzero(scores >= סף)
+    else:
+        מועמדים = np.arange(len(scores))
+    סדר = מועמדים[np.lexsort((first_seen[מועמדים], -scores[מועמדים]))]
+    return סדר[:k] if k is not None else סדר
+
+
+def accumulate_scores(
+    term_postings: list[tuple[np.ndarray, np.ndarray, int]],
+    top_k: int | None = None,
+    rank_of: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, dict[int, int]]:
+    """
+    סכום ציוני BM25 לכל chunk על פני מונחי שאילתה אחת, ודירוג top_k.
+    term_postings: לכל מונח (מזהי chunk שלמים, ציון המונח לכל אחד, מספר חזרות בשאילתה),
+    בסדר המונחים בשאילתה. מחזיר (מזהים, ציונים) ממוינים – זהה לצבירה ב-dict ומיון יציב –
+    ו-{מזהה: דרגה בדירוג המלא} למזהים ב-rank_of שיש להם ציון (בלי למיין את כולם).
+    """
+    if not term_postings:
+        return np.empty(0, dtype=np.int64), np.empty(0), {}
+    מזהים = np.concatenate([ids for ids, _, _ in term_postings])
+    תרומות = np.concatenate([חזרות * ציונים for _, ציונים, חזרות in term_postings])
+    # ייחודיים + מיקום ההופעה הראשונה (= סדר ההכנסה ל-dict) + מיפוי לסכימה
+    ייחודיים, ראשון, הפוך = np.unique(מזהים, return_index=True, return_inverse=True)
+    # bincount סוכם לפי סדר המערך – אותו סדר חיבור כמו הלולאה על המונחים
+    סכומים = np.bincount(הפוך, weights=תרומות, minlength=len(ייחודיים))
+    סדר = ranked_order(סכומים, ראשון, top_k)
+
+    דרגות: dict[int, int] = {}
+    if rank_of is not None and len(rank_of) and len(ייחודיים):
+        מיקומים = np.searchsorted(ייחודיים, rank_of)
+        קיימים = (מיקומים < len(ייחודיים)) & (ייחודיים[np.minimum(מיקומים, len(ייחודיים) - 1)] == rank_of)
+        for מזהה, i in zip(rank_of[קיימים], מיקומים[קיימים]):
+            # דרגה = כמה עוקפים אותו: ציון גבוה יותר, או שווה והוכנס קודם
+            דרגות[int(מזהה)] = int(
+                np.count_nonzero(סכומים > סכומים[i])
+                + np.count_nonzero((סכומים == סכומים[i]) & (ראשון < ראשון[i]))
+            )
+    return ייחודיים[סדר], סכומים[סדר], דרגות
+
+
+class BM25Index:
+    """
+    אינדקס BM25 הפוך על SQLite.
+    חיבור יחיד מוגן במנעול – בטוח לשימוש מכמה threads (Streamlit).
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._verified_generation: int | None = None  # generation שבו הספירות נבדקו ותאמו
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        חדש = not self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bm25_stats'"
+        ).fetchone()
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS bm25_stats (
+                key   TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO bm25_stats VALUES
+                ('n_docs', 0), ('total_length', 0), ('analyzer_version', 0),
+                ('layout_version', 0), ('generation', 0);
+
+            CREATE TABLE IF NOT EXISTS bm25_writes (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL
+            );
+            """
+        )
+        if self._stat("layout_version") != LAYOUT_VERSION:
+            # מבנה ישן: מוחקים את הטבלאות; ensure_synced יבנה אותן מחדש מהאוסף
+            self._conn.executescript(
+                """
+                DROP TABLE IF EXISTS bm25_docs;
+                DROP TABLE IF EXISTS bm25_postings;
+                DROP TABLE IF EXISTS bm25_terms;
+                UPDATE bm25_stats SET value = 0;
+                """
+            )
+            self._conn.execute(
+                "UPDATE bm25_stats SET value = ? WHERE key = 'layout_version'", (LAYOUT_VERSION,)
+            )
+        if חדש:
+            # קובץ חדש הוא אינדקס ריק – תואם ל-analyzer הנוכחי, כמו אחרי clear()
+            self._conn.execute(
+                "UPDATE bm25_stats SET value = ? WHERE key = 'analyzer_version'",
+                (ANALYZER_VERSION,),
+            )
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS bm25_docs (
+                doc      INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                source   TEXT NOT NULL,
+                length   INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bm25_docs_source ON bm25_docs(source);
+
+            CREATE TABLE IF NOT EXISTS bm25_postings (
+                term   TEXT NOT NULL,
+                source TEXT NOT NULL,
+                doc    INTEGER NOT NULL,
+                tf     INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (term, source, doc)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS bm25_postings_doc ON bm25_postings(doc);
+
+            CREATE TABLE IF NOT EXISTS bm25_terms (
+                term TEXT PRIMARY KEY,
+                df   INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # עדכון האינדקס
+    # ------------------------------------------------------------------
+
+    def add_chunks(self, chunks: list[tuple[str, str, str]]) -> None:
+        """
+        מוסיף chunks לאינדקס. כל פריט: (chunk_id, source, text).
+        chunk_id שכבר קיים מוחלף (מחיקה + הוספה) כדי ש-df יישאר עקבי.
+        """
+        if not chunks:
+            return
+        with self._lock, self._conn:
+            self._delete_docs(list(self._doc_ids({c[0] for c in chunks}).values()))
+
+            doc_הבא = self._conn.execute("SELECT COALESCE(MAX(doc), 0) + 1 FROM bm25_docs").fetchone()[0]
+            שורות_מסמכים = []
+            שורות_הופעות = []
+            df_חדש: Counter = Counter()
+            אורך_כולל = 0
+            for doc, (מזהה, מקור, טקסט) in enumerate(chunks, start=doc_הבא):
+                טוקנים = analyze(טקסט)
+                תדירויות = Counter(טוקנים)
+                שורות_מסמכים.append((doc, מזהה, מקור, len(טוקנים)))
+                שורות_הופעות.extend(
+                    (מונח, מקור, doc, tf, len(טוקנים)) for מונח, tf in תדירויות.items()
+                )
+                df_חדש.update(תדירויות.keys())
+                אורך_כולל += len(טוקנים)
+
+            self._conn.executemany("INSERT INTO bm25_docs VALUES (?, ?, ?, ?)", שורות_מסמכים)
+            self._conn.executemany("INSERT INTO bm25_postings VALUES (?, ?, ?, ?, ?)", שורות_הופעות)
+            self._conn.executemany(
+                "INSERT INTO bm25_terms VALUES (?, ?) "
+                "ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                df_חדש.items(),
+            )
+            self._bump_stats(len(שורות_מסמכים), אורך_כולל)
+
+    def delete_source(self, source_name: str) -> int:
+        """מוחק את כל ה-chunks של מקור מהאינדקס. מחזיר כמה נמחקו."""
+        with self._lock, self._conn:
+            docs = [
+                r[0] for r in self._conn.execute(
+                    "SELECT doc FROM bm25_docs WHERE source = ?", (source_name,)
+                )
+            ]
+            self._delete_docs(docs)
+        return len(docs)
+
+    def delete_chunks(self, chunk_ids: list[str]) -> int:
+        """מוחק chunks לפי מזהה (אינדוקס חוזר של עמודים שהשתנו). מחזיר כמה נמחקו."""
+        with self._lock, self._conn:
+            docs = list(self._doc_ids(set(chunk_ids)).values())
+            self._delete_docs(docs)
+        return len(docs)
+
+    def existing_chunks(self, chunk_ids: list[str]) -> set[str]:
+        """אילו מה-chunks שצוינו נמצאים באינדקס."""
+        with self._lock:
+            return set(self._doc_ids(set(chunk_ids)))
+
+    def clear(self) -> None:
+        """מרוקן את האינדקס (למשל אחרי clear_chroma_db)."""
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                DELETE FROM bm25_docs;
+                DELETE FROM bm25_postings;
+                DELETE FROM bm25_terms;
+                UPDATE bm25_stats SET value = 0 WHERE key IN ('n_docs', 'total_length');
+                """
+            )
+            # אינדקס ריק תואם לכל analyzer – מסומן בגרסה הנוכחית
+            self._conn.execute(
+                "UPDATE bm25_stats SET value = ? WHERE key = 'analyzer_version'",
+                (ANALYZER_VERSION,),
+            )
+
+    @contextmanager
+    def writing(self):
+        """
+        עוטף כתיבה לאוסף + לאינדקס (add / delete). בזמן הכתיבה הספירות שונות זו מזו באופן
+        זמני, ו-ensure_synced לא בונה מחדש; בסוף generation עולה – גם אם הכתיבה נכשלה,
+        כדי שהשאילתה הבאה תבדוק את הספירות שוב.
+        """
+        with self._lock, self._conn:
+            מזהה = self._conn.execute(
+                "INSERT INTO bm25_writes (started_at) VALUES (?)", (time.time(),)
+            ).lastrowid
+        try:
+            yield
+        finally:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM bm25_writes WHERE id = ?", (מזהה,))
+                self._conn.execute(
+                    "UPDATE bm25_stats SET value = value + 1 WHERE key = 'generation'"
+                )
+
+    def ensure_synced(self, collection, batch_size: int = 2000) -> None:
+        """
+        בונה את האינדקס מחדש מתוך האוסף אם מספר ה-chunks לא תואם –
+        למשל chroma_db שנבנה לפני שהאינדקס היה קיים, או כתיבה שנקטעה באמצע.
+        נקרא בכל שאילתה, ולכן זול:
+        - generation לא השתנה מאז הבדיקה האחרונה שעברה → אין מה לבדוק (בלי ספירת האוסף)
+        - כתיבה באמצע (writing(), גם מתהליך אחר) → הפער זמני, לא בונים מחדש
+        בנייה מחדש אחת בכל פעם (מנעול); מי שחיכה לה בודק שוב לפני שהוא בונה בעצמו.
+        גם אינדקס שנבנה ב-analyzer בגרסה אחרת נבנה מחדש – אחרת מונחי השאילתה לא יתאימו.
+        """
+        with self._lock, self._conn:
+            # כתיבות של תהליך שנפל – לא ממתינים להן יותר, והספירות ייבדקו מחדש
+            if self._conn.execute(
+                "DELETE FROM bm25_writes WHERE started_at < ?",
+                (time.time() - WRITE_STALE_SECONDS,),
+            ).rowcount:
+                self._conn.execute(
+                    "UPDATE bm25_stats SET value = value + 1 WHERE key = 'generation'"
+                )
+            גרסה = self._stat("analyzer_version")
+            דור = self._stat("generation")
+            כותבים = self._conn.execute("SELECT COUNT(*) FROM bm25_writes").fetchone()[0]
+        if גרסה == ANALYZER_VERSION:
+            if דור == self._verified_generation or כותבים:
+                return
+            if collection.count() == self.count():
+                self._verified_generation = דור
+                return
+
+        with self._rebuild_lock:
+            with self._lock:
+                גרסה = self._stat("analyzer_version")
+                כותבים = self._conn.execute("SELECT COUNT(*) FROM bm25_writes").fetchone()[0]
+            if גרסה == ANALYZER_VERSION and (כותבים or collection.count() == self.count()):
+                return  # thread אחר בנה מחדש בזמן שחיכינו, או שכתיבה התחילה בינתיים
+            t0 = time.perf_counter()
+            with self.writing():
+                self.clear()
+                היסט = 0
+                while True:
+                    אצווה = collection.get(
+                        include=["documents", "metadatas"], limit=batch_size, offset=היסט
+                    )
+                    if not אצווה["ids"]:
+                        break
+                    self.add_chunks([
+                        (מזהה, מטא["source"], טקסט)
+                        for מזהה, טקסט, מטא in zip(
+                            אצווה["ids"], אצווה["documents"], אצווה["metadatas"]
+                        )
+                    ])
+                    היסט += len(אצווה["ids"])
+            print(f"[CHECK] BM25 rebuilt: {self.count()} chunks in {time.perf_counter() - t0:.1f}s")
+
+    # ------------------------------------------------------------------
+    # שאילתות
+    # ------------------------------------------------------------------
+
+    def count(self, sources: list[str] | None = None) -> int:
+        """מספר ה-chunks באינדקס – כולם, או רק של המקורות שצוינו."""
+        with self._lock:
+            if sources is None:
+                return self._stat("n_docs")
+            סימנים = ",".join("?" * len(sources))
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM bm25_docs WHERE source IN ({סימנים})", sources
+            ).fetchone()[0]
+
+    def search(
+        self,
+        query: str,
+        sources: list[str] | None = None,
+        top_k: int | None = None,
+    ) -> list[tuple[str, float]]:
+        """
+        מחזיר [(chunk_id, score)] ממוין בסדר יורד – רק chunks עם ציון חיובי.
+        sources: None = כל המסמכים | list[str] = רק chunks של המקורות האלה.
+        IDF בגרסת Lucene (log(1 + (N-df+0.5)/(df+0.5))) – תמיד חיובי,
+        ולא דורש ממוצע IDF על כל אוצר המילים כמו ב-BM25Okapi.
+        """
+        return self.search_many([query], sources=sources, top_k=top_k)[0]
+
+    def search_many(
+        self,
+        queries: list[str],
+        sources: list[str] | None = None,
+        top_k: int | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        """
+        כמו search, לכמה שאילתות במעבר אחד: רשימת ההופעות של כל מונח נקראת פעם אחת
+        גם אם הוא מופיע בכמה שאילתות. מחזיר דירוג נפרד לכל שאילתה, באותו סדר.
+        """
+        return [דירוג for דירוג, _ in self.rank_many(queries, sources=sources, top_k=top_k)]
+
+    def rank_many(
+        self,
+        queries: list[str],
+        sources: list[str] | None = None,
+        top_k: int | None = None,
+        extra_ids: list[list[str]] | None = None,
+    ) -> list[tuple[list[tuple[str, float]], dict[str, int]]]:
+        """
+        כמו search_many, ולכל שאילתה גם {chunk_id: דרגה} – המיקום בדירוג ה-BM25 המלא
+        של ה-chunks ב-extra_ids[i] (למשל תוצאות החיפוש הסמנטי), גם אם הם מחוץ ל-top_k.
+        chunk בלי ציון BM25 (או מחוץ לסינון) לא מופיע במילון.
+        """
+        extra_ids = extra_ids or [[] for _ in queries]
+        מונחי_שאילתות = [Counter(analyze(q)) for q in queries]
+        כל_המונחים = set().union(*מונחי_שאילתות) if מונחי_שאילתות else set()
+        if not כל_המונחים:
+            return [([], {}) for _ in queries]
+
+        סינון = ""
+        פרמטרי_סינון: list = []
+        if sources is not None:
+            # מקטע ה-postings של כל מקור נקרא ישירות מהמפתח (term, source, doc)
+            סינון = f" AND source IN ({','.join('?' * len(sources))})"
+            פרמטרי_סינון = list(sources)
+
+        # ציון BM25 של כל מונח לכל chunk שמכיל אותו – מחושב פעם אחת לכל מונח,
+        # כמערכים: doc (מזהה שלם של ה-chunk) + ציון
+        ציוני_מונח: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        with self._lock:
+            N = self._stat("n_docs")
+            if N == 0:
+                return [([], {}) for _ in queries]
+            avgdl = self._stat("total_length") / N
+
+            for מונח in כל_המונחים:
+                שורה = self._conn.execute(
+                    "SELECT df FROM bm25_terms WHERE term = ?", (מונח,)
+                ).fetchone()
+                if not שורה or שורה[0] <= 0:
+                    continue
+                df = שורה[0]
+                idf = math.log(1.0 + (N - df + 0.5) / (df + 0.5))
+
+                הופעות = np.array(
+                    self._conn.execute(
+                        f"SELECT doc, tf, length FROM bm25_postings WHERE term = ?{סינון}",
+                        [מונח, *פרמטרי_סינון],
+                    ).fetchall(),
+                    dtype=np.int64,
+                ).reshape(-1, 3)
+                tf = הופעות[:, 1].astype(np.float64)
+                אורך = הופעות[:, 2].astype(np.float64)
+                ציוני_מונח[מונח] = (
+                    הופעות[:, 0],
+                    idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * אורך / avgdl)),
+                )
+
+            # doc של ה-chunks הנוספים (לחישוב הדרגה שלהם)
+            doc_לפי_מזהה = self._doc_ids({מזהה for רשימה in extra_ids for מזהה in רשימה})
+
+            דירוגים = []
+            for מונחים, נוספים in zip(מונחי_שאילתות, extra_ids):
+                מזהים, ציונים, דרגות = accumulate_scores(
+                    [(*ציוני_מונח[מונח], חזרות) for מונח, חזרות in מונחים.items() if מונח in ציוני_מונח],
+                    top_k,
+                    rank_of=np.array(
+                        [doc_לפי_מזהה[m] for m in נוספים if m in doc_לפי_מזהה], dtype=np.int64
+                    ),
+                )
+                דירוגים.append((מזהים, ציונים, דרגות))
+
+            # המרת doc -> chunk_id רק לתוצאות שנבחרו
+            מזהה_לפי_doc = {שורה: מזהה for מזהה, שורה in doc_לפי_מזהה.items()}
+            מזהה_לפי_doc.update(self._chunk_ids(
+                {int(r) for מזהים, _, _ in דירוגים for r in מזהים} - set(מזהה_לפי_doc)
+            ))
+
+        return [
+            (
+                [(מזהה_לפי_doc[int(r)], float(ציון)) for r, ציון in zip(מזהים, ציונים)],
+                {מזהה_לפי_doc[int(r)]: int(דרגה) for r, דרגה in דרגות.items()},
+            )
+            for מזהים, ציונים, דרגות in דירוגים
+        ]
+
+    # ------------------------------------------------------------------
+    # עזרים פנימיים – נקראים כשהמנעול כבר תפוס
+    # ------------------------------------------------------------------
+
+    def _doc_ids(self, chunk_ids: set[str]) -> dict[str, int]:
+        """{chunk_id: doc} – chunks שלא באינדקס לא מופיעים."""
+        מזהים = list(chunk_ids)
+        תוצאה: dict[str, int] = {}
+        for התחלה in range(0, len(מזהים), 500):
+            קבוצה = מזהים[התחלה:התחלה + 500]
+            תוצאה.update(self._conn.execute(
+                f"SELECT chunk_id, doc FROM bm25_docs WHERE chunk_id IN ({','.join('?' * len(קבוצה))})",
+                קבוצה,
+            ))
+        return תוצאה
+
+    def _chunk_ids(self, docs: set[int]) -> dict[int, str]:
+        """{doc: chunk_id} – ההמרה ההפוכה, רק לתוצאות שנבחרו."""
+        רשימה = list(docs)
+        תוצאה: dict[int, str] = {}
+        for התחלה in range(0, len(רשימה), 500):
+            קבוצה = רשימה[התחלה:התחלה + 500]
+            תוצאה.update(self._conn.execute(
+                f"SELECT doc, chunk_id FROM bm25_docs WHERE doc IN ({','.join('?' * len(קבוצה))})",
+                קבוצה,
+            ))
+        return תוצאה
+
+    def _stat(self, key: str) -> int:
+        return self._conn.execute(
+            "SELECT value FROM bm25_stats WHERE key = ?", (key,)
+        ).fetchone()[0]
+
+    def _bump_stats(self, n_docs: int, total_length: int) -> None:
+        self._conn.executemany(
+            "UPDATE bm25_stats SET value = value + ? WHERE key = ?",
+            [(n_docs, "n_docs"), (total_length, "total_length")],
+        )
+
+    def _delete_docs(self, docs: list[int]) -> None:
+        """מוחק chunks קיימים (לפי doc) ומעדכן df + סטטיסטיקות."""
+        for התחלה in range(0, len(docs), 500):
+            קבוצה = docs[התחלה:התחלה + 500]
+            סימנים = ",".join("?" * len(קבוצה))
+            n, אורך = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM bm25_docs "
+                f"WHERE doc IN ({סימנים})",
+                קבוצה,
+            ).fetchone()
+            if not n:
+                continue
+            ירידות_df = self._conn.execute(
+                f"SELECT term, COUNT(*) FROM bm25_postings WHERE doc IN ({סימנים}) "
+                "GROUP BY term",
+                קבוצה,
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE bm25_terms SET df = df - ? WHERE term = ?",
+                [(ספירה, מונח) for מונח, ספירה in ירידות_df],
+            )
+            self._conn.executemany(
+                "DELETE FROM bm25_terms WHERE term = ? AND df <= 0",
+                [(מונח,) for מונח, _ in ירידות_df],
+            )
+            self._conn.execute(f"DELETE FROM bm25_postings WHERE doc IN ({סימנים})", קבוצה)
+            self._conn.execute(f"DELETE FROM bm25_docs WHERE doc IN ({סימנים})", קבוצה)
+            self._bump_stats(-n, -אורך)
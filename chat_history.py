@@ -0,0 +1,136 @@
+"""
+היסטוריית שיחה חסומה: N הסבבים האחרונים נשלחים כלשונם, וכל מה שלפניהם מקופל
+לסיכום מצטבר קצר. הקיפול רץ ב-thread ברקע אחרי כל סבב – פעם אחת לכל סבב שיוצא
+מהחלון, ולא בדרך של השאלה הבאה: אם הוא עוד לא הסתיים (או נכשל), הסבבים שיצאו מהחלון
+מצורפים כלשונם לבלוק הסיכום – לעולם לא יותר מ-N סבבים כהודעות, ושום סבב לא הולך לאיבוד.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import anthropic
+
+from rag import estimate_tokens, log_usage
+
+HISTORY_MODEL = "claude-haiku-4-5-20251001"
+HISTORY_KEEP_TURNS = int(os.environ.get("RAG_HISTORY_TURNS", 4))
+SUMMARY_MAX_TOKENS = 400
+
+
+def _as_text(turns: list[tuple[str, str]]) -> str:
+    """סבבים כטקסט Q/A – לבקשת הקיפול ולסבבים שממתינים לו."""
+    return "\n\n".join(f"Q: {ש}\nA: {ת}" for ש, ת in turns)
+
+
+# pool משותף לכל ה-sessions – קיפול הוא קריאת LLM קצרה אחת
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history")
+
+
+class ChatHistory:
+    """
+    סבבי (שאלה, תשובה) של שיחה אחת + סיכום מצטבר של הסבבים הישנים.
+    turns: כל הסבבים (לתצוגה) | summary: סיכום הסבבים turns[:summarized]
+    snapshot(): מה שנשלח בפועל לבקשה הבאה – (summary, הסבבים שלא סוכמו).
+    """
+
+    def __init__(self, keep_turns: int = HISTORY_KEEP_TURNS, client=None):
+        self.keep_turns = keep_turns
+        self.turns: list[tuple[str, str]] = []
+        self.summary = ""
+        self.summarized = 0
+        self._generation = 0  # גדל ב-clear() – סיכום של שיחה שנוקתה לא ייכתב
+        self._client = client
+        self._lock = threading.Lock()       # turns / summary / summarized
+        self._fold_lock = threading.Lock()  # קיפול אחד בכל פעם לכל שיחה
+        self._pending: Future | None = None  # הקיפול האחרון שתוזמן
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(list(self.turns))
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """מוסיף סבב, ומתזמן ברקע קיפול של סבבים שיצאו מחלון ה-N האחרונים."""
+        with self._lock:
+            self.turns.append((question, answer))
+            לקפל = len(self.turns) - self.keep_turns > self.summarized
+        if לקפל:
+            self._pending = _executor.submit(self._fold)
+
+    def flush(self, timeout: float | None = None) -> None:
+        """ממתין לקיפול שתוזמן אחרון (לבדיקות ולסגירה מסודרת)."""
+        קיפול = self._pending
+        if קיפול is not None:
+            קיפול.result(timeout)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+            self.summarized = 0
+            self._generation += 1
+
+    def snapshot(self) -> tuple[str, list[tuple[str, str]]]:
+        """
+        (סיכום, עד keep_turns סבבים אחרונים כלשונם) – לא מחכה לקיפול שעדיין רץ.
+        סבבים שיצאו מהחלון ועוד לא קופלו מצורפים לסיכום כ-Q/A.
+        """
+        with self._lock:
+            התחלה = max(self.summarized, len(self.turns) - self.keep_turns)
+            ממתינים = self.turns[self.summarized:התחלה]
+            חלקים = [self.summary, _as_text(ממתינים)]
+            return "\n\n".join(ח for ח in חלקים if ח), list(self.turns[התחלה:])
+
+    def token_count(self) -> int:
+        """הערכת הטוקנים שההיסטוריה מוסיפה לבקשה הבאה (סיכום + סבבים כלשונם)."""
+        סיכום, סבבים = self.snapshot()
+        return estimate_tokens(סיכום) + sum(
+            estimate_tokens(ש) + estimate_tokens(ת) for ש, ת in סבבים
+        )
+
+    def _fold(self) -> None:
+        """מקפל לסיכום את כל הסבבים שמחוץ לחלון ושטרם סוכמו – קריאת LLM אחת."""
+        with self._fold_lock:
+            with self._lock:
+                סוף = len(self.turns) - self.keep_turns
+                if סוף <= self.summarized:
+                    return
+                סיכום_קודם = self.summary
+                לקיפול = self.turns[self.summarized:סוף]
+                דור = self._generation
+
+            try:
+                סיכום_חדש = self._summarize(סיכום_קודם, לקיפול)
+            except Exception as e:
+                # בלי סיכום הסבבים פשוט נשארים כלשונם – ננסה שוב בסבב הבא
+                print(f"  ⚠️ קיפול היסטוריה נכשל: {e}")
+                return
+
+            with self._lock:
+                if self._generation != דור:
+                    return
+                self.summary = סיכום_חדש
+                self.summarized = סוף
+
+    def _summarize(self, previous: str, turns: list[tuple[str, str]]) -> str:
+        לקוח = self._client or anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        סבבים = _as_text(turns)
+        תגובה = לקוח.messages.create(
+            model=HISTORY_MODEL,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            messages=[{
+                "role": "user",
+                "content": (
+                    "Update the running summary of a conversation about engineering documents.\n"
+                    "Keep every fact, number with its unit, document filename and page number "
+                    "that the answers stated, and what the user was asking about. "
+                    "Drop greetings and repetition. Write in the language of the conversation, "
+                    "at most 200 words. Return ONLY the updated summary.\n\n"
+                    f"Current summary:\n{previous or '(empty)'}\n\n"
+                    f"New turns to fold in:\n{סבבים}"
+                ),
+            }],
+        )
+        log_usage("history", HISTORY_MODEL, תגובה.usage)
+        return תגובה.content[0].text.strip()
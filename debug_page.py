@@ -7,12 +7,12 @@ debug_page.py – אבחון עמוד ספציפי:
 """
 import os
 import pdfplumber
-import chromadb
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from rag import _page_to_text, _extract_section_header
+from store import get_store
 
 # ── הגדרות ──────────────────────────────────────────────────────────────────
 PAGE_NUMBER = 10        # עמוד לבדיקה (1-based)
@@ -79,8 +79,7 @@ print("═"*65)
 print(f"🔍 2. חיפוש ישיר ב-ChromaDB עבור: '{SEARCH_STR}'")
 print("═"*65)
 
-לקוח_chroma = chromadb.PersistentClient(path="chroma_db")
-אוסף = לקוח_chroma.get_or_create_collection(name="pdf_collection")
+אוסף = get_store().collection
 
 תוצאות_חיפוש = אוסף.get(
     where_document={"$contains": SEARCH_STR},
@@ -0,0 +1,150 @@
+"""
+מטמון מפתח-ערך על הדיסק (SQLite) עם תקרת גודל, פינוי LRU ותוקף (TTL) אופציונלי.
+משמש לשמירת תוצאות LLM יקרות בין הרצות – למשל משפטי Contextual Retrieval לעמוד,
+או תרגום + הרחבת שאילתה.
+המפתח הוא hash של התוכן (content-addressed) – אותו קלט = אותה רשומה, ללא קשר למקור.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = "cache"
+
+
+def content_key(*parts) -> str:
+    """sha256 על חלקי המפתח (טקסט, גרסת prompt, מודל...) – מופרדים ב-\\0 למניעת התנגשויות."""
+    h = hashlib.sha256()
+    for חלק in parts:
+        h.update(str(חלק).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    מטמון SQLite: get/set של ערכי JSON לפי מפתח.
+    max_entries: מעבר לתקרה נמחקות הרשומות שלא נקראו הכי הרבה זמן (LRU).
+    ttl: תוקף בשניות מרגע הכתיבה (None = ללא תפוגה); רשומה שפגה נחשבת miss ונמחקת.
+    hits / misses: מונים לתהליך הנוכחי.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 50_000,
+        directory: str = CACHE_DIR,
+        ttl: float | None = None,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key         TEXT PRIMARY KEY,
+                value       TEXT NOT NULL,
+                accessed_at REAL NOT NULL,
+                created_at  REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed_at);
+            """
+        )
+        # קובץ מטמון מגרסה קודמת – ללא עמודת created_at
+        עמודות = {r[1] for r in self._conn.execute("PRAGMA table_info(cache)")}
+        if "created_at" not in עמודות:
+            self._conn.execute("ALTER TABLE cache ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key: str, default=None):
+        """מחזיר את הערך השמור (ומעדכן זמן גישה), או default אם אינו קיים."""
+        עכשיו = time.time()
+        with self._lock, self._conn:
+            שורה = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if שורה is not None and self.ttl is not None and עכשיו - שורה[1] > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._size -= 1
+                שורה = None
+            if שורה is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (עכשיו, key)
+            )
+            return json.loads(שורה[0])
+
+    def get_many(self, keys: list[str]) -> dict:
+        """כמו get לכמה מפתחות בבת אחת – מחזיר {מפתח: ערך} רק למפתחות שנמצאו."""
+        עכשיו = time.time()
+        נמצאו: dict = {}
+        פגו: list[str] = []
+        with self._lock, self._conn:
+            for i in range(0, len(keys), 500):
+                קבוצה = keys[i:i + 500]
+                סימנים = ",".join("?" * len(קבוצה))
+                for מפתח, ערך, נוצר in self._conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({סימנים})", קבוצה
+                ):
+                    if self.ttl is not None and עכשיו - נוצר > self.ttl:
+                        פגו.append(מפתח)
+                    else:
+                        נמצאו[מפתח] = json.loads(ערך)
+            if פגו:
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in פגו])
+                self._size -= len(פגו)
+            self._conn.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", [(עכשיו, k) for k in נמצאו]
+            )
+        self.hits += sum(1 for k in keys if k in נמצאו)
+        self.misses += sum(1 for k in keys if k not in נמצאו)
+        return נמצאו
+
+    def set(self, key: str, value) -> None:
+        """שומר ערך (כל אובייקט JSON) ומפנה רשומות ישנות אם עברנו את התקרה."""
+        self.set_many([(key, value)])
+
+    def set_many(self, items: list[tuple[str, object]]) -> None:
+        """שומר כמה ערכים בטרנזקציה אחת."""
+        if not items:
+            return
+        with self._lock, self._conn:
+            עכשיו = time.time()
+            for key, value in items:
+                קיים = self._conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, accessed_at, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), עכשיו, עכשיו),
+                )
+                if not קיים:
+                    self._size += 1
+            if self._size > self.max_entries:
+                # מפנה 10% מעבר לתקרה בבת אחת – לא בכל הכנסה
+                עודף = self._size - self.max_entries + max(1, self.max_entries // 10)
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (עודף,),
+                )
+                self._size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> dict:
+        """מונים לדיווח: hits, misses, hit_rate, entries."""
+        סה_כ = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / סה_כ if סה_כ else 0.0,
+            "entries": self._size,
+        }
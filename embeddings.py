@@ -0,0 +1,144 @@
+"""
+שכבת embedding מפורשת: המודל המקומי (CPU) מחושב כאן, והווקטורים מועברים ל-ChromaDB
+ישירות (add(embeddings=...) / query(query_embeddings=...)) – במקום ה-embedding function
+המובלע של האוסף.
+- RAG_EMBEDDING_MODEL   – ברירת מחדל all-MiniLM-L6-v2 (ONNX של chroma – אותם וקטורים כמו
+                          באוספים קיימים). שם אחר נטען דרך sentence-transformers (אופציונלי)
+- RAG_EMBEDDING_BATCH   – גודל אצווה למודל
+- RAG_EMBEDDING_THREADS – threads למודל sentence-transformers (0 = ברירת המחדל של torch);
+                          מודל ה-ONNX של chroma רץ עם ברירת המחדל של onnxruntime
+כל וקטור נשמר במטמון על הדיסק לפי (מודל, hash של הטקסט) – chunk שלא השתנה ושאילתה
+שחוזרת לא עוברים שוב במודל.
+"""
+import base64
+import os
+import threading
+
+import numpy as np
+
+from disk_cache import DiskCache, content_key
+
+# sentence-transformers אופציונלי – נדרש רק למודל שאינו ברירת המחדל
+try:
+    from sentence_transformers import SentenceTransformer as _SentenceTransformer
+    _ST_AVAILABLE = True
+except ImportError:
+    _ST_AVAILABLE = False
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_MODEL = os.environ.get("RAG_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("RAG_EMBEDDING_BATCH", 64))
+EMBEDDING_THREADS = int(os.environ.get("RAG_EMBEDDING_THREADS", 0))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_EMBEDDING_CACHE_MAX_ENTRIES", 500_000))
+
+
+def _onnx_minilm():
+    """ה-ONNXMiniLM_L6_V2 של chroma (הממשק הציבורי בלבד) – מוריד את המודל בקריאה הראשונה."""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    return ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+
+
+class Embedder:
+    """
+    embed(texts) → מערך float32 בצורה (len(texts), dim), מנורמל.
+    רק טקסטים שאינם במטמון עוברים במודל, באצוות של batch_size.
+    המודל נטען בעצלות בקריאה הראשונה שבאמת צריכה אותו.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        threads: int = EMBEDDING_THREADS,
+        cache: DiskCache | None = None,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+        self._cache = cache
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> DiskCache:
+        if self._cache is None:
+            self._cache = DiskCache("embeddings", max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+        return self._cache
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                if self.model_name == DEFAULT_EMBEDDING_MODEL:
+                    self._model = _onnx_minilm()
+                elif _ST_AVAILABLE:
+                    if self.threads:
+                        import torch
+                        torch.set_num_threads(self.threads)
+                    self._model = _SentenceTransformer(self.model_name, device="cpu")
+                else:
+                    raise RuntimeError(
+                        f"RAG_EMBEDDING_MODEL={self.model_name} דורש sentence-transformers "
+                        "(pip install sentence-transformers)"
+                    )
+            return self._model
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        """הרצת המודל – בלי מטמון."""
+        מודל = self._load()
+        if self.model_name == DEFAULT_EMBEDDING_MODEL:
+            # האצוות כאן – ה-embedding function מקבל רשימה ומחזיר וקטור מנורמל לכל טקסט
+            return np.asarray(
+                [
+                    וקטור
+                    for i in range(0, len(texts), self.batch_size)
+                    for וקטור in מודל(texts[i:i + self.batch_size])
+                ],
+                dtype=np.float32,
+            )
+        return np.asarray(
+            מודל.encode(texts, batch_size=self.batch_size, normalize_embeddings=True),
+            dtype=np.float32,
+        )
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        מפתחות = [content_key(self.model_name, טקסט) for טקסט in texts]
+        שמורים = self.cache.get_many(מפתחות)
+
+        # טקסט שחוזר באותה קריאה (chunks זהים, שאילתות כפולות) מחושב פעם אחת
+        חסרים: dict[str, str] = {}
+        for מפתח, טקסט in zip(מפתחות, texts):
+            if מפתח not in שמורים:
+                חסרים.setdefault(מפתח, טקסט)
+
+        וקטורים = {מפתח: _decode(ערך) for מפתח, ערך in שמורים.items()}
+        if חסרים:
+            חדשים = self._encode(list(חסרים.values()))
+            for מפתח, וקטור in zip(חסרים, חדשים):
+                וקטורים[מפתח] = וקטור
+            self.cache.set_many([(מפתח, _encode_b64(וקטור)) for מפתח, וקטור in zip(חסרים, חדשים)])
+        return np.stack([וקטורים[מפתח] for מפתח in מפתחות])
+
+
+def _encode_b64(vector: np.ndarray) -> str:
+    """float32 גולמי ב-base64 – קומפקטי פי ~4 מרשימת JSON של מספרים."""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode(value: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+
+
+_embedder: Embedder | None = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    """ה-Embedder המשותף לתהליך – המודל נטען פעם אחת."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = Embedder()
+        return _embedder
@@ -0,0 +1,290 @@
+"""
+תור עבודות אינדוקס ברקע: "טען לתוך המערכת" ו"סרוק ואנדקס" רק מוסיפים עבודה לטבלה,
+ו-worker ברקע מריץ את process_large_pdf ומעדכן התקדמות לכל עבודה.
+- הטבלה index_jobs נשמרת באותו קובץ SQLite של האינדקסים – שורדת rerun, רענון לשונית
+  והפעלה מחדש של השרת (עבודה שנקטעה חוזרת לתור וממשיכה מהעמוד שלא נשמר)
+- worker יחיד לתהליך (RAG_INDEX_JOBS קבצים במקביל) – כל הכתיבה ל-ChromaDB עוברת דרכו,
+  כך ששני מנהלים שמאנדקסים יחד לא מתחרים על אותם קבצים
+- הסרגל בצד קורא את הטבלה (poll) במקום progress_callback בתוך הריצה
+- העלאה נכתבת לקובץ זמני (staged_path) ומחליפה את pdfs/<name> רק כשעבודה לוקחת אותה,
+  ועבודה למקור לא נלקחת בזמן שעבודה אחרת לאותו מקור רצה – הקובץ לא מוחלף באמצע אינדוקס
+"""
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from bm25_index import INDEX_PATH
+
+INDEX_JOB_CONCURRENCY = int(os.environ.get("RAG_INDEX_JOBS", 1))
+JOB_STALE_SECONDS = 120  # עבודה "running" בלי heartbeat זמן כזה – ה-worker שלה מת
+_HEARTBEAT_SECONDS = 15
+_POLL_SECONDS = 1.0
+
+
+class JobQueue:
+    """
+    טבלת index_jobs ב-SQLite: status = queued → running → done | failed.
+    כל שינוי מצב הוא טרנזקציה אחת; claim() לוקח עבודה באופן אטומי.
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS index_jobs (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                source      TEXT NOT NULL,
+                path        TEXT NOT NULL,
+                status      TEXT NOT NULL DEFAULT 'queued',
+                pages_done  INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER NOT NULL DEFAULT 0,
+                chunks      INTEGER NOT NULL DEFAULT 0,
+                error       TEXT,
+                created_at  REAL NOT NULL,
+                updated_at  REAL NOT NULL,
+                staged_path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS index_jobs_status ON index_jobs(status, id);
+            """
+        )
+        עמודות = {r["name"] for r in self._conn.execute("PRAGMA table_info(index_jobs)")}
+        if "staged_path" not in עמודות:
+            self._conn.execute("ALTER TABLE index_jobs ADD COLUMN staged_path TEXT")
+        self._conn.commit()
+
+    def enqueue(self, path: str, source_name: str, staged_path: str | None = None) -> int | None:
+        """
+        מוסיף עבודה ומחזיר את המזהה שלה.
+        staged_path: קובץ זמני שיועבר ל-path כשהעבודה תילקח (העלאה); בלעדיו העבודה קוראת את path.
+        - עבודה ממתינה לאותו מקור: בלי staged_path לא נוסף דבר (None); עם staged_path
+          הקובץ הזמני שלה מוחלף בחדש – היא תאנדקס את הגרסה האחרונה
+        - עבודה רצה לאותו מקור: נוספת עבודת המשך, שתילקח רק אחרי שהרצה הנוכחית תסתיים
+        """
+        עכשיו = time.time()
+        with self._lock, self._conn:
+            ממתינה = self._conn.execute(
+                "SELECT id, staged_path FROM index_jobs WHERE source = ? AND status = 'queued'",
+                (source_name,),
+            ).fetchone()
+            if ממתינה is None:
+                return self._conn.execute(
+                    "INSERT INTO index_jobs (source, path, staged_path, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (source_name, path, staged_path, עכשיו, עכשיו),
+                ).lastrowid
+            if staged_path is None:
+                return None
+            self._conn.execute(
+                "UPDATE index_jobs SET path = ?, staged_path = ?, updated_at = ? WHERE id = ?",
+                (path, staged_path, עכשיו, ממתינה["id"]),
+            )
+        if ממתינה["staged_path"] and ממתינה["staged_path"] != staged_path:
+            try:
+                os.remove(ממתינה["staged_path"])
+            except FileNotFoundError:
+                pass
+        return ממתינה["id"]
+
+    def claim(self) -> dict | None:
+        """
+        לוקח את העבודה הוותיקה בתור ומסמן אותה running (אטומי מול workers אחרים).
+        מקור שיש לו עבודה רצה מדולג; קובץ שהועלה (staged_path) מועבר כאן למקומו.
+        """
+        with self._lock, self._conn:
+            שורה = self._conn.execute(
+                "UPDATE index_jobs SET status = 'running', updated_at = ? "
+                "WHERE id = (SELECT id FROM index_jobs WHERE status = 'queued' AND source NOT IN "
+                "(SELECT source FROM index_jobs WHERE status = 'running') ORDER BY id LIMIT 1) "
+                "RETURNING *",
+                (time.time(),),
+            ).fetchone()
+            if שורה is None:
+                return None
+            if שורה["staged_path"]:
+                try:
+                    os.replace(שורה["staged_path"], שורה["path"])
+                except FileNotFoundError:
+                    pass  # כבר הועבר (claim קודם שנקטע לפני שנשמר)
+                self._conn.execute(
+                    "UPDATE index_jobs SET staged_path = NULL WHERE id = ?", (שורה["id"],)
+                )
+        return dict(שורה)
+
+    def progress(self, job_id: int, pages_done: int, pages_total: int) -> None:
+        """עדכון התקדמות – משמש גם כ-heartbeat של העבודה."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE index_jobs SET pages_done = ?, pages_total = ?, updated_at = ? WHERE id = ?",
+                (pages_done, pages_total, time.time(), job_id),
+            )
+
+    def touch(self, job_id: int) -> None:
+        """heartbeat – גם כשעמוד בודד לוקח זמן (למשל המתנה ל-rate limit)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE index_jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id)
+            )
+
+    def finish(self, job_id: int, chunks: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE index_jobs SET status = 'done', chunks = ?, pages_done = pages_total, "
+                "updated_at = ? WHERE id = ?",
+                (chunks, time.time(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE index_jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def requeue_stale(self, max_age: float = JOB_STALE_SECONDS) -> int:
+        """עבודות running שלא עודכנו max_age שניות (השרת נפל באמצע) – חזרה לתור."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE index_jobs SET status = 'queued', pages_done = 0, updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (time.time(), time.time() - max_age),
+            ).rowcount
+
+    def active(self) -> list[dict]:
+        """עבודות שממתינות או רצות, לפי סדר ההגעה."""
+        with self._lock:
+            return [
+                dict(r) for r in self._conn.execute(
+                    "SELECT * FROM index_jobs WHERE status IN ('queued', 'running') ORDER BY id"
+                )
+            ]
+
+    def recent(self, limit: int = 10) -> list[dict]:
+        """העבודות האחרונות (כל מצב), החדשה ראשונה."""
+        with self._lock:
+            return [
+                dict(r) for r in self._conn.execute(
+                    "SELECT * FROM index_jobs ORDER BY id DESC LIMIT ?", (limit,)
+                )
+            ]
+
+    def clear_finished(self) -> int:
+        """מוחק עבודות שהסתיימו (done / failed) מהטבלה."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM index_jobs WHERE status IN ('done', 'failed')"
+            ).rowcount
+
+
+class IndexWorker:
+    """
+    threads ברקע שלוקחים עבודות מהתור ומריצים את process_large_pdf.
+    concurrency: כמה קבצים מאונדקסים במקביל (כל קובץ כבר מקבילי בפנים –
+    חילוץ ב-ProcessPool + קריאות הקשר במקביל).
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int = INDEX_JOB_CONCURRENCY, client=None):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self._client = client
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, name=f"index-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # עבודות שנקטעו (השרת הופעל מחדש באמצע) – חוזרות לתור
+            חזרו = self.queue.requeue_stale()
+            if חזרו:
+                print(f"[CHECK] Index jobs: {חזרו} interrupted job(s) re-queued")
+            עבודה = self.queue.claim()
+            if עבודה is None:
+                self._stop.wait(_POLL_SECONDS)
+                continue
+            self.run_job(עבודה)
+
+    def run_job(self, job: dict) -> None:
+        """
+        מריץ עבודה אחת. process_large_pdf אינקרמנטלי – מקור שכבר קיים (קובץ מעודכן, או
+        אינדוקס קודם שנקטע) מעדכן רק עמודים שהשתנו, כך שהעבודה אידמפוטנטית.
+        """
+        from rag import EXTRACTION_WORKERS, process_large_pdf
+
+        מזהה = job["id"]
+        t0 = time.perf_counter()
+        נגמר = threading.Event()
+
+        def _heartbeat():
+            while not נגמר.wait(_HEARTBEAT_SECONDS):
+                self.queue.touch(מזהה)
+
+        threading.Thread(target=_heartbeat, name=f"index-job-{מזהה}", daemon=True).start()
+        try:
+            chunks = process_large_pdf(
+                job["path"], job["source"],
+                progress_callback=lambda עמוד, סה_כ: self.queue.progress(מזהה, עמוד, סה_כ),
+                workers=EXTRACTION_WORKERS,
+                client=self._client,
+            )
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.fail(מזהה, f"{type(e).__name__}: {e}")
+            return
+        finally:
+            נגמר.set()
+        self.queue.finish(מזהה, chunks)
+        print(
+            f"[CHECK] Index job {מזהה} ({job['source']}): {chunks} chunks "
+            f"in {time.perf_counter() - t0:.1f}s"
+        )
+
+
+_queue: JobQueue | None = None
+_worker: IndexWorker | None = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """התור המשותף לתהליך."""
+    global _queue
+    with _jobs_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+def start_index_worker() -> IndexWorker:
+    """מפעיל את ה-worker פעם אחת לתהליך (קריאות נוספות מחזירות את הקיים)."""
+    global _worker
+    queue = get_job_queue()
+    with _jobs_lock:
+        if _worker is None:
+            _worker = IndexWorker(queue)
+            _worker.start()
+        return _worker
+
+
+if __name__ == "__main__":
+    # הרצה עצמאית (בלי Streamlit): מעבד את כל מה שבתור ויוצא
+    תור = get_job_queue()
+    תור.requeue_stale()
+    worker = IndexWorker(תור)
+    while (עבודה := תור.claim()) is not None:
+        print(f"מאנדקס: {עבודה['source']}")
+        worker.run_job(עבודה)
@@ -0,0 +1,114 @@
+"""
+מאגר עמודים: הטקסט המלא של כל עמוד, דחוס, לפי (source, page_number) – לשליפה מהירה
+בשאילתה, בסיכום ובאינדוקס חוזר.
+המקור הקובע הוא ChromaDB: full_page_content נשמר פעם אחת לעמוד, במטא של ה-chunk הראשון שלו
+(במקום על כל chunk). המאגר נשמר באותו קובץ SQLite של אינדקס ה-BM25
+(chroma_db/rag_index.sqlite3, לא ב-git) ומתמלא מחדש מהאוסף כשהוא חסר – למשל בפריסה.
+"""
+import hashlib
+import sqlite3
+import threading
+import zlib
+
+from bm25_index import INDEX_PATH
+
+
+def page_hash(text: str) -> str:
+    """hash של טקסט עמוד – לזיהוי עמודים שהשתנו באינדוקס חוזר."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageStore:
+    """טבלת pages ב-SQLite: (source, page_number) → טקסט העמוד דחוס ב-zlib."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                source      TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                content     BLOB NOT NULL,
+                PRIMARY KEY (source, page_number)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS page_store_meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def put_pages(self, pages: list[tuple[str, int, str]]) -> None:
+        """שומר עמודים: כל פריט (source, page_number, text). עמוד קיים מוחלף."""
+        if not pages:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                [(מקור, עמוד, zlib.compress(טקסט.encode("utf-8"))) for מקור, עמוד, טקסט in pages],
+            )
+
+    def get_pages(self, keys: list[tuple[str, int]]) -> dict[tuple[str, int], str]:
+        """מחזיר {(source, page_number): text} לעמודים שנמצאו – חסרים פשוט לא מופיעים."""
+        תוצאה: dict[tuple[str, int], str] = {}
+        with self._lock:
+            for מקור, עמוד in dict.fromkeys(keys):
+                שורה = self._conn.execute(
+                    "SELECT content FROM pages WHERE source = ? AND page_number = ?",
+                    (מקור, עמוד),
+                ).fetchone()
+                if שורה:
+                    תוצאה[(מקור, עמוד)] = zlib.decompress(שורה[0]).decode("utf-8")
+        return תוצאה
+
+    def get_source_pages(self, source_name: str) -> list[tuple[int, str]]:
+        """כל העמודים של מקור, לפי הסדר: [(page_number, text)]."""
+        with self._lock:
+            שורות = self._conn.execute(
+                "SELECT page_number, content FROM pages WHERE source = ? ORDER BY page_number",
+                (source_name,),
+            ).fetchall()
+        return [(עמוד, zlib.decompress(תוכן).decode("utf-8")) for עמוד, תוכן in שורות]
+
+    def page_hashes(self, source_name: str) -> dict[int, str]:
+        """{page_number: page_hash} לכל העמודים השמורים של מקור."""
+        return {עמוד: page_hash(טקסט) for עמוד, טקסט in self.get_source_pages(source_name)}
+
+    def delete_pages(self, source_name: str, page_numbers: list[int]) -> None:
+        """מוחק עמודים בודדים של מקור (עמוד שהתרוקן / שנמחק מהקובץ)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM pages WHERE source = ? AND page_number = ?",
+                [(source_name, עמוד) for עמוד in page_numbers],
+            )
+
+    def delete_source(self, source_name: str) -> int:
+        """מוחק את כל העמודים של מקור. מחזיר כמה נמחקו."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM pages WHERE source = ?", (source_name,)
+            ).rowcount
+
+    def clear(self) -> None:
+        """מרוקן את המאגר (למשל אחרי clear_chroma_db)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM page_store_meta")
+
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            שורה = self._conn.execute(
+                "SELECT value FROM page_store_meta WHERE key = ?", (key,)
+            ).fetchone()
+        return שורה[0] if שורה else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO page_store_meta VALUES (?, ?)", (key, value)
+            )
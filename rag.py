@@ -1,32 +1,202 @@
+import hashlib
+import json
+import multiprocessing
 import os
+import random
 import re
 import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import anthropic
-import chromadb
+import numpy as np
 import pdfplumber
 from dotenv import load_dotenv
-from rank_bm25 import BM25Okapi
 
-# cohere אופציונלי – נדרש ל-Reranking (pip install cohere, ו-COHERE_API_KEY ב-.env)
-try:
-    import cohere as _cohere
-    _COHERE_AVAILABLE = True
-except ImportError:
-    _COHERE_AVAILABLE = False
+from bm25_index import ranked_order
+from disk_cache import DiskCache, content_key
+from embeddings import DEFAULT_EMBEDDING_MODEL, get_embedder
+from rerankers import get_reranker
+from page_store import page_hash
+from store import get_store
 
 load_dotenv()  # טוען את משתני הסביבה מקובץ .env
 
+# מספר תהליכים לחילוץ עמודים במקביל (main + אינדוקס מהאפליקציה); 1 = סדרתי
+EXTRACTION_WORKERS = int(os.environ.get("RAG_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+
+# פרופיל חילוץ טקסט מעמודים – מתי להריץ את extract_tables (החלק היקר בחילוץ):
+# full-tables – בכל עמוד (ההתנהגות המקורית)
+# balanced    – רק בעמוד שהקווים בו יכולים ליצור טבלה של 2 שורות ומעלה; פלט זהה ל-full-tables
+# fast        – רק בעמוד עם רשת של ממש (2 עמודות × 2 שורות לפחות); טבלה במסגרת של עמודה אחת נקראת כטקסט
+EXTRACTION_PROFILES = ("fast", "balanced", "full-tables")
+EXTRACTION_PROFILE = os.environ.get("RAG_EXTRACTION_PROFILE", "balanced").strip().lower()
+if EXTRACTION_PROFILE not in EXTRACTION_PROFILES:
+    # ערך שגוי היה מתנהג בשקט כמו balanced – עדיף להיכשל בהפעלה עם הודעה ברורה
+    raise ValueError(
+        f"RAG_EXTRACTION_PROFILE={EXTRACTION_PROFILE!r} אינו מוכר – "
+        f"ערכים אפשריים: {', '.join(EXTRACTION_PROFILES)}"
+    )
+
+# מספר קריאות Contextual Retrieval במקביל בזמן אינדוקס (תקרה מול rate limits)
+CONTEXT_CONCURRENCY = int(os.environ.get("RAG_CONTEXT_CONCURRENCY", 8))
+
+# Contextual Retrieval – מודל + גרסת prompt; שינוי באחד מהם מבטל את המטמון הקיים
+CONTEXT_MODEL = "claude-haiku-4-5-20251001"
+CONTEXT_PROMPT_VERSION = 1
+CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_CONTEXT_CACHE_MAX_ENTRIES", 100_000))
+_context_cache: DiskCache | None = None
+
+# תרגום + הרחבת שאילתה – מטמון משותף לכל ה-sessions (ועל הדיסק בין הרצות)
+REWRITE_MODEL = "claude-haiku-4-5-20251001"
+REWRITE_PROMPT_VERSION = 1
+QUERY_CACHE_TTL = 30 * 24 * 3600  # 30 יום – מונחים/פרומפט עשויים להשתנות
+_query_cache: DiskCache | None = None
+
+# שלב התשובה – הכללים הקבועים וההקשר מסומנים כ-cacheable (prompt caching),
+# ושימוש הטוקנים של כל בקשה (כולל cache read / cache write) נרשם ליומן JSONL
+ANSWER_MODEL = "claude-haiku-4-5-20251001"
+USAGE_LOG_PATH = os.path.join("cache", "usage_log.jsonl")
+_usage_log_lock = threading.Lock()
+
+# חיפוש סמנטי מסונן – תקרה להרחבת n_results כשהסינון סלקטיבי (adaptive_semantic_n)
+SEMANTIC_MAX_RESULTS = int(os.environ.get("RAG_SEMANTIC_MAX_RESULTS", 200))
+
+# אריזת הקשר – תקציב טוקנים לבלוק ההקשר במקום מספר עמודים קבוע
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 12_000))
+PAGE_TOKEN_CAP = int(os.environ.get("RAG_PAGE_TOKEN_CAP", 3_000))  # עמוד ארוך יותר נחתך סביב ה-chunk
+MIN_PAGE_TOKENS = 150  # שארית תקציב קטנה מזה לא שווה עמוד חתוך
+
+# סיכום מסמך (map-reduce) – סיכום לכל פרק במקביל ואז איחוד; סיכומי הפרקים נשמרים במטמון
+SUMMARY_MODEL = "claude-haiku-4-5-20251001"
+SUMMARY_PROMPT_VERSION = 1
+SUMMARY_CONCURRENCY = int(os.environ.get("RAG_SUMMARY_CONCURRENCY", 4))
+SUMMARY_SECTION_TOKENS = 8_000   # פרק ארוך יותר מפוצל; מסמך קצר מזה מסוכם בקריאה אחת
+SUMMARY_MIN_SECTION_TOKENS = 1_500  # פרק קצר מזה מצורף לבא אחריו
+SUMMARY_REDUCE_TOKENS = 40_000   # מעבר לזה סיכומי הפרקים מאוחדים בשלבים
+# רשומה לכל פרק ולכל מסמך – מעטות בהרבה מרשומות ההקשר (אחת לכל chunk)
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_SUMMARY_CACHE_MAX_ENTRIES", 20_000))
+_summary_cache: DiskCache | None = None
+
+# ספירת תקנים – סינון מקומי של שורות מועמדות, אצוות במקביל, תוצאה שמורה לכל מקור
+STANDARDS_MODEL = "claude-haiku-4-5-20251001"
+STANDARDS_PROMPT_VERSION = 1
+STANDARDS_CONCURRENCY = int(os.environ.get("RAG_STANDARDS_CONCURRENCY", 4))
+STANDARDS_BATCH_LINES = 40  # שורות לכל קריאה – קטן כדי שהפלט לא יקוצץ
+STANDARDS_CONTEXT_LINES = 1  # שורות הקשר לפני/אחרי שורה מועמדת (כותרת התקן בשורה הבאה)
+_standards_cache: DiskCache | None = None
+# מזהי תקנים: ISO 9001 / EN 1992-1-1 / BS EN ISO 4287 / ASTM C150 / DIN 1045 / IEC 60364 /
+# IEEE 519 / ת"י 466 ועוד – מספיק כדי לזהות שורה מועמדת, המודל מחלץ את הרשומה המדויקת
+_STANDARD_RE = re.compile(
+    r"\b(?:ISO|EN|IEC|ASTM|DIN|BS|IEEE|ANSI|API|ACI|AWWA|NFPA|AASHTO|ASME|CEN/TS)"
+    r"(?:[\s/]+(?:EN|ISO|IEC))*[\s-]*[A-Z]?\s?\d{2,6}"
+    r"|ת[\"״]י\s*\d{2,5}"
+)
+
+ANSWER_RULES = (
+    "You are a strict document assistant.\n"
+    "ABSOLUTE RULES:\n"
+    "1. If information is NOT in the provided context - say ONLY: 'המידע לא נמצא בקטעים שנשלפו'\n"
+    "2. NEVER guess, estimate, or use prior knowledge\n"
+    "3. NEVER apologize or explain - just state clearly what was found or not found\n"
+    "4. Always cite the source filename AND page number (עמוד) for every piece of information\n"
+    "5. Volume data may appear as full numbers (e.g. 1,164,000 m3) OR in millions "
+    "(e.g. 1.18 mio m3 = 1,180,000 m3). Treat them as equivalent when cross-referencing data.\n"
+    "6. CONFLICT DETECTION: Scan ALL retrieved chunks. If different numerical values or facts "
+    "appear for the same data point — whether across documents or within one document — "
+    "flag it explicitly: '⚠️ שים לב: נמצא מידע סותר בין המקורות'\n"
+    "7. SOURCE COMPARISON: Never assume the first document is the correct one. "
+    "Present ALL versions found in the context and cite each with its source filename and page number.\n\n"
+    "ענה בשפה שבה נשאלת השאלה המקורית (עברית או אנגלית).\n"
+)
+
+
+# סבילויות ברירת המחדל של TableFinder ב-pdfplumber (snap / join / intersection / אורך קו)
+_TABLE_TOLERANCE = 3
+_TABLE_MIN_EDGE = 3
+_TABLE_MAX_EDGES = 400  # מעל זה – העמוד צפוף בקווים, אין טעם לבדוק (מחלצים)
+
+
+def _merge_rulings(edges: list[dict], orientation: str) -> list[tuple[float, float, float]]:
+    """
+    קווים באותו כיוון → [(מיקום, התחלה, סוף)] אחרי איחוד, כמו merge_edges של pdfplumber:
+    קווים שמיקומם קרוב מ-_TABLE_TOLERANCE מתקבצים, ומקטעים עם רווח קטן מזה מתחברים.
+    """
+    if orientation == "h":
+        קווים = sorted((e["top"], e["x0"], e["x1"]) for e in edges)
+    else:
+        קווים = sorted((e["x0"], e["top"], e["bottom"]) for e in edges)
+
+    אשכולות: list[list[tuple[float, float, float]]] = []
+    for קו in קווים:
+        if אשכולות and קו[0] - אשכולות[-1][-1][0] <= _TABLE_TOLERANCE:
+            אשכולות[-1].append(קו)
+        else:
+            אשכולות.append([קו])
+
+    תוצאה = []
+    for אשכול in אשכולות:
+        מיקום = sum(קו[0] for קו in אשכול) / len(אשכול)
+        מקטעים = sorted((קו[1], קו[2]) for קו in אשכול)
+        התחלה, סוף = מקטעים[0]
+        for a, b in מקטעים[1:]:
+            if a - סוף <= _TABLE_TOLERANCE:
+                סוף = max(סוף, b)
+            else:
+                תוצאה.append((מיקום, התחלה, סוף))
+                התחלה, סוף = a, b
+        תוצאה.append((מיקום, התחלה, סוף))
+    return [קו for קו in תוצאה if קו[2] - קו[1] >= _TABLE_MIN_EDGE]
+
 
-def _page_to_text(page) -> str:
+def _needs_table_extraction(page, profile: str = EXTRACTION_PROFILE) -> bool:
+    """
+    בדיקה זולה לפני extract_tables: האם הקווים בעמוד (lines + צלעות של rects)
+    יכולים בכלל ליצור טבלה שתופיע בפלט – כלומר שתי שורות לפחות (שורת כותרת בלבד לא נכתבת).
+    תא דורש קו אופקי שחוצה שני קווים אנכיים; שתי שורות דורשות שלושה קווים כאלה.
+    מסגרת עמוד ותיבת כותרת – המצב הנפוץ במפרטים – לא עוברות את הסף.
+    """
+    if profile == "full-tables":
+        return True
+    קצוות = [e for e in page.edges if max(e["width"], e["height"]) >= 1]
+    if len(קצוות) > _TABLE_MAX_EDGES:
+        return True
+    אופקיים = _merge_rulings([e for e in קצוות if e["orientation"] == "h"], "h")
+    אנכיים = _merge_rulings([e for e in קצוות if e["orientation"] == "v"], "v")
+    if len(אופקיים) < 3 or len(אנכיים) < 2:
+        return False
+
+    סבילות = _TABLE_TOLERANCE
+    חיתוכים = [
+        {
+            j
+            for j, (x, top, bottom) in enumerate(אנכיים)
+            if x0 - סבילות <= x <= x1 + סבילות and top - סבילות <= y <= bottom + סבילות
+        }
+        for y, x0, x1 in אופקיים
+    ]
+    # fast: רק רשת של ממש – 3 קווים אופקיים שכל אחד חוצה 3 אנכיים (2 עמודות × 2 שורות)
+    מינימום = 3 if profile == "fast" else 2
+    שורות = [ח for ח in חיתוכים if len(ח) >= מינימום]
+    if len(שורות) < 3:
+        return False
+    # וגם קווים אנכיים שנחתכים על ידי 2 מהקווים האלה לפחות (צלעות של תאים)
+    צלעות = [j for j in range(len(אנכיים)) if sum(j in ח for ח in שורות) >= 2]
+    return len(צלעות) >= מינימום
+
+
+def _page_to_text(page, profile: str = EXTRACTION_PROFILE) -> str:
     """
     ממיר עמוד pdfplumber לטקסט:
     - טבלאות: עמודה: ערך | עמודה: ערך
     - שאר הטקסט: כרגיל
+    profile קובע באילו עמודים מריצים זיהוי טבלאות (ראו EXTRACTION_PROFILE).
     """
     חלקים = []
 
-    # זיהוי טבלאות בענוד
-    טבלאות = page.extract_tables()
+    # זיהוי טבלאות בעמוד – רק אם הקווים בו יכולים ליצור טבלה
+    טבלאות = page.extract_tables() if _needs_table_extraction(page, profile) else []
     טקסט_העמוד = page.extract_text() or ""
 
     if טבלאות:
@@ -60,17 +230,78 @@ def _page_to_text(page) -> str:
     return "\n".join(חלקים)
 
 
-def load_pdf(file_path: str) -> str:
+def load_pdf(file_path: str, profile: str = EXTRACTION_PROFILE) -> str:
     """קורא קובץ PDF ומחזיר את כל הטקסט כמחרוזת, כולל טבלאות מומרות."""
     with pdfplumber.open(file_path) as pdf:
-        return "\n".join(_page_to_text(page) for page in pdf.pages)
+        return "\n".join(_page_to_text(page, profile) for page in pdf.pages)
 
 
-def load_pdf_pages(file_path: str):
+def load_pdf_pages(file_path: str, profile: str = EXTRACTION_PROFILE):
     """גנרטור שמחזיר טקסט עמוד-עמוד – חוסך זיכרון לקבצים ענקיים."""
     with pdfplumber.open(file_path) as pdf:
         for page in pdf.pages:
-            yield _page_to_text(page)
+            yield _page_to_text(page, profile)
+
+
+def _extract_page_range(
+    file_path: str, start: int, end: int, profile: str = EXTRACTION_PROFILE
+) -> list[str]:
+    """
+    רץ בתהליך worker: פותח את ה-PDF בעצמו ומחלץ את העמודים [start, end).
+    כל worker פותח את הקובץ מחדש – אובייקטי pdfplumber לא עוברים בין תהליכים.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        return [_page_to_text(pdf.pages[i], profile) for i in range(start, end)]
+
+
+def load_pdf_pages_parallel(
+    file_path: str,
+    workers: int = EXTRACTION_WORKERS,
+    pages_per_shard: int = 16,
+    total_pages: int | None = None,
+    profile: str = EXTRACTION_PROFILE,
+):
+    """
+    גנרטור מקבילי: מחלק את העמודים לטווחים ומחלץ אותם ב-ProcessPool.
+    העמודים מוחזרים בסדר המקורי, וכל היותר workers*2 טווחים בעיבוד בו-זמנית –
+    כך הזיכרון חסום גם בקבצים של מאות עמודים.
+    התהליכים נוצרים ב-spawn ולא ב-fork: הקריאה מגיעה גם מ-thread של worker האינדוקס
+    בתוך Streamlit, ו-fork בזמן ש-threads אחרים מחזיקים מנעולים (SQLite, Chroma) עלול להיתקע.
+    """
+    סה_כ = total_pages if total_pages is not None else count_pdf_pages(file_path)
+    טווחים = [(i, min(i + pages_per_shard, סה_כ)) for i in range(0, סה_כ, pages_per_shard)]
+
+    # קובץ קטן או worker יחיד – אין טעם לשלם על הקמת תהליכים
+    if workers <= 1 or len(טווחים) <= 1:
+        yield from load_pdf_pages(file_path, profile)
+        return
+
+    טווחים_הבאים = iter(טווחים)
+    pool = ProcessPoolExecutor(
+        max_workers=min(workers, len(טווחים)), mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        ממתינים = deque(
+            pool.submit(_extract_page_range, file_path, *טווח, profile)
+            for _, טווח in zip(range(workers * 2), טווחים_הבאים)
+        )
+        while ממתינים:
+            עמודי_טווח = ממתינים.popleft().result()
+            טווח = next(טווחים_הבאים, None)
+            if טווח is not None:
+                ממתינים.append(pool.submit(_extract_page_range, file_path, *טווח, profile))
+            yield from עמודי_טווח
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def file_sha256(file_path: str) -> str:
+    """hash של תוכן הקובץ (נקרא בבלוקים – לא טוען את כל הקובץ לזיכרון)."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for בלוק in iter(lambda: f.read(1 << 20), b""):
+            h.update(בלוק)
+    return h.hexdigest()
 
 
 def count_pdf_pages(file_path: str) -> int:
@@ -79,13 +310,30 @@ def count_pdf_pages(file_path: str) -> int:
         return len(pdf.pages)
 
 
+def collection_embedding_model() -> str:
+    """
+    מודל ה-embedding שהאוסף נבנה איתו (נשמר במטא של מאגר העמודים).
+    אוסף מלפני שכבת ה-embedding המפורשת נבנה ב-embedding function של chroma –
+    כלומר מודל ברירת המחדל; אוסף ריק מקבל את המודל הנוכחי.
+    """
+    מאגר = get_store().pages
+    מודל = מאגר.get_meta("embedding_model")
+    if מודל is None:
+        מודל = DEFAULT_EMBEDDING_MODEL if get_store().collection.count() else get_embedder().model_name
+        מאגר.set_meta("embedding_model", מודל)
+    return מודל
+
+
 def save_to_chromadb_batch(chunks: list[dict]) -> None:
-    """שומר אצווה של chunks ל-ChromaDB - כולל page_number + full_page_content במטא."""
+    """
+    שומר אצווה של chunks ל-ChromaDB – המטא כולל source + page_number.
+    full_page_content של כל עמוד נשמר פעם אחת: במטא של ה-chunk הראשון של העמוד
+    (המקור הקובע – נשמר עם chroma.sqlite3), ובמאגר העמודים המקומי (get_store().pages).
+    """
     if not chunks:
         return
 
-    לקוח = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח.get_or_create_collection(name="pdf_collection")
+    אוסף = get_store().collection
 
     מזהים  = [f"{c['source']}__p{c['page_number']}__s{c['chunk_serial']}" for c in chunks]
     מסמכים = [c["text"] for c in chunks]
@@ -94,12 +342,46 @@ def save_to_chromadb_batch(chunks: list[dict]) -> None:
             "source":           c["source"],
             "page_number":      c["page_number"],
             "chunk_serial":     c["chunk_serial"],
-            "full_page_content": c["full_page_content"],
         }
         for c in chunks
     ]
+    # עותק אחד של העמוד המלא – על ה-chunk הראשון של כל עמוד באצווה
+    # (כל ה-chunks של עמוד נשמרים תמיד באותה אצווה)
+    נושאים: set[tuple[str, int]] = set()
+    for c, m in zip(chunks, מטא):
+        if (c["source"], c["page_number"]) not in נושאים:
+            נושאים.add((c["source"], c["page_number"]))
+            m["full_page_content"] = c["full_page_content"]
+
+    # הווקטורים מחושבים כאן (באצוות, עם מטמון) ולא ב-embedding function של האוסף
+    embedder = get_embedder()
+    מודל_האוסף = collection_embedding_model()
+    if מודל_האוסף != embedder.model_name:
+        raise RuntimeError(
+            f"האוסף נבנה עם {מודל_האוסף} ו-RAG_EMBEDDING_MODEL={embedder.model_name} – "
+            "וקטורים ממודלים שונים אינם ברי-השוואה. נקה את ה-DB או החזר את המודל."
+        )
+    וקטורים = embedder.embed(מסמכים)
 
-    אוסף.add(ids=מזהים, documents=מסמכים, metadatas=מטא)
+    # עדכון אינקרמנטלי של אינדקס ה-BM25 – רק ה-chunks החדשים. writing() מסמן כתיבה
+    # בתהליך, כדי ש-ensure_synced לא יבנה מחדש בין הכתיבה לאוסף לכתיבה לאינדקס
+    with get_store().bm25.writing():
+        אוסף.add(ids=מזהים, embeddings=וקטורים, documents=מסמכים, metadatas=מטא)
+        get_store().bm25.add_chunks([
+            (מזהה, c["source"], c["text"]) for מזהה, c in zip(מזהים, chunks)
+        ])
+
+    # עמוד מלא אחד לכל (source, page) – לא פעם לכל chunk. נכתב רק אחרי שה-chunks נשמרו:
+    # עמוד במאגר הוא הסימן לאינדוקס חוזר שהעמוד כבר אונדקס
+    עמודים = {(c["source"], c["page_number"]): c["full_page_content"] for c in chunks}
+    get_store().pages.put_pages([(מקור, עמוד, טקסט) for (מקור, עמוד), טקסט in עמודים.items()])
+
+    # קטלוג המקורות: מספר chunks + העמוד הגבוה ביותר שנשמר לכל מקור
+    ספירות: dict[str, tuple[int, int]] = {}
+    for c in chunks:
+        n, עמוד = ספירות.get(c["source"], (0, 0))
+        ספירות[c["source"]] = (n + 1, max(עמוד, c["page_number"]))
+    get_store().catalog.add_chunks(ספירות)
 
 
 def clear_chroma_db() -> None:
@@ -107,14 +389,236 @@ def clear_chroma_db() -> None:
     מאפס את אוסף pdf_collection ב-ChromaDB דרך ה-API.
     משתמש ב-API ולא במחיקת קבצים – עובד גם כאשר הקובץ תפוס (Windows).
     """
-    לקוח = chromadb.PersistentClient(path="chroma_db")
-    try:
-        לקוח.delete_collection(name="pdf_collection")
+    # מוחק דרך המאגר המשותף – גם מאפס את ידית האוסף השמורה, אינדקס ה-BM25 ומאגר העמודים
+    if get_store().delete_collection():
         print("האוסף pdf_collection נמחק בהצלחה.")
-    except Exception:
+    else:
         print("האוסף לא נמצא – אין מה למחוק.")
 
 
+def migrate_page_store(batch_size: int = 1000) -> int:
+    """
+    מביא את האוסף למבנה הנוכחי – full_page_content פעם אחת לעמוד, על chunk אחד שלו:
+    - פורמט ישן (השדה על כל chunk): נשאר על ה-chunk הראשון של העמוד ונמחק משאר ה-chunks
+    - עמוד שהשדה נמחק מכל ה-chunks שלו (הסבה קודמת שהעבירה אותו רק למאגר העמודים) –
+      מוחזר מהמאגר ל-chunk הראשון
+    העמודים נכתבים גם למאגר העמודים. מחזיר כמה chunks עודכנו.
+    הקובץ chroma.sqlite3 מתכווץ בפועל רק אחרי VACUUM (chroma utils vacuum --path chroma_db).
+    """
+    מאגר = get_store().pages
+    if מאגר.get_meta("page_layout") == "2":
+        return 0
+
+    אוסף = get_store().collection
+    עודכנו = 0
+    היסט = 0
+    נושאים: set[tuple[str, int]] = set()
+    ראשון: dict[tuple[str, int], tuple[int, str]] = {}  # עמוד → (chunk_serial, id) הנמוך ביותר
+    while True:
+        אצווה = אוסף.get(include=["metadatas"], limit=batch_size, offset=היסט)
+        if not אצווה["ids"]:
+            break
+        היסט += len(אצווה["ids"])
+        עמודים: dict[tuple[str, int], str] = {}
+        עודפים: list[str] = []
+        for מזהה, מטא in zip(אצווה["ids"], אצווה["metadatas"]):
+            if "page_number" not in מטא:
+                continue
+            מפתח = (מטא["source"], מטא["page_number"])
+            סידורי = (מטא.get("chunk_serial", 0), מזהה)
+            if מפתח not in ראשון or סידורי < ראשון[מפתח]:
+                ראשון[מפתח] = סידורי
+            if "full_page_content" not in מטא:
+                continue
+            if מפתח in נושאים:
+                עודפים.append(מזהה)
+            else:
+                נושאים.add(מפתח)
+                עמודים[מפתח] = מטא["full_page_content"]
+        מאגר.put_pages([(מקור, עמוד, טקסט) for (מקור, עמוד), טקסט in עמודים.items()])
+        if עודפים:
+            # None מוחק את המפתח מהמטא ב-ChromaDB
+            אוסף.update(ids=עודפים, metadatas=[{"full_page_content": None} for _ in עודפים])
+            עודכנו += len(עודפים)
+
+    # עמודים בלי עותק באוסף – מוחזרים ממאגר העמודים (אם הוא קיים כאן)
+    חסרים = [מפתח for מפתח in ראשון if מפתח not in נושאים]
+    שמורים = מאגר.get_pages(חסרים)
+    if שמורים:
+        אוסף.update(
+            ids=[ראשון[מפתח][1] for מפתח in שמורים],
+            metadatas=[{"full_page_content": טקסט} for טקסט in שמורים.values()],
+        )
+        עודכנו += len(שמורים)
+    if len(שמורים) < len(חסרים):
+        print(f"  ⚠️ {len(חסרים) - len(שמורים)} עמודים בלי טקסט מלא – יש לאנדקס מחדש את המקורות שלהם")
+
+    מאגר.set_meta("page_layout", "2")
+    return עודכנו
+
+
+def fetch_full_pages(keys: list[tuple[str, int]], collection) -> dict[tuple[str, int], str]:
+    """
+    מחזיר {(source, page): טקסט העמוד המלא} – ממאגר העמודים.
+    עמוד שחסר במאגר (chroma_db שהגיע בלי rag_index.sqlite3, למשל בפריסה) נשלף מהמטא
+    של ה-chunk שנושא אותו באוסף ונשמר במאגר.
+    """
+    מאגר = get_store().pages
+    עמודים = מאגר.get_pages(keys)
+    חסרים = [מפתח for מפתח in dict.fromkeys(keys) if מפתח not in עמודים]
+    נמצאו = []
+    for מקור, עמוד in חסרים:
+        # רק chunk אחד לעמוד נושא את הטקסט – המטא של כל ה-chunks של העמוד (מעטים) נשלפים
+        תוצאה = collection.get(
+            where={"$and": [{"source": {"$eq": מקור}}, {"page_number": {"$eq": עמוד}}]},
+            include=["metadatas"],
+        )
+        for מטא in תוצאה["metadatas"]:
+            if "full_page_content" in מטא:
+                עמודים[(מקור, עמוד)] = מטא["full_page_content"]
+                נמצאו.append((מקור, עמוד, מטא["full_page_content"]))
+                break
+    מאגר.put_pages(נמצאו)
+    return עמודים
+
+
+def load_source_pages(source_name: str) -> list[tuple[int, str]] | None:
+    """
+    כל העמודים (שאינם ריקים) של מקור: [(page_number, text)] – למשימות על המסמך כולו
+    (סיכום, ספירת תקנים). מאגר העמודים עלול להיות חלקי (מתמלא עמוד-עמוד ב-fetch_full_pages
+    כשהוא חסר), ולכן:
+    1. כל העמודים שאינם ריקים (text_pages בקטלוג) שמורים → מוחזרים בלי לגשת לאוסף
+    2. אחרת (או text_pages לא ידוע) העמודים החסרים נשלפים מהאוסף ונשמרים, ו-text_pages נקבע
+    3. עדיין חסרים עמודים שיש להם chunks (או chunks בפורמט ללא עמודים) → חילוץ מ-pdfs/
+    None – המסמך לא זמין במלואו. לעולם לא מוחזר מסמך חלקי.
+    """
+    מאגר = get_store().pages
+    עמודים = dict(מאגר.get_source_pages(source_name))
+    רשומה = get_store().catalog.get(source_name)
+    # עמוד ריק לא נשמר – ההשוואה מול מספר העמודים עם טקסט, לא מול page_count
+    if רשומה and רשומה["text_pages"] >= 0 and len(עמודים) >= רשומה["text_pages"]:
+        return sorted(עמודים.items())
+
+    שלם = False
+    if רשומה:
+        מטא_chunks = get_store().collection.get(
+            where={"source": source_name}, include=["metadatas"]
+        )["metadatas"]
+        # None – chunk בפורמט ללא עמודים (split_text), שלא ניתן להרכיב ממנו עמודים
+        עם_chunks = {מטא.get("page_number") for מטא in מטא_chunks}
+        נמצאו = {
+            מטא["page_number"]: מטא["full_page_content"]
+            for מטא in מטא_chunks
+            if "full_page_content" in מטא and "page_number" in מטא
+            and מטא["page_number"] not in עמודים
+        }
+        מאגר.put_pages([(source_name, עמוד, טקסט) for עמוד, טקסט in נמצאו.items()])
+        עמודים.update(נמצאו)
+        שלם = bool(עם_chunks) and None not in עם_chunks and עם_chunks <= set(עמודים)
+    if שלם:
+        # מקור שאונדקס לפני text_pages – בפעם הבאה המסלול המהיר
+        get_store().catalog.set_text_pages(source_name, len(עמודים))
+        return sorted(עמודים.items())
+
+    נתיב_pdf = os.path.join("pdfs", source_name)
+    if not os.path.exists(נתיב_pdf):
+        return None
+    print(f"[CHECK] Source pages ({source_name}): incomplete in the index – extracting the PDF")
+    return [
+        (עמוד, טקסט)
+        for עמוד, טקסט in enumerate(load_pdf_pages_parallel(נתיב_pdf), start=1)
+        if טקסט.strip()
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    הערכת טוקנים מקומית, ללא tokenizer: ~4 תווי ASCII לטוקן (אנגלית, מספרים),
+    ~2 תווים לטוקן לשאר (עברית, סימנים) – מספיק מדויק לתקציב, ונוטה להערכת-יתר.
+    """
+    ascii_ = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_ // 4 + (len(text) - ascii_) // 2 + 1
+
+
+def _chunk_body(chunk: str) -> str:
+    """גוף ה-chunk ללא משפט ההקשר וה-prefix ("[מקור: ... ]") שנוספו באינדוקס."""
+    מיקום = chunk.find("[מקור: ")
+    if מיקום == -1:
+        return chunk
+    סוף = chunk.find("]\n", מיקום)
+    return chunk[סוף + 2:] if סוף != -1 else chunk
+
+
+def _trim_around(full: str, chunk: str, max_tokens: int) -> str:
+    """
+    חותך עמוד ל-max_tokens (בערך) – חלון סביב ה-chunk שהתאים, מיושר לגבולות שורה.
+    chunk שלא נמצא בעמוד → חלון מתחילת העמוד.
+    """
+    טוקנים = estimate_tokens(full)
+    if טוקנים <= max_tokens:
+        return full
+    אורך_חלון = max(1, len(full) * max_tokens // טוקנים)
+    גוף = _chunk_body(chunk).strip()
+    מרכז = full.find(גוף[:200]) if גוף else -1
+    if מרכז == -1:
+        התחלה = 0
+    else:
+        מרכז += min(len(גוף), אורך_חלון) // 2
+        התחלה = max(0, min(מרכז - אורך_חלון // 2, len(full) - אורך_חלון))
+    סוף = התחלה + אורך_חלון
+    # יישור לגבולות שורה כשאפשר – לא חותכים מספר או תא בטבלה באמצע
+    if התחלה > 0:
+        שורה = full.find("\n", התחלה, התחלה + 200)
+        התחלה = שורה + 1 if שורה != -1 else התחלה
+    if סוף < len(full):
+        שורה = full.rfind("\n", סוף - 200, סוף)
+        סוף = שורה if שורה > התחלה else סוף
+    return ("…\n" if התחלה > 0 else "") + full[התחלה:סוף] + ("\n…" if סוף < len(full) else "")
+
+
+def pack_context(
+    items: list[dict],
+    budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+    page_cap: int = PAGE_TOKEN_CAP,
+) -> list[dict]:
+    """
+    בוחר עמודים לבלוק ההקשר בתוך תקציב טוקנים.
+    items: עמודים ממוינים לפי רלוונטיות, עם "full", "chunk" ו-"rerank_score" או "ציון".
+    - עמוד ארוך מ-page_cap (ולכל היותר מחצי התקציב) נחתך סביב ה-chunk שהתאים (_trim_around)
+    - העמוד המדורג ראשון נכנס תמיד; השאר לפי צפיפות ציון (ציון / טוקנים)
+    - עמוד שלא נכנס במלואו נחתך לשארית התקציב, אם היא לפחות MIN_PAGE_TOKENS
+    מחזיר את העמודים שנבחרו (בסדר הדירוג), עם "full" מעודכן ו-"tokens".
+    """
+    if not items:
+        return []
+
+    תקרה = min(page_cap, budget_tokens // 2)
+    מועמדים = []
+    for דרגה, item in enumerate(items):
+        טקסט = _trim_around(item["full"], item["chunk"], תקרה)
+        טוקנים = estimate_tokens(טקסט)
+        ציון = item.get("rerank_score", item["ציון"])
+        מועמדים.append((דרגה, item, טקסט, טוקנים, ציון / max(טוקנים, 1)))
+
+    # העמוד הראשון קודם, ואחריו לפי צפיפות יורדת
+    סדר = [מועמדים[0]] + sorted(מועמדים[1:], key=lambda x: x[4], reverse=True)
+
+    נבחרו = []
+    נותר = budget_tokens
+    for דרגה, item, טקסט, טוקנים, _ in סדר:
+        if טוקנים > נותר:
+            if נותר < MIN_PAGE_TOKENS:
+                continue
+            טקסט = _trim_around(item["full"], item["chunk"], נותר)
+            טוקנים = estimate_tokens(טקסט)
+            if טוקנים > נותר:
+                continue
+        נבחרו.append((דרגה, {**item, "full": טקסט, "tokens": טוקנים}))
+        נותר -= טוקנים
+
+    return [item for _, item in sorted(נבחרו, key=lambda x: x[0])]
+
+
 def _extract_section_header(text: str) -> str | None:
     """
     מחלץ את הכותרת הממוספרת העמוקה ביותר מתוך טקסט העמוד.
@@ -143,35 +647,142 @@ def _extract_section_header(text: str) -> str | None:
     return כותרת_נבחרת
 
 
+def get_context_cache() -> DiskCache:
+    """מטמון משפטי ההקשר לעמוד – מפתח: hash של (טקסט העמוד, גרסת prompt, מודל)."""
+    global _context_cache
+    if _context_cache is None:
+        _context_cache = DiskCache("page_context", max_entries=CONTEXT_CACHE_MAX_ENTRIES)
+    return _context_cache
+
+
+def _is_rate_limit_error(err: Exception) -> bool:
+    """429 (rate limit) או 529 (overloaded) – שגיאות שכדאי לנסות שוב אחרי המתנה."""
+    if isinstance(err, (anthropic.RateLimitError, anthropic.InternalServerError)):
+        return getattr(err, "status_code", 429) in (429, 529)
+    return getattr(err, "status_code", None) in (429, 529)
+
+
 def _generate_chunk_context(
     לקוח_anthropic,
     source_name: str,
     page_text: str,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
 ) -> str:
     """
     Contextual Retrieval: מייצר משפט הקשר קצר (עד 50 מילים) לכל עמוד.
     המשפט מוסף לתחילת כל Chunk מאותו עמוד לפני יצירת הוקטור ב-ChromaDB.
     מייצר פעם אחת לעמוד (לא לכל chunk) – חיסכון ב-N-1 קריאות API לעמוד.
+    על rate limit: ניסיון חוזר עם backoff אקספוננציאלי + jitter (עד max_retries).
     """
-    try:
-        תגובה = לקוח_anthropic.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=100,
-            messages=[{
-                "role": "user",
-                "content": (
-                    f"Document: {source_name}\n"
-                    f"Page text (first 600 chars): {page_text[:600]}\n\n"
-                    "Write ONE sentence (max 50 words) describing what this page covers. "
-                    "Include: document name, section topic, key technical terms "
-                    "(units like mio m3/MCM, numeric values, categories). "
-                    "Return ONLY the sentence."
-                ),
-            }],
-        )
-        return תגובה.content[0].text.strip()
-    except Exception:
-        return ""  # fallback – הchunk יישמר ללא הקשר
+    for ניסיון in range(max_retries + 1):
+        try:
+            תגובה = לקוח_anthropic.messages.create(
+                model=CONTEXT_MODEL,
+                max_tokens=100,
+                messages=[{
+                    "role": "user",
+                    "content": (
+                        f"Document: {source_name}\n"
+                        f"Page text (first 600 chars): {page_text[:600]}\n\n"
+                        "Write ONE sentence (max 50 words) describing what this page covers. "
+                        "Include: document name, section topic, key technical terms "
+                        "(units like mio m3/MCM, numeric values, categories). "
+                        "Return ONLY the sentence."
+                    ),
+                }],
+            )
+            return תגובה.content[0].text.strip()
+        except Exception as e:
+            if _is_rate_limit_error(e) and ניסיון < max_retries:
+                time.sleep(base_delay * (2 ** ניסיון) + random.uniform(0, base_delay))
+                continue
+            return ""  # fallback – הchunk יישמר ללא הקשר
+    return ""
+
+
+def _cached_chunk_context(לקוח_anthropic, source_name: str, page_text: str, key: str) -> str:
+    """קורא למודל ושומר במטמון – רק תשובה לא ריקה (כישלון לא נשמר ויורץ שוב בפעם הבאה)."""
+    הקשר = _generate_chunk_context(לקוח_anthropic, source_name, page_text)
+    if הקשר:
+        get_context_cache().set(key, הקשר)
+    return הקשר
+
+
+def _iter_page_contexts(
+    pages,
+    לקוח_anthropic,
+    source_name: str,
+    concurrency: int = CONTEXT_CONCURRENCY,
+    cache_stats: dict | None = None,
+):
+    """
+    גנרטור: מקבל טקסטים של עמודים ומחזיר (מספר_עמוד, טקסט_נקי, הקשר) בסדר העמודים.
+    קריאות ההקשר רצות ב-ThreadPool (עד concurrency במקביל) בזמן שהחילוץ ממשיך;
+    עמוד מוחזר ברגע שההקשר שלו וכל מה שלפניו מוכנים. עמוד ריק מוחזר עם הקשר "".
+    התור חסום ל-concurrency*4 עמודים – החילוץ לא בורח קדימה ללא גבול.
+    לפני כל קריאה נבדק מטמון ההקשר (get_context_cache); cache_stats מתעדכן ב-hits/misses.
+    """
+    חלון = max(1, concurrency) * 4
+    מטמון = get_context_cache()
+    תור: deque = deque()  # (מספר_עמוד, טקסט_נקי, future | str)
+    if cache_stats is not None:
+        cache_stats.setdefault("hits", 0)
+        cache_stats.setdefault("misses", 0)
+
+    def _שחרור(פריט):
+        מספר_עמוד, טקסט_מלא, הקשר = פריט
+        return מספר_עמוד, טקסט_מלא, (הקשר if isinstance(הקשר, str) else הקשר.result())
+
+    def _מוכן(הקשר) -> bool:
+        return isinstance(הקשר, str) or הקשר.done()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as מאגר:
+        for מספר_עמוד, טקסט_עמוד in enumerate(pages, start=1):
+            טקסט_מלא = טקסט_עמוד.strip()
+            הקשר = ""
+            if טקסט_מלא:
+                מפתח = content_key(CONTEXT_PROMPT_VERSION, CONTEXT_MODEL, טקסט_מלא)
+                שמור = מטמון.get(מפתח)
+                if cache_stats is not None:
+                    cache_stats["hits" if שמור is not None else "misses"] += 1
+                הקשר = שמור if שמור is not None else מאגר.submit(
+                    _cached_chunk_context, לקוח_anthropic, source_name, טקסט_מלא, מפתח
+                )
+            תור.append((מספר_עמוד, טקסט_מלא, הקשר))
+
+            # מוציא מראש התור עמודים מוכנים (או חוסם כשהתור מלא)
+            while תור and (len(תור) > חלון or _מוכן(תור[0][2])):
+                yield _שחרור(תור.popleft())
+
+        while תור:
+            yield _שחרור(תור.popleft())
+
+
+def _source_chunks_by_page(source_name: str) -> tuple[dict[int, list[str]], int] | None:
+    """
+    ({page_number: [chunk ids]}, ה-chunk_serial הבא הפנוי) של מקור מאונדקס.
+    None – chunks בפורמט הישן (ללא page_number), שלא ניתן לעדכן עמוד-עמוד.
+    """
+    תוצאות = get_store().collection.get(where={"source": source_name}, include=["metadatas"])
+    לפי_עמוד: dict[int, list[str]] = {}
+    סידורי_הבא = 0
+    for מזהה, מטא in zip(תוצאות["ids"], תוצאות["metadatas"]):
+        if "page_number" not in מטא:
+            return None
+        לפי_עמוד.setdefault(מטא["page_number"], []).append(מזהה)
+        סידורי_הבא = max(סידורי_הבא, מטא.get("chunk_serial", 0) + 1)
+    return לפי_עמוד, סידורי_הבא
+
+
+def _delete_chunks(source_name: str, chunk_ids: list[str]) -> None:
+    """מוחק chunks מסוימים של מקור מ-ChromaDB, מאינדקס ה-BM25 ומספירת הקטלוג."""
+    if not chunk_ids:
+        return
+    with get_store().bm25.writing():
+        get_store().collection.delete(ids=chunk_ids)
+        get_store().bm25.delete_chunks(chunk_ids)
+    get_store().catalog.remove_chunks(source_name, len(chunk_ids))
 
 
 def process_large_pdf(
@@ -181,22 +792,101 @@ def process_large_pdf(
     overlap: int = 100,
     batch_size: int = 200,
     progress_callback=None,
+    workers: int = 1,
+    context_concurrency: int = CONTEXT_CONCURRENCY,
+    client=None,
 ) -> int:
     """
     Parent Document Retrieval indexing:
     - כל עמוד מחולק ל-chunks קטנים (chunk_size תווים, overlap חפיפה)
-    - במטא של כל chunk נשמר הטקסט המלא של העמוד (full_page_content)
+    - הטקסט המלא של העמוד נשמר פעם אחת (full_page_content – ב-chunk הראשון ובמאגר העמודים)
     - בשלב השאילה יישלח ל-Claude העמוד המלא (לא רק ה-chunk)
+    workers > 1: חילוץ העמודים מתבצע במקביל ב-ProcessPool (load_pdf_pages_parallel);
+    העמודים מגיעים בסדר ונשמרים באצוות תוך כדי, ו-progress_callback נקרא לכל עמוד כרגיל.
+    context_concurrency: קריאות Contextual Retrieval במקביל (_iter_page_contexts).
+    client: לקוח בממשק anthropic.Anthropic – ברירת מחדל לקוח אמיתי (אפשר להזריק stub).
+    אינדוקס חוזר של מקור קיים הוא אינקרמנטלי:
+    - hash הקובץ זהה לזה שבקטלוג → אין מה לעשות (מחזיר 0)
+    - אחרת כל עמוד מחולץ ומושווה ל-hash של הטקסט השמור במאגר העמודים; עמוד נחשב ללא שינוי
+      רק אם ה-hash זהה וה-chunks שלו קיימים גם ב-ChromaDB וגם באינדקס ה-BM25. כל עמוד אחר
+      עובר הקשר + chunking + embedding, וה-chunks הישנים שלו נמחקים.
+    - עמודים שנמחקו מהקובץ (או התרוקנו) – ה-chunks והעמוד השמור נמחקים
+    כך גם אינדוקס שנקטע באמצע ממשיך מהעמוד הראשון שלא נשמר.
+    מחזיר את מספר ה-chunks שנכתבו.
     """
+    קטלוג = get_store().catalog
+    hash_קובץ = file_sha256(file_path)
+    רשומה = קטלוג.get(source_name)
+    if רשומה and רשומה["content_hash"] == hash_קובץ:
+        print(f"  ללא שינוי: {source_name}")
+        return 0
+
     # אתחול לקוח Anthropic לשימוש ב-Contextual Retrieval (פעם אחת לאינדוקס)
-    לקוח_anthropic = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    לקוח_anthropic = client or anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
     סה_כ_עמודים = count_pdf_pages(file_path)
     כל_החלקים: list[dict] = []
     סה_כ_chunks = 0
     סידורי_גלובלי = 0  # chunk serial רץ עבור מזהה ייחודי
 
-    for מספר_עמוד, טקסט_עמוד in enumerate(load_pdf_pages(file_path), start=1):
-        טקסט_מלא = טקסט_עמוד.strip()
+    # מצב קודם של המקור: chunks לפי עמוד + hash של כל עמוד שמור
+    chunks_קודמים: dict[int, list[str]] = {}
+    hashes_קודמים: dict[int, str] = {}
+    ב_bm25: set[str] = set()
+    if רשומה:
+        קיים = _source_chunks_by_page(source_name)
+        if קיים is None:
+            delete_source(source_name)
+        else:
+            chunks_קודמים, סידורי_גלובלי = קיים
+            hashes_קודמים = get_store().pages.page_hashes(source_name)
+            ב_bm25 = get_store().bm25.existing_chunks(
+                [מזהה for מזהים in chunks_קודמים.values() for מזהה in מזהים]
+            )
+    שינויים = {"changed": 0, "unchanged": 0}
+    עם_טקסט = {"pages": 0}
+
+    def _ספירת_עמודים_עם_טקסט(עמודים):
+        """סופר עמודים שאינם ריקים (לפני הדילוג על עמודים שלא השתנו) – נשמר בקטלוג."""
+        for טקסט_עמוד in עמודים:
+            if טקסט_עמוד.strip():
+                עם_טקסט["pages"] += 1
+            yield טקסט_עמוד
+
+    def _רק_עמודים_שהשתנו(עמודים):
+        """עמוד שלא השתנה מוחלף ב-"" – מדולג בלי הקשר ובלי embedding; לעמוד שהשתנה – ה-chunks הישנים נמחקים."""
+        for מספר_עמוד, טקסט_עמוד in enumerate(עמודים, start=1):
+            ישנים = chunks_קודמים.pop(מספר_עמוד, [])
+            hash_קודם = hashes_קודמים.pop(מספר_עמוד, None)
+            # עמוד שנשמר במאגר אבל ה-chunks שלו לא הגיעו לאינדקסים (אצווה שנכשלה) – מאונדקס מחדש
+            שלם = bool(ישנים) and ב_bm25.issuperset(ישנים)
+            if שלם and hash_קודם == page_hash(טקסט_עמוד.strip()):
+                שינויים["unchanged"] += 1
+                yield ""
+                continue
+            if hash_קודם is not None or ישנים:
+                _delete_chunks(source_name, ישנים)
+                if not טקסט_עמוד.strip():
+                    get_store().pages.delete_pages(source_name, [מספר_עמוד])
+            if hash_קודם is not None or טקסט_עמוד.strip():
+                שינויים["changed"] += 1
+            yield טקסט_עמוד
+
+    if workers > 1:
+        עמודים = load_pdf_pages_parallel(file_path, workers=workers, total_pages=סה_כ_עמודים)
+    else:
+        עמודים = load_pdf_pages(file_path)
+    עמודים = _ספירת_עמודים_עם_טקסט(עמודים)
+    if רשומה:
+        עמודים = _רק_עמודים_שהשתנו(עמודים)
+
+    # Contextual Retrieval במקביל – העמודים חוזרים בסדר, כל אחד עם משפט ההקשר שלו
+    סטטיסטיקת_מטמון: dict = {}
+    עמודים_עם_הקשר = _iter_page_contexts(
+        עמודים, לקוח_anthropic, source_name,
+        concurrency=context_concurrency, cache_stats=סטטיסטיקת_מטמון,
+    )
+
+    for מספר_עמוד, טקסט_מלא, הקשר_עמוד in עמודים_עם_הקשר:
         if not טקסט_מלא:
             if progress_callback:
                 progress_callback(מספר_עמוד, סה_כ_עמודים)
@@ -209,9 +899,6 @@ def process_large_pdf(
             prefix += f" | סעיף: {כותרת_סעיף}"
         prefix += "]\n"
 
-        # Contextual Retrieval: קריאת LLM פעם אחת לעמוד – משותף לכל ה-chunks שלו
-        הקשר_עמוד = _generate_chunk_context(לקוח_anthropic, source_name, טקסט_מלא)
-
         # חיתוך העמוד ל-chunks קטנים
         עמדה_ב_טקסט = 0
         while עמדה_ב_טקסט < len(טקסט_מלא):
@@ -241,34 +928,65 @@ def process_large_pdf(
         save_to_chromadb_batch(כל_החלקים)
         סה_כ_chunks += len(כל_החלקים)
 
+    # עמודים שכבר אינם בקובץ – ה-chunks והטקסט השמור שלהם נמחקים
+    if chunks_קודמים or hashes_קודמים:
+        _delete_chunks(source_name, [מזהה for מזהים in chunks_קודמים.values() for מזהה in מזהים])
+        get_store().pages.delete_pages(source_name, sorted(set(chunks_קודמים) | set(hashes_קודמים)))
+    if רשומה:
+        print(
+            f"[CHECK] Reindex ({source_name}): {שינויים['changed']} changed, "
+            f"{שינויים['unchanged']} unchanged, "
+            f"{len(set(chunks_קודמים) | set(hashes_קודמים))} removed pages"
+        )
+
+    # סגירת רשומת הקטלוג: מספר העמודים בקובץ (וכמה מהם עם טקסט) + hash של התוכן
+    # + גודל/mtime לסריקה הבאה
+    מצב_קובץ = os.stat(file_path)
+    קטלוג.finish_source(
+        source_name, סה_כ_עמודים, hash_קובץ, מצב_קובץ.st_size, מצב_קובץ.st_mtime,
+        text_pages=עם_טקסט["pages"],
+    )
+
+    print(
+        f"  מטמון הקשר ({source_name}): "
+        f"{סטטיסטיקת_מטמון.get('hits', 0)} hits / {סטטיסטיקת_מטמון.get('misses', 0)} misses"
+    )
     return סה_כ_chunks
 
 
-def load_multiple_pdfs(folder_path: str) -> list[dict]:
+def scan_pdf_folder(folder_path: str) -> dict[str, list[str]]:
     """
-    קורא את כל קבצי ה-PDF בתיקייה.
-    מחזיר רשימה של מילונים עם שני שדות:
-      - source: שם הקובץ
-      - text: הטקסט המלא
+    סריקה זולה של התיקייה מול קטלוג המקורות – בלי לחלץ אף קובץ:
+    - שם שאינו בקטלוג → new
+    - גודל + mtime זהים למה שנשמר באינדוקס → unchanged (הקובץ לא נקרא בכלל)
+    - אחרת hash של התוכן: זהה → unchanged (ה-mtime מתעדכן בקטלוג), שונה → changed
+    מחזיר {"new": [...], "changed": [...], "unchanged": [...]} – שמות קבצים ממוינים.
     """
-    תוצאות = []
-
-    # בודק שהתיקייה קיימת
+    תוצאה: dict[str, list[str]] = {"new": [], "changed": [], "unchanged": []}
     if not os.path.isdir(folder_path):
         print(f"תיקייה לא נמצאה: {folder_path}")
-        return תוצאות
+        return תוצאה
 
-    for שם_קובץ in os.listdir(folder_path):
+    קטלוג = get_store().catalog
+    for שם_קובץ in sorted(os.listdir(folder_path)):
         # מתעלם מקבצים שאינם PDF
         if not שם_קובץ.lower().endswith(".pdf"):
             continue
-
         נתיב_מלא = os.path.join(folder_path, שם_קובץ)
-        print(f"טוען: {שם_קובץ}")
-        טקסט = load_pdf(נתיב_מלא)
-        תוצאות.append({"source": שם_קובץ, "text": טקסט})
+        רשומה = קטלוג.get(שם_קובץ)
+        if רשומה is None:
+            תוצאה["new"].append(שם_קובץ)
+            continue
 
-    return תוצאות
+        מצב = os.stat(נתיב_מלא)
+        if רשומה["file_size"] == מצב.st_size and רשומה["file_mtime"] == מצב.st_mtime:
+            תוצאה["unchanged"].append(שם_קובץ)
+        elif רשומה["content_hash"] == file_sha256(נתיב_מלא):
+            קטלוג.set_file_stat(שם_קובץ, מצב.st_size, מצב.st_mtime)
+            תוצאה["unchanged"].append(שם_קובץ)
+        else:
+            תוצאה["changed"].append(שם_קובץ)
+    return תוצאה
 
 
 def split_text(text: str, source_name: str, chunk_size: int = 1500, overlap: int = 200) -> list[dict]:
@@ -308,11 +1026,8 @@ def save_to_chromadb(chunks: list[dict]) -> None:
     שומר חלקים ל-ChromaDB באוסף 'pdf_collection'.
     מניח שהחלקים שמועברים הם רק קבצים חדשים (לא קיימים).
     """
-    # פותח את מסד הנתונים המקומי
-    לקוח = chromadb.PersistentClient(path="chroma_db")
-
-    # מקבל או יוצר את האוסף מבלי למחוק נתונים קיימים
-    אוסף = לקוח.get_or_create_collection(name="pdf_collection")
+    # האוסף המשותף – נוצר אם אינו קיים, מבלי למחוק נתונים קיימים
+    אוסף = get_store().collection
 
     # מכין את הנתונים להכנסה מרוכזת
     מזהים = []
@@ -326,48 +1041,45 @@ def save_to_chromadb(chunks: list[dict]) -> None:
         מטא_דאטה.append({"source": חלק["source"], "chunk_index": חלק["chunk_index"]})
 
     # שומר את כל החלקים בבת אחת
-    אוסף.add(ids=מזהים, documents=מסמכים, metadatas=מטא_דאטה)
+    וקטורים = get_embedder().embed(מסמכים)
+    with get_store().bm25.writing():
+        אוסף.add(
+            ids=מזהים,
+            embeddings=וקטורים,
+            documents=מסמכים,
+            metadatas=מטא_דאטה,
+        )
+        get_store().bm25.add_chunks([
+            (מזהה, חלק["source"], חלק["text"]) for מזהה, חלק in zip(מזהים, chunks)
+        ])
+    ספירות: dict[str, tuple[int, int]] = {}
+    for חלק in chunks:
+        n, _ = ספירות.get(חלק["source"], (0, 0))
+        ספירות[חלק["source"]] = (n + 1, 0)
+    get_store().catalog.add_chunks(ספירות)
 
 
 def get_existing_sources() -> set:
     """
     מחזיר קבוצה של שמות הקבצים שכבר נידקסו ב-ChromaDB.
-    משתמשת במטאדאטה של הרשומות הקיימות.
+    נקרא מקטלוג המקורות – לא סורק את המטא של ה-chunks.
     """
-    לקוח = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח.get_or_create_collection(name="pdf_collection")
-
-    # משיג את כל המטאדאטה הקיימת במסד הנתונים
-    תוצאות = אוסף.get(include=["metadatas"])
-
-    # אוסף שמות ייחודיים לקבוצה
-    שמות_קיימים = {m["source"] for m in תוצאות["metadatas"]}
-    return שמות_קיימים
+    return get_store().catalog.names()
 
 
 def list_sources() -> None:
     """
-    מדפיסה כמה chunks יש מכל קובץ ב-ChromaDB.
+    מדפיסה כמה chunks (ועמודים) יש מכל קובץ ב-ChromaDB – מתוך קטלוג המקורות.
     שימושית לבדיקה שכל המסמכים נטענו בהצלחה.
     """
-    לקוח = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח.get_or_create_collection(name="pdf_collection")
-
-    # שולף את כל המטאדאטה מהאוסף
-    תוצאות = אוסף.get(include=["metadatas"])
-
-    # סופר chunks לפי קובץ
-    ספירת_חלקים: dict[str, int] = {}
-    for מטא in תוצאות["metadatas"]:
-        שם = מטא["source"]
-        ספירת_חלקים[שם] = ספירת_חלקים.get(שם, 0) + 1
+    רשומות = get_store().catalog.list()
 
     print("\n--- מקורות ב-ChromaDB ---")
-    if not ספירת_חלקים:
+    if not רשומות:
         print("אין מסמכים שמורים עדיין.")
     else:
-        for שם_קובץ, מספר_חלקים in sorted(ספירת_חלקים.items()):
-            print(f"  {שם_קובץ}: {מספר_חלקים} חלקים")
+        for רשומה in רשומות:
+            print(f"  {רשומה['source']}: {רשומה['chunk_count']} חלקים, {רשומה['page_count']} עמודים")
 
 
 def delete_source(source_name: str) -> int:
@@ -375,126 +1087,242 @@ def delete_source(source_name: str) -> int:
     מוחק את כל ה-chunks של קובץ ספציפי מ-ChromaDB.
     מחזיר את מספר ה-chunks שנמחקו.
     """
-    לקוח = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח.get_or_create_collection(name="pdf_collection")
+    אוסף = get_store().collection
 
-    # שולף את מזהי כל ה-chunks של הקובץ
-    תוצאות = אוסף.get(where={"source": source_name}, include=["metadatas"])
+    # שולף רק את מזהי ה-chunks של הקובץ (ללא מטא)
+    תוצאות = אוסף.get(where={"source": source_name}, include=[])
     מזהים = תוצאות["ids"]
 
     if not מזהים:
         return 0
 
-    # מוחק את כולם בבת אחת
-    אוסף.delete(ids=מזהים)
+    # מוחק את כולם בבת אחת – גם מאינדקס ה-BM25 וממאגר העמודים
+    with get_store().bm25.writing():
+        אוסף.delete(ids=מזהים)
+        get_store().bm25.delete_source(source_name)
+    get_store().pages.delete_source(source_name)
+    get_store().catalog.delete_source(source_name)
     return len(מזהים)
 
 
-def hybrid_search(
-    question_en: str,
+def adaptive_semantic_n(n_results: int, relevant: int, total: int) -> int:
+    """
+    מספר התוצאות לבקש מהחיפוש הסמנטי: n_results בלי סינון, ועד פי 1/חלק_נבחר עם סינון
+    (לכל היותר SEMANTIC_MAX_RESULTS, ולא יותר ממספר ה-chunks הרלוונטיים).
+    """
+    if relevant <= 0:
+        return 0
+    חלק = relevant / max(total, relevant)
+    מורחב = int(n_results / max(חלק, n_results / SEMANTIC_MAX_RESULTS))
+    return min(relevant, max(n_results, מורחב))
+
+
+def rrf_fuse(
+    bm25_ids: list[str],
+    semantic_ids: list[str],
+    k_rrf: int = 60,
+    n_results: int = 20,
+    bm25_ranks: dict[str, int] | None = None,
+) -> tuple[list[str], dict[str, float]]:
+    """
+    Reciprocal Rank Fusion (50/50) של שני דירוגים, על מערכי NumPy:
+    ציון = 0.5/(דרגה_BM25 + k) + 0.5/(דרגה_סמנטית + k). מחזיר (top n_results ממוינים,
+    {id: ציון} שלהם).
+    bm25_ids: ראש דירוג ה-BM25 (top n_results מספיק); bm25_ranks: הדרגה המלאה ב-BM25
+    של chunks סמנטיים שמחוץ לראש הזה (BM25Index.rank_many).
+    בשוויון – לפי הדרגה ב-BM25 ואז הסדר הסמנטי, כמו מיון יציב על dict של הדירוג המלא.
+    """
+    bm25_ranks = bm25_ranks or {}
+    מזהים = list(dict.fromkeys([*bm25_ids, *semantic_ids]))
+    # דרגת BM25 לכל מזהה; -1 = אין לו ציון BM25 (רק סמנטי)
+    דרגות_bm25 = np.array(
+        [i if i < len(bm25_ids) else bm25_ranks.get(m, -1) for i, m in enumerate(מזהים)],
+        dtype=np.int64,
+    )
+    יש_bm25 = דרגות_bm25 >= 0
+    מיקום = {m: i for i, m in enumerate(מזהים)}
+    אינדקסים_סם = np.fromiter((מיקום[m] for m in semantic_ids), dtype=np.int64, count=len(semantic_ids))
+
+    # תרומת BM25 (50%) ואז סמנטיקה (50%) – אותו סדר חיבור כמו בצבירה ל-dict
+    ציונים = np.zeros(len(מזהים))
+    ציונים[יש_bm25] += 0.5 / (דרגות_bm25[יש_bm25] + k_rrf)
+    ציונים[אינדקסים_סם] += 0.5 / (np.arange(len(semantic_ids)) + k_rrf)
+
+    # סדר הכנסה לשוויון: דרגת BM25; סמנטיים בלבד – אחרי כולם, לפי הסדר הסמנטי
+    סוף = int(דרגות_bm25.max(initial=0)) + 1
+    סדר_הכנסה = np.where(יש_bm25, דרגות_bm25, סוף + np.arange(len(מזהים)))
+    סדר = ranked_order(ציונים, סדר_הכנסה, n_results)
+    return [מזהים[i] for i in סדר], {מזהים[i]: float(ציונים[i]) for i in סדר}
+
+
+def hybrid_search_multi(
+    queries: list[str],
     collection,
     filter_source: str | list[str] | None = None,
     n_results: int = 20,
     k_rrf: int = 60,
-) -> tuple[list[str], list[str]]:
+    include_full_pages: bool = True,
+) -> tuple[list[tuple], list[dict]]:
     """
-    מחזיר (texts, sources) באמצעות Hybrid Search:
-    - BM25 על כל ה-chunks
-    - חיפוש סמנטי ב-ChromaDB
-    - שילוב 50/50 באמצעות Reciprocal Rank Fusion
+    Hybrid Search לכמה גרסאות שאילתה בבת אחת:
+    - BM25 לכל השאילתות במעבר אחד על האינדקס ההפוך (BM25Index.search_many)
+    - חיפוש סמנטי אחד ב-ChromaDB עם כל השאילתות (embedding באצווה דרך get_embedder, עם מטמון)
+    - RRF 50/50 לכל שאילתה בנפרד, ושליפה אחת של התוכן לאיחוד ה-chunks הנבחרים
+    מחזיר (לכל_שאילתה, מיטב_לפי_עמוד):
+      לכל_שאילתה: רשימה, לכל שאילתה (texts, sources, scores, pages, full_pages) – כמו hybrid_search
+      מיטב_לפי_עמוד: [{"ציון", "chunk", "source", "page"(, "full")}] – הציון הגבוה ביותר
+                     לכל (source, page) מכל השאילתות, ממוין בסדר יורד
     filter_source: None = כל המסמכים | str = מסמך אחד | list[str] = מסמכים נבחרים
+    include_full_pages=False: full_pages ריק – הקורא שולף עמודים מלאים
+    (fetch_full_pages) רק עבור העמודים שנבחרו בסוף.
     """
     # בניית פילטר ChromaDB – תמיכה במסמך יחיד, רשימה, או ללא סינון
     if filter_source is None:
         where_filter = None
+        מקורות_לסינון = None
     elif isinstance(filter_source, list):
         where_filter = {"source": {"$in": filter_source}}
+        מקורות_לסינון = filter_source
     else:
         where_filter = {"source": filter_source}
-
-    # שלף את כל ה-chunks הרלוונטיים
-    כל_הביאה = collection.get(
+        מקורות_לסינון = [filter_source]
+
+    # האינדקס נבנה מהאוסף רק אם אינו מסונכרן (פעם ראשונה / אחרי תקלה). פער בזמן אינדוקס
+    # ברקע לא גורם לבנייה מחדש – כל כתיבה מסומנת ב-bm25.writing() עד ששני המאגרים עודכנו
+    אינדקס = get_store().bm25
+    אינדקס.ensure_synced(collection)
+    סה_כ_רלוונטיים = אינדקס.count(מקורות_לסינון)
+
+    if not queries or not סה_כ_רלוונטיים:
+        return [([], [], [], [], []) for _ in queries], []
+
+    # --- חיפוש סמנטי ב-ChromaDB: קריאה אחת לכל השאילתות ---
+    # הסינון (where) מוחל בתוך ChromaDB לפני הדירוג. כשהוא סלקטיבי, n_results גדל
+    # ביחס הפוך לחלק של המסמכים הנבחרים – כדי שהמועמדים הסמנטיים לא יידללו ב-RRF
+    n_sem = adaptive_semantic_n(n_results, סה_כ_רלוונטיים, אינדקס.count())
+    embedder = get_embedder()
+    מודל_האוסף = collection_embedding_model()
+    if מודל_האוסף != embedder.model_name:
+        print(f"  ⚠️ האוסף נבנה עם {מודל_האוסף} – "
+              f"השאילתה מקודדת עם {embedder.model_name}, התוצאות הסמנטיות לא אמינות")
+    תוצאות_סם = collection.query(
+        query_embeddings=embedder.embed(queries),
+        n_results=n_sem,
         where=where_filter,
-        include=["documents", "metadatas"],
+        include=[],  # רק המזהים – התוכן נשלף פעם אחת למטה, לאיחוד הנבחרים
     )
-    כל_טקסטים = כל_הביאה["documents"]
-    כל_מטא     = כל_הביאה["metadatas"]
-    כל_מזהים  = כל_הביאה["ids"]
 
-    if not כל_טקסטים:
-        return [], [], [], [], []
+    # --- BM25 מהאינדקס ההפוך: top n_results לכל שאילתה + הדרגה של התוצאות הסמנטיות ---
+    # מספיק: chunk שמחוץ ל-top n של BM25 ואינו ברשימה הסמנטית מקבל ציון RRF נמוך ממש
+    # מכל n הראשונים של BM25, ולכן לא יכול להיכנס ל-top n_results הסופי
+    דירוגי_bm25 = אינדקס.rank_many(
+        queries, sources=מקורות_לסינון, top_k=n_results, extra_ids=תוצאות_סם["ids"]
+    )
+
+    # --- Reciprocal Rank Fusion (50/50) לכל שאילתה ---
+    דירוגי_rrf = [
+        rrf_fuse([מזהה for מזהה, _ in דירוג_bm25], מזהיים_סם, k_rrf, n_results, דרגות_bm25)
+        for (דירוג_bm25, דרגות_bm25), מזהיים_סם in zip(דירוגי_bm25, תוצאות_סם["ids"])
+    ]
 
-    # מיפוי id -> (chunk_text, source, page_number, full_page_content)
+    # שליפת התוכן פעם אחת לאיחוד ה-chunks הנבחרים – לא כל האוסף
+    איחוד = list(dict.fromkeys(מזהה for מזהיים, _ in דירוגי_rrf for מזהה in מזהיים))
+    נשלפו = collection.get(ids=איחוד, include=["documents", "metadatas"])
+    # מיפוי id -> (chunk_text, source, page_number)
     מזהה_לתוכן = {
-        כל_מזהים[i]: (
-            כל_טקסטים[i],
-            כל_מטא[i]["source"],
-            כל_מטא[i].get("page_number", כל_מטא[i].get("chunk_index", 0) + 1),
-            כל_מטא[i].get("full_page_content", כל_טקסטים[i]),  # fallback: החזר chunk עצמו
+        מזהה: (
+            טקסט,
+            מטא["source"],
+            מטא.get("page_number", מטא.get("chunk_index", 0) + 1),
         )
-        for i in range(len(כל_מזהים))
+        for מזהה, טקסט, מטא in zip(נשלפו["ids"], נשלפו["documents"], נשלפו["metadatas"])
     }
 
-    # --- BM25 על כל ה-chunks ---
-    קורפוס_מטוקנן = [ט.lower().split() for ט in כל_טקסטים]
-    bm25 = BM25Okapi(קורפוס_מטוקנן)
-    שאילתא_מטוקננת = question_en.lower().split()
-    ציוני_bm25 = bm25.get_scores(שאילתא_מטוקננת)
-
-    # מיון BM25 לפי ציון יורד
-    סדר_bm25 = sorted(range(len(כל_טקסטים)), key=lambda i: ציוני_bm25[i], reverse=True)
+    # עמודים מלאים ממאגר העמודים – פעם אחת לכל העמודים של כל השאילתות
+    עמודים_מלאים: dict[tuple[str, int], str] = {}
+    if include_full_pages:
+        עמודים_מלאים = fetch_full_pages(
+            [(מקור, עמוד) for _, מקור, עמוד in מזהה_לתוכן.values()], collection
+        )
 
-    # --- חיפוש סמנטי ב-ChromaDB: מספר תוצאות דינמי לפי n_results ---
-    n_sem = min(n_results, len(כל_טקסטים))
-    תוצאות_סם = collection.query(
-        query_texts=[question_en],
-        n_results=n_sem,
-        where=where_filter,
-    )
-    מזהיים_סם = תוצאות_סם["ids"][0]
-
-    # --- Reciprocal Rank Fusion (50/50) ---
-    ציוני_rrf: dict[str, float] = {}
-
-    # תרומת BM25 (50%)
-    for דרגה, אי in enumerate(סדר_bm25):
-        מזהה = כל_מזהים[אי]
-        ציוני_rrf[מזהה] = ציוני_rrf.get(מזהה, 0.0) + 0.5 / (דרגה + k_rrf)
-
-    # תרומת סמנטיקה (50%)
-    for דרגה, מזהה in enumerate(מזהיים_סם):
-        ציוני_rrf[מזהה] = ציוני_rrf.get(מזהה, 0.0) + 0.5 / (דרגה + k_rrf)
-
-    # מיון סופי ובחירת top n_results
-    מזהיים_מוויינים = sorted(ציוני_rrf, key=ציוני_rrf.__getitem__, reverse=True)[:n_results]
-
-    # בונה את רשימות התוצאות
-    טקסטים_סופיים  = []
-    מקורות_סופיים  = []
-    עמודים_סופיים  = []
-    פול_סופיים    = []  # full_page_content
-    for מזהה in מזהיים_מוויינים:
-        if מזהה in מזהה_לתוכן:
-            טקסט, מקור, עמוד, פול = מזהה_לתוכן[מזהה]
+    לכל_שאילתה = []
+    מיטב_לפי_עמוד: dict[tuple, dict] = {}
+    for מזהיים_מוויינים, ציוני_rrf in דירוגי_rrf:
+        # בונה את רשימות התוצאות
+        טקסטים_סופיים  = []
+        מקורות_סופיים  = []
+        ציוני_סופיים   = []
+        עמודים_סופיים  = []
+        פול_סופיים    = []  # full_page_content – fallback: החזר chunk עצמו
+        for מזהה in מזהיים_מוויינים:
+            if מזהה not in מזהה_לתוכן:
+                continue
+            טקסט, מקור, עמוד = מזהה_לתוכן[מזהה]
+            ציון = ציוני_rrf[מזהה]
             טקסטים_סופיים.append(טקסט)
             מקורות_סופיים.append(מקור)
+            ציוני_סופיים.append(ציון)
             עמודים_סופיים.append(עמוד)
-            פול_סופיים.append(פול)
+            if include_full_pages:
+                פול_סופיים.append(עמודים_מלאים.get((מקור, עמוד), טקסט))
+
+            # מיזוג לפי מפתח (source, page) – שומר ציון RRF גבוה ביותר מכל הגרסאות
+            מפתח = (מקור, עמוד)
+            if מפתח not in מיטב_לפי_עמוד or ציון > מיטב_לפי_עמוד[מפתח]["ציון"]:
+                מיטב_לפי_עמוד[מפתח] = {"ציון": ציון, "chunk": טקסט, "source": מקור, "page": עמוד}
+                if include_full_pages:
+                    מיטב_לפי_עמוד[מפתח]["full"] = עמודים_מלאים.get(מפתח, טקסט)
 
-    ציוני_סופיים = [ציוני_rrf[מיד] for מיד in מזהיים_מוויינים if מיד in מזהה_לתוכן]
-    return טקסטים_סופיים, מקורות_סופיים, ציוני_סופיים, עמודים_סופיים, פול_סופיים
+        לכל_שאילתה.append(
+            (טקסטים_סופיים, מקורות_סופיים, ציוני_סופיים, עמודים_סופיים, פול_סופיים)
+        )
 
+    ממוין = sorted(מיטב_לפי_עמוד.values(), key=lambda x: x["ציון"], reverse=True)
+    return לכל_שאילתה, ממוין
 
-def debug_search(question: str, filter_source: str | None = None) -> None:
+
+def hybrid_search(
+    question_en: str,
+    collection,
+    filter_source: str | list[str] | None = None,
+    n_results: int = 20,
+    k_rrf: int = 60,
+    include_full_pages: bool = True,
+) -> tuple[list[str], list[str], list[float], list[int], list[str]]:
     """
-    מצב DEBUG: מתרגם את השאלה, מריץ hybrid_search,
-    ומדפיס את כל ה-chunks שנשלפו עם ציוני RRF שלהם.
+    מחזיר (texts, sources, scores, pages, full_pages) באמצעות Hybrid Search לשאילתה אחת:
+    - BM25 מהאינדקס ההפוך השמור (bm25_index) – רק chunks שמכילים מונח מהשאילתה
+    - חיפוש סמנטי ב-ChromaDB
+    - שילוב 50/50 באמצעות Reciprocal Rank Fusion
+    עטיפה של hybrid_search_multi עם שאילתה יחידה.
     """
-    לקוח_anthropic = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    לכל_שאילתה, _ = hybrid_search_multi(
+        [question_en], collection,
+        filter_source=filter_source,
+        n_results=n_results,
+        k_rrf=k_rrf,
+        include_full_pages=include_full_pages,
+    )
+    return לכל_שאילתה[0]
+
 
-    # תרגום מקצועי-הנדסי לאנגלית (זהה לשלב 1 ב-search_and_answer)
+def get_query_cache() -> DiskCache:
+    """מטמון LRU/TTL לתרגום + הרחבת שאילתה – מפתח: השאלה המנורמלת."""
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = DiskCache("query_rewrite", max_entries=5_000, ttl=QUERY_CACHE_TTL)
+    return _query_cache
+
+
+def _normalize_question(question: str) -> str:
+    """נרמול לצורך מפתח המטמון: רווחים, אותיות קטנות, סימני פיסוק בקצוות."""
+    return " ".join(question.casefold().split()).strip(" ?!.,;:")
+
+
+def _translate_query(לקוח_anthropic, question: str) -> str:
+    """תרגום מקצועי-הנדסי לאנגלית לשיפור החיפוש הסמנטי."""
     תגובת_תרגום = לקוח_anthropic.messages.create(
-        model="claude-haiku-4-5-20251001",
+        model=REWRITE_MODEL,
         max_tokens=256,
         messages=[{
             "role": "user",
@@ -510,11 +1338,116 @@ def debug_search(question: str, filter_source: str | None = None) -> None:
             ),
         }],
     )
-    שאלה_באנגלית = תגובת_תרגום.content[0].text.strip()
+    return תגובת_תרגום.content[0].text.strip()
+
+
+def _expand_query(לקוח_anthropic, question_en: str) -> list[str]:
+    """הרחבת שאילתה – עד 2 גרסאות אנגלית נוספות (יחידות מקוצרות / מונחים מורחבים)."""
+    תגובת_הרחבה = לקוח_anthropic.messages.create(
+        model=REWRITE_MODEL,
+        max_tokens=200,
+        messages=[{
+            "role": "user",
+            "content": (
+                "Generate 2 alternative English search queries for the following question. "
+                "Query 1: use abbreviated technical units (e.g. 'mio m3', 'MCM', 'million m3', 'Mm3'). "
+                "Query 2: use expanded descriptive terms (e.g. 'million cubic meters', 'storage capacity', 'total volume'). "
+                "Return ONLY the 2 queries, one per line, no numbering or explanation.\n\n"
+                f"Original query: {question_en}"
+            ),
+        }],
+    )
+    return [
+        ש.strip()
+        for ש in תגובת_הרחבה.content[0].text.strip().splitlines()
+        if ש.strip()
+    ][:2]  # מקסימום 2 גרסאות נוספות
+
+
+def _rewrite_query_single_call(לקוח_anthropic, question: str) -> tuple[str, list[str]] | None:
+    """
+    תרגום + הרחבה בקריאה אחת: המודל מחזיר JSON עם התרגום ו-2 הגרסאות החלופיות.
+    חוסך round-trip שלם לפני החיפוש. מחזיר None אם התשובה לא ניתנת לפענוח.
+    """
+    תגובה = לקוח_anthropic.messages.create(
+        model=REWRITE_MODEL,
+        max_tokens=400,
+        messages=[{
+            "role": "user",
+            "content": (
+                "Rewrite the following technical query for an engineering document search.\n"
+                "1. translation: translate it to professional engineering English. "
+                "Use accurate engineering terminology. Examples: "
+                "שנאים→Transformers, משאבות→Pumps, צינורות→Pipes/Conduits, מאגר→Reservoir, "
+                "תחנת שאיבה→Pumping Station, קוטר→Diameter, לחץ→Pressure, ספיקה→Flow Rate, "
+                "מנהרה→Tunnel, סכר→Dam, מפעל מים→Water Treatment Plant, "
+                "מחולל→Generator, לוח חשמל→Switchboard, כבל→Cable, עמוד→Pole/Column.\n"
+                "2. alternatives: 2 alternative English search queries for the translation. "
+                "Query 1: use abbreviated technical units (e.g. 'mio m3', 'MCM', 'million m3', 'Mm3'). "
+                "Query 2: use expanded descriptive terms (e.g. 'million cubic meters', 'storage capacity', 'total volume').\n"
+                'Return ONLY a JSON object: {"translation": "...", "alternatives": ["...", "..."]}\n\n'
+                f"Question: {question}"
+            ),
+        }],
+    )
+    טקסט = תגובה.content[0].text
+    try:
+        נתונים = json.loads(טקסט[טקסט.index("{"):טקסט.rindex("}") + 1])
+    except ValueError:
+        return None
+    תרגום = נתונים.get("translation") if isinstance(נתונים, dict) else None
+    גרסאות = נתונים.get("alternatives") if isinstance(נתונים, dict) else None
+    if not isinstance(תרגום, str) or not תרגום.strip() or not isinstance(גרסאות, list):
+        return None
+    return תרגום.strip(), [ג.strip() for ג in גרסאות if isinstance(ג, str) and ג.strip()][:2]
+
+
+def rewrite_query(לקוח_anthropic, question: str, expand: bool = True) -> tuple[str, list[str]]:
+    """
+    מחזיר (שאלה_באנגלית, גרסאות_נוספות) – דרך מטמון התרגום/הרחבה.
+    פגיעה במטמון חוסכת את קריאות ה-LLM שלפני החיפוש; החטאה – קריאה משולבת אחת
+    (_rewrite_query_single_call), ואם התשובה לא תקינה – המסלול הישן: תרגום ואז הרחבה.
+    expand=False: תרגום בלבד (debug_search) – רשומה נפרדת במטמון (מפתח אחר), כדי שתרגום
+    ללא גרסאות לא יוחזר לשאילתה שצריכה אותן.
+    """
+    מטמון = get_query_cache()
+    מפתח = content_key(
+        REWRITE_PROMPT_VERSION, REWRITE_MODEL, "expand" if expand else "translate",
+        _normalize_question(question),
+    )
+    שמור = מטמון.get(מפתח)
+    if שמור is not None:
+        סטטוס = "HIT"
+        שאלה_באנגלית, גרסאות = שמור["en"], שמור["variants"]
+    else:
+        סטטוס = "MISS"
+        משולב = _rewrite_query_single_call(לקוח_anthropic, question) if expand else None
+        if משולב is not None:
+            שאלה_באנגלית, גרסאות = משולב
+        else:
+            if expand:
+                סטטוס = "MISS, two-step fallback"
+            שאלה_באנגלית = _translate_query(לקוח_anthropic, question)
+            גרסאות = _expand_query(לקוח_anthropic, שאלה_באנגלית) if expand else []
+        מטמון.set(מפתח, {"en": שאלה_באנגלית, "variants": גרסאות})
+
+    סטט = מטמון.stats()
+    print(f"[CHECK] Query cache: {סטטוס} (hit rate {סטט['hit_rate']:.0%}, {סטט['entries']} entries)")
+    return שאלה_באנגלית, גרסאות
+
+
+def debug_search(question: str, filter_source: str | None = None) -> None:
+    """
+    מצב DEBUG: מתרגם את השאלה, מריץ hybrid_search,
+    ומדפיס את כל ה-chunks שנשלפו עם ציוני RRF שלהם.
+    """
+    לקוח_anthropic = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+
+    # תרגום מקצועי-הנדסי לאנגלית (זהה לשלב 1 ב-search_and_answer, כולל המטמון)
+    שאלה_באנגלית, _ = rewrite_query(לקוח_anthropic, question, expand=False)
 
     # חיפוש hybrid
-    לקוח_chroma = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח_chroma.get_or_create_collection(name="pdf_collection")
+    אוסף = get_store().collection
     טקסטים, מקורות, ציונים, עמודים, _ = hybrid_search(
         question_en=שאלה_באנגלית,
         collection=אוסף,
@@ -539,151 +1472,136 @@ def debug_search(question: str, filter_source: str | None = None) -> None:
     print(f"{'='*60}\n")
 
 
-def search_and_answer(
+def log_usage(stage: str, model: str, usage, extra: dict | None = None) -> dict:
+    """
+    רושם שורת JSON ליומן השימוש (USAGE_LOG_PATH) ומחזיר אותה:
+    input / output tokens, ו-cache_read / cache_write של ה-prompt caching.
+    extra: שדות נוספים לרשומה (למשל history_tokens).
+    """
+    רשומה = {
+        "time": time.time(),
+        "stage": stage,
+        "model": model,
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        **(extra or {}),
+    }
+    print(
+        f"[CHECK] Tokens ({stage}): input={רשומה['input_tokens']} "
+        f"cache_read={רשומה['cache_read_tokens']} cache_write={רשומה['cache_write_tokens']} "
+        f"output={רשומה['output_tokens']}"
+    )
+    with _usage_log_lock:
+        os.makedirs(os.path.dirname(USAGE_LOG_PATH), exist_ok=True)
+        with open(USAGE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(רשומה, ensure_ascii=False) + "\n")
+    return רשומה
+
+
+def search_and_answer_stream(
     question: str,
     history: list[tuple[str, str]] | None = None,
     filter_source: str | list[str] | None = None,
-) -> str:
+    client=None,
+    history_summary: str = "",
+):
     """
-    מתרגם את השאלה לאנגלית, מחפש ב-ChromaDB את 15 החלקים הרלוונטיים,
-    ושולח אותם יחד עם השאלה המקורית והיסטוריית השיחה ל-Anthropic API.
-    history: רשימה של (שאלה, תשובה) מהסבבים הקודמים.
+    גרסת generator של search_and_answer: מחזירה אירועים (סוג, ערך) בזמן שהם קורים.
+    ("stage", שלב) – התקדמות השליפה: "rewrite" → "search" → "rerank" → "answer"
+    ("token", טקסט) – קטעי התשובה כפי שהם מגיעים מ-Claude (messages.stream)
+    ("usage", רשומה) – בסוף: שימוש הטוקנים של הבקשה, כפי שנרשם ב-log_usage
+    history: רשימה של (שאלה, תשובה) מהסבבים הקודמים שנשלחים כלשונם.
     filter_source: None=כל המסמכים | str=מסמך אחד | list[str]=מסמכים נבחרים
+    client: לקוח בממשק anthropic.Anthropic – ברירת מחדל לקוח אמיתי (אפשר להזריק stub).
+    history_summary: סיכום הסבבים הישנים יותר (ChatHistory.snapshot) – נשלח כבלוק system.
     """
     # 🥚 Easter egg – תשובה קשיחה לשאלה הכי חשובה בפרויקט (עברית ואנגלית)
     q = question.lower()
     _he = "מנהל" in question and ("הכי טוב" in question or "הטוב ביותר" in question)
     _en = "manager" in q and "best" in q
     if _he:
-        return "ברור שמאיר אזרד 🏆"
+        yield ("token", "ברור שמאיר אזרד 🏆")
+        return
     if _en:
-        return "Of Course Meir Azerad 🏆"
-
-    לקוח_anthropic = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        yield ("token", "Of Course Meir Azerad 🏆")
+        return
 
-    # --- שלב 1: תרגום מקצועי-הנדסי לאנגלית לשיפור החיפוש הסמנטי ---
-    תגובת_תרגום = לקוח_anthropic.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=256,
-        messages=[{
-            "role": "user",
-            "content": (
-                "Translate the following technical query to professional engineering English. "
-                "Use accurate engineering terminology. Examples: "
-                "שנאים→Transformers, משאבות→Pumps, צינורות→Pipes/Conduits, מאגר→Reservoir, "
-                "תחנת שאיבה→Pumping Station, קוטר→Diameter, לחץ→Pressure, ספיקה→Flow Rate, "
-                "מנהרה→Tunnel, סכר→Dam, מפעל מים→Water Treatment Plant, "
-                "מחולל→Generator, לוח חשמל→Switchboard, כבל→Cable, עמוד→Pole/Column. "
-                "Return ONLY the translated query, no explanation.\n\n"
-                f"Question: {question}"
-            ),
-        }],
-    )
-    שאלה_באנגלית = תגובת_תרגום.content[0].text.strip()
+    לקוח_anthropic = client or anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
 
-    # --- שלב 1.5: הרחבת שאילתה – 2 גרסאות אנגלית נוספות ---
-    תגובת_הרחבה = לקוח_anthropic.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=200,
-        messages=[{
-            "role": "user",
-            "content": (
-                "Generate 2 alternative English search queries for the following question. "
-                "Query 1: use abbreviated technical units (e.g. 'mio m3', 'MCM', 'million m3', 'Mm3'). "
-                "Query 2: use expanded descriptive terms (e.g. 'million cubic meters', 'storage capacity', 'total volume'). "
-                "Return ONLY the 2 queries, one per line, no numbering or explanation.\n\n"
-                f"Original query: {שאלה_באנגלית}"
-            ),
-        }],
-    )
-    גרסאות_נוספות = [
-        ש.strip()
-        for ש in תגובת_הרחבה.content[0].text.strip().splitlines()
-        if ש.strip()
-    ][:2]  # מקסימום 2 גרסאות נוספות
+    # --- שלב 1: תרגום מקצועי-הנדסי לאנגלית + הרחבה ל-2 גרסאות נוספות (דרך המטמון) ---
+    yield ("stage", "rewrite")
+    שאלה_באנגלית, גרסאות_נוספות = rewrite_query(לקוח_anthropic, question)
     כל_שאילתות = [שאלה_באנגלית] + גרסאות_נוספות
 
     # --- שלב 2: Hybrid Search על כל גרסאות השאילתה + מיזוג תוצאות ---
-    לקוח_chroma = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח_chroma.get_or_create_collection(name="pdf_collection")
+    yield ("stage", "search")
+    אוסף = get_store().collection
 
-    # מיזוג לפי מפתח (source, page) – שומר ציון RRF גבוה ביותר מכל הגרסאות
-    מיטב_לפי_עמוד: dict[tuple, dict] = {}
+    # חיפוש אחד לכל הגרסאות: embedding באצווה + BM25 במעבר אחד,
+    # ומיזוג לפי (source, page) – ציון RRF הגבוה ביותר מכל הגרסאות
+    _, ממוין_ראשוני = hybrid_search_multi(
+        כל_שאילתות,
+        collection=אוסף,
+        filter_source=filter_source,
+        n_results=50,  # top_k מוגדל ל-50 לרשת רחבה יותר
+        include_full_pages=False,  # עמודים מלאים נשלפים רק למועמדים הסופיים
+    )
 
-    for שאילתה_רחבה in כל_שאילתות:
-        _, מקורות_q, ציונים_q, עמודים_q, פולים_q = hybrid_search(
-            question_en=שאילתה_רחבה,
-            collection=אוסף,
-            filter_source=filter_source,
-            n_results=50,  # top_k מוגדל ל-50 לרשת רחבה יותר
-        )
-        for מקור, ציון, עמוד, פול in zip(מקורות_q, ציונים_q, עמודים_q, פולים_q):
-            מפתח = (מקור, עמוד)
-            if מפתח not in מיטב_לפי_עמוד or ציון > מיטב_לפי_עמוד[מפתח]["ציון"]:
-                מיטב_לפי_עמוד[מפתח] = {
-                    "ציון": ציון,
-                    "full": פול,
-                    "source": מקור,
-                    "page": עמוד,
-                }
-
-    # --- שלב 2.5: Reranking עם Cohere (אם זמין) או מיון RRF רגיל ---
-    MAX_PAGES = 10       # עמודים שמגיעים ל-Claude בסופו של דבר
-    RERANK_WINDOW = 100  # עמודים מקסימליים שנשלחים ל-Cohere לדירוג
-    ממוין_ראשוני = sorted(מיטב_לפי_עמוד.values(), key=lambda x: x["ציון"], reverse=True)
-
-    _cohere_key = os.environ.get("COHERE_API_KEY")
-    print(f"[CHECK] Cohere API Key detected: {'YES' if _cohere_key else 'NO'}")
-
-    if _COHERE_AVAILABLE and _cohere_key:
-        print("[CHECK] Reranker Status: ACTIVE (Using Cohere)")
-        # Reranking: שולח עד RERANK_WINDOW עמודים ל-Cohere, מקבל חזרה MAX_PAGES
-        co = _cohere.ClientV2(api_key=_cohere_key)
-        מועמדים_לrerank = ממוין_ראשוני[:RERANK_WINDOW]
-        תגובת_rerank = co.rerank(
-            model="rerank-v3.5",
-            query=שאלה_באנגלית,
-            documents=[item["full"][:1500] for item in מועמדים_לrerank],
-            top_n=min(MAX_PAGES, len(מועמדים_לrerank)),
-        )
-        ממוין = [
-            {**מועמדים_לrerank[r.index], "cohere_score": r.relevance_score}
-            for r in תגובת_rerank.results
-        ]
+    # --- שלב 2.5: Reranking (Cohere / מקומי, לפי get_reranker) או מיון RRF רגיל ---
+    yield ("stage", "rerank")
+    MAX_PAGES = 15       # מועמדים לאריזה – כמה מהם נכנסים נקבע לפי CONTEXT_TOKEN_BUDGET
+    RERANK_WINDOW = 100  # עמודים מקסימליים שנשלחים ל-reranker
+
+    reranker = get_reranker()
+    print(f"[CHECK] Reranker Status: {reranker.name if reranker else 'INACTIVE (Fallback to RRF)'}")
+
+    # שליפת עמודים מלאים רק למועמדים שימשיכו הלאה (חלון ה-rerank או MAX_PAGES)
+    מועמדים = ממוין_ראשוני[:RERANK_WINDOW if reranker else MAX_PAGES]
+    עמודים_מלאים = fetch_full_pages([(i["source"], i["page"]) for i in מועמדים], אוסף)
+    for item in מועמדים:
+        item["full"] = עמודים_מלאים.get((item["source"], item["page"]), item["chunk"])
+
+    if reranker:
+        # Reranking: עד RERANK_WINDOW עמודים, ציונים ממטמון או באצווה אחת, חוזרים MAX_PAGES
+        ממוין = reranker.rerank(שאלה_באנגלית, מועמדים, top_n=MAX_PAGES)
         for i, item in enumerate(ממוין, 1):
-            print(f"  [{i:02d}] Cohere={item['cohere_score']:.4f} | עמוד {item['page']} | {item['source']}")
+            print(f"  [{i:02d}] Rerank={item['rerank_score']:.4f} | עמוד {item['page']} | {item['source']}")
     else:
-        print("[CHECK] Reranker Status: INACTIVE (Fallback to RRF)")
-        # fallback: מיון לפי ציון RRF ללא Cohere
-        ממוין = ממוין_ראשוני[:MAX_PAGES]
+        # fallback: מיון לפי ציון RRF
+        ממוין = מועמדים
         for i, item in enumerate(ממוין, 1):
             print(f"  [{i:02d}] RRF={item['ציון']:.6f} | עמוד {item['page']} | {item['source']}")
 
+    # --- שלב 2.75: אריזה בתקציב טוקנים – עמודים ארוכים נחתכים סביב ה-chunk שהתאים ---
+    ממוין = pack_context(ממוין)
+    print(
+        f"[CHECK] Context: {len(ממוין)} pages, ~{sum(i['tokens'] for i in ממוין)} "
+        f"/ {CONTEXT_TOKEN_BUDGET} tokens"
+    )
+
+    # סדר קבוע לפי (מקור, עמוד) ולא לפי ציון – אותה קבוצת עמודים בשאלת המשך
+    # נותנת בלוק הקשר זהה בתו, כך שהוא נקרא מה-prompt cache במקום להישלח מחדש
     קטעי_הקשר = [
         f"[מקור: {item['source']} | עמוד {item['page']}]\n{item['full']}"
-        for item in ממוין
+        for item in sorted(ממוין, key=lambda x: (x["source"], x["page"]))
     ]
 
     הקשר = "\n\n---\n\n".join(קטעי_הקשר)
 
-    # --- שלב 3: בניית רשימת ההודעות כולל היסטוריית השיחה ---
-    system_prompt = (
-        "You are a strict document assistant.\n"
-        "ABSOLUTE RULES:\n"
-        "1. If information is NOT in the provided context - say ONLY: 'המידע לא נמצא בקטעים שנשלפו'\n"
-        "2. NEVER guess, estimate, or use prior knowledge\n"
-        "3. NEVER apologize or explain - just state clearly what was found or not found\n"
-        "4. Always cite the source filename AND page number (עמוד) for every piece of information\n"
-        "5. Volume data may appear as full numbers (e.g. 1,164,000 m3) OR in millions "
-        "(e.g. 1.18 mio m3 = 1,180,000 m3). Treat them as equivalent when cross-referencing data.\n"
-        "6. CONFLICT DETECTION: Scan ALL retrieved chunks. If different numerical values or facts "
-        "appear for the same data point — whether across documents or within one document — "
-        "flag it explicitly: '⚠️ שים לב: נמצא מידע סותר בין המקורות'\n"
-        "7. SOURCE COMPARISON: Never assume the first document is the correct one. "
-        "Present ALL versions found in the context and cite each with its source filename and page number.\n\n"
-        "ענה בשפה שבה נשאלת השאלה המקורית (עברית או אנגלית).\n"
-        f"הקשר מהמסמכים:\n{הקשר}"
-    )
+    # --- שלב 3: בניית הבקשה – כללים קבועים + הקשר, כל אחד כבלוק cacheable ---
+    system_prompt = [
+        {"type": "text", "text": ANSWER_RULES, "cache_control": {"type": "ephemeral"}},
+        {
+            "type": "text",
+            "text": f"הקשר מהמסמכים:\n{הקשר}",
+            "cache_control": {"type": "ephemeral"},
+        },
+    ]
+    # סיכום השיחה משתנה בכל סבב – אחרי נקודות ה-cache, כדי לא לפסול את ההקשר השמור
+    if history_summary:
+        system_prompt.append({"type": "text", "text": f"סיכום השיחה הקודמת:\n{history_summary}"})
 
     # בונה את רשימת ההודעות: היסטוריה + שאלה נוכחית
     הודעות = []
@@ -691,113 +1609,338 @@ def search_and_answer(
         הודעות.append({"role": "user",      "content": שאלה_קודמת})
         הודעות.append({"role": "assistant", "content": תשובה_קודמת})
 
+    # נקודת cache שלישית בסוף ההיסטוריה – בשאלת המשך עם אותו הקשר, כל הקידומת נקראת מהמטמון
+    if הודעות:
+        הודעות[-1]["content"] = [
+            {"type": "text", "text": הודעות[-1]["content"], "cache_control": {"type": "ephemeral"}}
+        ]
+
     # מוסיף את השאלה הנוכחית
     הודעות.append({
         "role": "user",
         "content": f"שאלה מקורית: {question}\n(תורגמה לחיפוש: {שאלה_באנגלית})",
     })
 
-    תגובה = לקוח_anthropic.messages.create(
-        model="claude-haiku-4-5-20251001",
+    yield ("stage", "answer")
+    with לקוח_anthropic.messages.stream(
+        model=ANSWER_MODEL,
         max_tokens=1024,
         system=system_prompt,
         messages=הודעות,
+    ) as זרם:
+        for קטע in זרם.text_stream:
+            yield ("token", קטע)
+        הודעה_סופית = זרם.get_final_message()
+
+    # גודל ההיסטוריה שנשלחה בבקשה – לניטור צמיחה בשיחות ארוכות
+    טוקני_היסטוריה = estimate_tokens(history_summary) + sum(
+        estimate_tokens(ש) + estimate_tokens(ת) for ש, ת in (history or [])
+    )
+    print(f"[CHECK] History: ~{טוקני_היסטוריה} tokens ({len(history or [])} turns verbatim)")
+    רשומה = log_usage(
+        "answer", ANSWER_MODEL, הודעה_סופית.usage, extra={"history_tokens": טוקני_היסטוריה}
     )
+    yield ("usage", רשומה)
 
-    return תגובה.content[0].text
+
+def search_and_answer(
+    question: str,
+    history: list[tuple[str, str]] | None = None,
+    filter_source: str | list[str] | None = None,
+    client=None,
+) -> str:
+    """
+    מתרגם את השאלה לאנגלית, מחפש ב-ChromaDB את העמודים הרלוונטיים,
+    ושולח אותם יחד עם השאלה המקורית והיסטוריית השיחה ל-Anthropic API.
+    מחזיר את התשובה המלאה – מאחד את קטעי search_and_answer_stream.
+    """
+    return "".join(
+        ערך
+        for סוג, ערך in search_and_answer_stream(question, history, filter_source, client)
+        if סוג == "token"
+    )
 
 
-def summarize_file(source_name: str) -> str:
+def get_summary_cache() -> DiskCache:
+    """מטמון סיכומי פרקים ומסמכים – מפתח: hash של (טקסט, שלב, גרסת prompt, מודל)."""
+    global _summary_cache
+    if _summary_cache is None:
+        _summary_cache = DiskCache("section_summaries", max_entries=SUMMARY_CACHE_MAX_ENTRIES)
+    return _summary_cache
+
+
+def _dedup_pages(pages: list[tuple[int, str]]) -> list[tuple[int, str]]:
+    """
+    מסיר שורות שחוזרות ברוב העמודים (כותרת עליונה/תחתונה, מספר מסמך, הערת זכויות) –
+    הן היו מופיעות בכל פרק ומנפחות כל קריאה. עמודים שנותרו ריקים מושמטים.
     """
-    שולף את כל ה-chunks של קובץ ספציפי מ-ChromaDB
-    ושולח אותם ל-Claude לסיכום מקיף.
+    if len(pages) < 3:
+        return [(עמוד, טקסט) for עמוד, טקסט in pages if טקסט.strip()]
+    מונה: dict[str, int] = {}
+    for _, טקסט in pages:
+        for שורה in {ש.strip() for ש in טקסט.splitlines() if ש.strip()}:
+            מונה[שורה] = מונה.get(שורה, 0) + 1
+    סף = max(3, len(pages) // 2)
+    חוזרות = {שורה for שורה, n in מונה.items() if n >= סף}
+
+    נקיים = []
+    for עמוד, טקסט in pages:
+        שורות = [ש for ש in טקסט.splitlines() if ש.strip() and ש.strip() not in חוזרות]
+        if שורות:
+            נקיים.append((עמוד, "\n".join(שורות)))
+    return נקיים
+
+
+def _split_sections(pages: list[tuple[int, str]]) -> list[dict]:
     """
-    לקוח_chroma = chromadb.PersistentClient(path="chroma_db")
-    אוסף = לקוח_chroma.get_or_create_collection(name="pdf_collection")
+    מחלק את העמודים לפרקים רציפים לפי הכותרת הממוספרת (_extract_section_header):
+    פרק חדש מתחיל כשמספר הפרק הראשי משתנה – אם הנוכחי כבר לא קצר מדי –
+    או כשהפרק עובר את SUMMARY_SECTION_TOKENS.
+    מחזיר [{"title", "first_page", "last_page", "text"}].
+    """
+    פרקים: list[dict] = []
+    נוכחי: dict | None = None
+    for עמוד, טקסט in pages:
+        כותרת = _extract_section_header(טקסט)
+        m = re.match(r"(\d+)\.", כותרת or "")
+        פרק_ראשי = m.group(1) if m else None
+        טוקנים = estimate_tokens(טקסט)
+
+        if נוכחי is not None:
+            פרק_חדש = (
+                פרק_ראשי is not None
+                and פרק_ראשי != נוכחי["chapter"]
+                and נוכחי["tokens"] >= SUMMARY_MIN_SECTION_TOKENS
+            )
+            if פרק_חדש or נוכחי["tokens"] + טוקנים > SUMMARY_SECTION_TOKENS:
+                פרקים.append(נוכחי)
+                נוכחי = None
+
+        if נוכחי is None:
+            נוכחי = {"title": כותרת, "chapter": פרק_ראשי, "first_page": עמוד,
+                     "tokens": 0, "parts": []}
+        נוכחי["title"] = נוכחי["title"] or כותרת
+        נוכחי["chapter"] = נוכחי["chapter"] or פרק_ראשי
+        נוכחי["last_page"] = עמוד
+        נוכחי["tokens"] += טוקנים
+        נוכחי["parts"].append(f"[Page {עמוד}]\n{טקסט}")
+    if נוכחי is not None:
+        פרקים.append(נוכחי)
+
+    return [
+        {
+            "title": פ["title"] or f"Pages {פ['first_page']}-{פ['last_page']}",
+            "first_page": פ["first_page"],
+            "last_page": פ["last_page"],
+            "text": "\n\n".join(פ["parts"]),
+        }
+        for פ in פרקים
+    ]
 
-    # שולף את כל הרשומות ששייכות לקובץ המבוקש
-    תוצאות = אוסף.get(
-        where={"source": source_name},
-        include=["documents", "metadatas"]
-    )
 
-    חלקים = תוצאות["documents"]
+def _create_with_retry(לקוח_anthropic, max_retries: int = 5, base_delay: float = 1.0, **kwargs):
+    """messages.create עם backoff אקספוננציאלי + jitter על rate limit; שגיאה אחרת עולה."""
+    for ניסיון in range(max_retries + 1):
+        try:
+            return לקוח_anthropic.messages.create(**kwargs)
+        except Exception as e:
+            if _is_rate_limit_error(e) and ניסיון < max_retries:
+                time.sleep(base_delay * (2 ** ניסיון) + random.uniform(0, base_delay))
+                continue
+            raise
 
-    if not חלקים:
-        return f"לא נמצאו נתונים לקובץ: {source_name}"
 
-    # מחבר את כל החלקים לטקסט אחד
-    טקסט_מלא = "\n\n".join(חלקים)
+def _summary_call(
+    לקוח_anthropic,
+    stage: str,
+    prompt: str,
+    max_tokens: int,
+) -> str:
+    """
+    קריאת סיכום אחת עם מטמון: אותו prompt (שלב, גרסה, מודל) = אותה תשובה מהדיסק.
+    על rate limit – backoff (_create_with_retry); תשובה ריקה לא נשמרת.
+    """
+    מטמון = get_summary_cache()
+    מפתח = content_key(SUMMARY_PROMPT_VERSION, SUMMARY_MODEL, stage, prompt)
+    שמור = מטמון.get(מפתח)
+    if שמור is not None:
+        return שמור
+
+    תגובה = _create_with_retry(
+        לקוח_anthropic,
+        model=SUMMARY_MODEL,
+        max_tokens=max_tokens,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    log_usage(f"summary_{stage}", SUMMARY_MODEL, תגובה.usage)
+    טקסט = תגובה.content[0].text.strip()
+    if טקסט:
+        מטמון.set(מפתח, טקסט)
+    return טקסט
+
 
-    פרומפט = f"""סכם את המסמך הבא בצורה מקיפת ומסודרת.
+def _final_summary_prompt(source_name: str, content_label: str, content: str) -> str:
+    return f"""סכם את המסמך הבא בצורה מקיפה ומסודרת.
 ציין את הנקודות העיקריות, נושאי המסמך, וכל מידע חשוב אחר.
 ענה בעברית.
 
 שם המסמך: {source_name}
 
-תוכן המסמך:
-{טקסט_מלא}"""
+{content_label}:
+{content}"""
 
-    # שולח ל-Claude את כל התוכן
-    לקוח_anthropic = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-    תגובה = לקוח_anthropic.messages.create(
-        model="claude-haiku-4-5-20251001",
+
+def summarize_file(source_name: str, client=None) -> str:
+    """
+    סיכום מסמך בשיטת map-reduce:
+    1. הטקסט המלא של כל עמוד פעם אחת (load_source_pages – לא ה-chunks החופפים עם משפטי
+       ההקשר), בלי שורות שחוזרות בכל עמוד
+    2. חלוקה לפרקים לפי הכותרות הממוספרות
+    3. map – סיכום לכל פרק, עד SUMMARY_CONCURRENCY קריאות במקביל
+    4. reduce – סיכום המסמך מתוך סיכומי הפרקים (בשלבים אם הם עדיין ארוכים מדי)
+    כל קריאה נשמרת במטמון – סיכום חוזר של מסמך שלא השתנה לא פונה למודל.
+    מסמך קצר מסוכם ישירות בקריאה אחת.
+    """
+    עמודים = _dedup_pages(load_source_pages(source_name) or [])
+    if not עמודים:
+        return f"לא נמצאו נתונים לקובץ: {source_name}"
+
+    לקוח_anthropic = client or anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    פרקים = _split_sections(עמודים)
+    if len(פרקים) == 1:
+        return _summary_call(
+            לקוח_anthropic, "direct",
+            _final_summary_prompt(source_name, "תוכן המסמך", פרקים[0]["text"]),
+            max_tokens=2048,
+        )
+
+    # --- map: סיכום לכל פרק במקביל ---
+    def _סכם_פרק(פרק: dict) -> str:
+        return _summary_call(
+            לקוח_anthropic, "section",
+            f"Document: {source_name}\n"
+            f"Section: {פרק['title']} (pages {פרק['first_page']}-{פרק['last_page']})\n\n"
+            "Summarize this section of an engineering document in at most 200 words. "
+            "Keep key requirements, design values with their units, referenced standards "
+            "and decisions. Return ONLY the summary.\n\n"
+            f"{פרק['text']}",
+            max_tokens=500,
+        )
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_CONCURRENCY)) as מאגר:
+        סיכומים = list(מאגר.map(_סכם_פרק, פרקים))
+    print(
+        f"[CHECK] Summary map: {len(פרקים)} sections from {len(עמודים)} pages "
+        f"in {time.perf_counter() - t0:.1f}s"
+    )
+
+    חלקים = [
+        f"## {פרק['title']} (pages {פרק['first_page']}-{פרק['last_page']})\n{סיכום}"
+        for פרק, סיכום in zip(פרקים, סיכומים) if סיכום
+    ]
+
+    # --- reduce: איחוד בשלבים עד שהסיכומים נכנסים לקריאה אחת ---
+    while len(חלקים) > 1 and estimate_tokens("\n\n".join(חלקים)) > SUMMARY_REDUCE_TOKENS:
+        קבוצות: list[list[str]] = [[]]
+        for חלק in חלקים:
+            if קבוצות[-1] and estimate_tokens("\n\n".join(קבוצות[-1] + [חלק])) > SUMMARY_REDUCE_TOKENS // 2:
+                קבוצות.append([])
+            קבוצות[-1].append(חלק)
+        with ThreadPoolExecutor(max_workers=max(1, SUMMARY_CONCURRENCY)) as מאגר:
+            חלקים = list(מאגר.map(
+                lambda קבוצה: _summary_call(
+                    לקוח_anthropic, "merge",
+                    f"Document: {source_name}\n\n"
+                    "Merge these consecutive section summaries into one summary of at most "
+                    "400 words, keeping section numbers, design values with units and "
+                    "referenced standards. Return ONLY the summary.\n\n"
+                    + "\n\n".join(קבוצה),
+                    max_tokens=1000,
+                ),
+                קבוצות,
+            ))
+
+    return _summary_call(
+        לקוח_anthropic, "reduce",
+        _final_summary_prompt(source_name, "סיכומי פרקי המסמך", "\n\n".join(חלקים)),
         max_tokens=2048,
-        messages=[{"role": "user", "content": פרומפט}],
     )
 
-    return תגובה.content[0].text
 
+def get_standards_cache() -> DiskCache:
+    """רשימות התקנים שחולצו – מפתח: hash של (מקור, השורות המועמדות, גרסת prompt, מודל)."""
+    global _standards_cache
+    if _standards_cache is None:
+        _standards_cache = DiskCache("standards", max_entries=10_000)
+    return _standards_cache
 
-def count_standards(source_name: str) -> str:
-    """
-    קורא את ה-PDF ישירות (לא דרך chunks של ChromaDB) כדי למנוע
-    פיצול של רשומות תקנים באמצע שורה.
-    מעבד 80 שורות בכל קריאת API ומונה את כל התקנים.
-    """
-    # קורא את ה-PDF מהתיקייה ישירות
-    נתיב_pdf = os.path.join("pdfs", source_name)
-    if not os.path.exists(נתיב_pdf):
-        return f"קובץ לא נמצא: {נתיב_pdf}"
 
-    טקסט_גולמי = load_pdf(נתיב_pdf)
+def _standard_candidate_lines(lines: list[str], context: int = STANDARDS_CONTEXT_LINES) -> list[str]:
+    """השורות שיש בהן מזהה תקן, עם context שורות לפניהן ואחריהן – לפי הסדר, בלי כפילויות."""
+    נבחרות: set[int] = set()
+    for i, שורה in enumerate(lines):
+        if _STANDARD_RE.search(שורה):
+            נבחרות.update(range(max(0, i - context), min(len(lines), i + context + 1)))
+    return [lines[i] for i in sorted(נבחרות)]
 
-    # מפצל לשורות ומסיר שורות ריקות – כל תקן נשאר שלם בשורתו
-    שורות = [ש.strip() for ש in טקסט_גולמי.splitlines() if ש.strip()]
 
-    לקוח_anthropic = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+def count_standards(source_name: str, client=None) -> str:
+    """
+    מונה את התקנים שהמסמך מפנה אליהם:
+    1. שורות שלמות מהטקסט של כל עמוד (load_source_pages – המסמך המלא בלבד, או קריאת ה-PDF
+       אם המקור לא מאונדקס) – כדי שרשומת תקן לא תתפצל באמצע שורה כמו ב-chunks
+    2. סינון מקומי (_STANDARD_RE): רק שורות עם מזהה תקן + שורת הקשר סביבן נשלחות למודל
+    3. אצוות של STANDARDS_BATCH_LINES שורות, עד STANDARDS_CONCURRENCY קריאות במקביל
+    הרשימה נשמרת במטמון לכל מקור – הרצה חוזרת על אותו טקסט לא פונה למודל.
+    """
+    עמודים = load_source_pages(source_name)
+    if עמודים is None:
+        return f"קובץ לא נמצא: {os.path.join('pdfs', source_name)}"
+    טקסטים = [טקסט for _, טקסט in עמודים]
 
-    גודל_batch = 40  # שורות לכל קריאת API – קטן כדי שהפלט לא יקוצץ
-    כל_התקנים: set[str] = set()
+    # מפצל לשורות ומסיר שורות ריקות – כל תקן נשאר שלם בשורתו
+    שורות = [ש.strip() for טקסט in טקסטים for ש in טקסט.splitlines() if ש.strip()]
+    מועמדות = _standard_candidate_lines(שורות)
+    print(f"[CHECK] Standards prefilter: {len(מועמדות)} / {len(שורות)} lines")
 
-    for התחלה in range(0, len(שורות), גודל_batch):
-        קבוצה = שורות[התחלה: התחלה + גודל_batch]
-        טקסט_קבוצה = "\n".join(קבוצה)
+    מטמון = get_standards_cache()
+    מפתח = content_key(
+        STANDARDS_PROMPT_VERSION, STANDARDS_MODEL, source_name, content_key(*מועמדות)
+    )
+    רשימה_ממוינת = מטמון.get(מפתח)
+    if רשימה_ממוינת is None:
+        לקוח_anthropic = client or anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
 
-        # מבקש רק מזהים, פלט מינימלי למניעת קיצוץ
-        פרומפט_batch = f"""מתוך הטקסט הבא, חלץ את כל התקנים שמופיעים.
+        def _חלץ(התחלה: int) -> list[str]:
+            # מבקש רק מזהים, פלט מינימלי למניעת קיצוץ
+            פרומפט_batch = f"""מתוך הטקסט הבא, חלץ את כל התקנים שמופיעים.
 החזר שורה אחת לכל תקן, בפורמט המקורי כפי שמופיע בטקסט.
 אל תוסיף הסברים, כותרות או מספור – רק את הרשימה.
 
 טקסט:
-{טקסט_קבוצה}"""
-
-        תגובה = לקוח_anthropic.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=2048,
-            messages=[{"role": "user", "content": פרומפט_batch}],
+{chr(10).join(מועמדות[התחלה: התחלה + STANDARDS_BATCH_LINES])}"""
+            תגובה = _create_with_retry(
+                לקוח_anthropic,
+                model=STANDARDS_MODEL,
+                max_tokens=2048,
+                messages=[{"role": "user", "content": פרומפט_batch}],
+            )
+            log_usage("standards", STANDARDS_MODEL, תגובה.usage)
+            return [ש.strip() for ש in תגובה.content[0].text.strip().splitlines() if ש.strip()]
+
+        t0 = time.perf_counter()
+        התחלות = range(0, len(מועמדות), STANDARDS_BATCH_LINES)
+        with ThreadPoolExecutor(max_workers=max(1, STANDARDS_CONCURRENCY)) as מאגר:
+            # set – כפילויות בין אצוות מוסרות אוטומטית
+            כל_התקנים = {תקן for תקנים in מאגר.map(_חלץ, התחלות) for תקן in תקנים}
+        print(
+            f"[CHECK] Standards: {len(התחלות)} batches in {time.perf_counter() - t0:.1f}s"
         )
-
-        # מוסיף לset – כפילויות מוסרות אוטומטית
-        for שורה in תגובה.content[0].text.strip().splitlines():
-            שורה = שורה.strip()
-            if שורה:
-                כל_התקנים.add(שורה)
-
-        print(f"  עיבד שורות {התחלה + 1}–{min(התחלה + גודל_batch, len(שורות))} / {len(שורות)}")
+        רשימה_ממוינת = sorted(כל_התקנים)
+        מטמון.set(מפתח, רשימה_ממוינת)
 
     # פלט מסודר
-    רשימה_ממוינת = sorted(כל_התקנים)
     פלט = "\n".join(f"{i}. {תקן}" for i, תקן in enumerate(רשימה_ממוינת, start=1))
     return f"{פלט}\n\nסך הכל: {len(רשימה_ממוינת)} תקנים"
 
@@ -805,50 +1948,57 @@ def count_standards(source_name: str) -> str:
 def main():
     """
     פונקציה ראשית:
-    1. טוענת את כל ה-PDF מתיקיית 'pdfs'
-    2. מפצלת כל טקסט לחלקים
-    3. מדפיסה סטטיסטיקות
+    1. סורקת את תיקיית 'pdfs' מול קטלוג המקורות (בלי לחלץ קבצים)
+    2. מאנדקסת קבצים חדשים ומעדכנת קבצים שהשתנו
+    3. מדפיסה סטטיסטיקות ונכנסת ללולאת שאלות
     """
     תיקיית_pdf = "pdfs"
 
-    # בדיקה אילו קבצים כבר קיימים ב-ChromaDB
-    מקורות_קיימים = get_existing_sources()
+    # הסבה חד-פעמית של אוסף במבנה קודם – עמוד מלא אחד לכל עמוד (migrate_page_store)
+    הוסבו = migrate_page_store()
+    if הוסבו:
+        print(f"הוסבו {הוסבו} chunks למאגר העמודים")
 
-    # טעינת כל קבצי ה-PDF מהתיקייה
-    כל_קבצי_pdf = load_multiple_pdfs(תיקיית_pdf)
+    # סריקת התיקייה מול הקטלוג – שם + גודל + mtime (hash רק לקובץ שה-mtime שלו השתנה).
+    # אף קובץ לא מחולץ כאן: כל קובץ חדש / שהשתנה מחולץ פעם אחת, ב-process_large_pdf
+    t0 = time.perf_counter()
+    סריקה = scan_pdf_folder(תיקיית_pdf)
+    print(f"[CHECK] Folder scan: {time.perf_counter() - t0:.2f}s")
 
-    if not כל_קבצי_pdf:
+    if not any(סריקה.values()):
         print("לא נמצאו קבצי PDF בתיקייה.")
         return
 
-    # מסנן רק קבצים חדשים שעוד לא נוספו ל-ChromaDB
-    קבצים_חדשים = [ק for ק in כל_קבצי_pdf if ק["source"] not in מקורות_קיימים]
-    קבצים_קיימים = [ק for ק in כל_קבצי_pdf if ק["source"] in מקורות_קיימים]
-
     # מדפיס סטטוס קבצים קיימים
-    for קובץ in קבצים_קיימים:
-        print(f"דולג (כבר קיים): {קובץ['source']}")
+    for שם_קובץ in סריקה["unchanged"]:
+        print(f"דולג (כבר קיים): {שם_קובץ}")
 
     סה_כ_chunks_חדשים = 0
 
-    # מעבד כל קובץ חדש בנפרד עמוד-עמוד לחיסכון בזיכרון
-    for קובץ in קבצים_חדשים:
-        נתיב = os.path.join(תיקיית_pdf, קובץ["source"])
+    # מעבד כל קובץ חדש (או שהשתנה – רק העמודים ששונו) עמוד-עמוד לחיסכון בזיכרון
+    for שם_קובץ in סריקה["new"] + סריקה["changed"]:
+        נתיב = os.path.join(תיקיית_pdf, שם_קובץ)
         עמודים = count_pdf_pages(נתיב)
-        print(f"\nמעבד: {קובץ['source']} ({עמודים} עמודים)")
+        מצב = "מעדכן" if שם_קובץ in סריקה["changed"] else "מעבד"
+        print(f"\n{מצב}: {שם_קובץ} ({עמודים} עמודים)")
 
         def הדפסת_התקדמות(עמוד, סה_כ):
             if עמוד % 20 == 0 or עמוד == סה_כ:
                 print(f"  עמוד {עמוד}/{סה_כ}", end="\r", flush=True)
 
-        chunks = process_large_pdf(נתיב, קובץ["source"], progress_callback=הדפסת_התקדמות)
+        chunks = process_large_pdf(
+            נתיב, שם_קובץ,
+            progress_callback=הדפסת_התקדמות,
+            workers=EXTRACTION_WORKERS,
+        )
         סה_כ_chunks_חדשים += chunks
-        print(f"  ✓ {קובץ['source']}: {chunks} חלקים נשמרו")
+        print(f"  ✓ {שם_קובץ}: {chunks} חלקים נשמרו")
 
     # הדפסת סיכום
     print(f"\n--- סיכום ---")
-    print(f"קבצים חדשים שנטענו: {len(קבצים_חדשים)}")
-    print(f"קבצים שכבר היו קיימים: {len(קבצים_קיימים)}")
+    print(f"קבצים חדשים שנטענו: {len(סריקה['new'])}")
+    print(f"קבצים שעודכנו: {len(סריקה['changed'])}")
+    print(f"קבצים שכבר היו קיימים: {len(סריקה['unchanged'])}")
     print(f"חלקים חדשים שנוספו: {סה_כ_chunks_חדשים}")
 
     # הצגת מקורות קיימים לפני השאלות
@@ -0,0 +1,157 @@
+"""
+Rerankers: דירוג מחדש של עמודים מועמדים מול השאילתה, מאחורי ממשק אחד.
+- LexicalReranker – מקומי על CPU: כיסוי מונחי השאילתה + קרבה ביניהם בעמוד
+- CohereReranker  – rerank-v3.5 דרך ה-API (אם מותקן cohere ויש COHERE_API_KEY)
+הציונים נשמרים במטמון על הדיסק לפי (reranker, שאילתה, hash של העמוד) –
+עמוד שכבר דורג מול אותה שאילתה לא נשלח שוב, וכל השאר מדורגים באצווה אחת.
+"""
+import math
+import os
+from abc import ABC, abstractmethod
+
+from analyzer import ANALYZER_VERSION, analyze
+from disk_cache import DiskCache, content_key
+
+# cohere אופציונלי – נדרש רק ל-CohereReranker
+try:
+    import cohere as _cohere
+    _COHERE_AVAILABLE = True
+except ImportError:
+    _COHERE_AVAILABLE = False
+
+RERANK_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_RERANK_CACHE_MAX_ENTRIES", 200_000))
+_rerank_cache: DiskCache | None = None
+
+
+def get_rerank_cache() -> DiskCache:
+    """מטמון ציוני rerank – משותף לכל ה-backends (שם ה-backend הוא חלק מהמפתח)."""
+    global _rerank_cache
+    if _rerank_cache is None:
+        _rerank_cache = DiskCache("rerank_scores", max_entries=RERANK_CACHE_MAX_ENTRIES)
+    return _rerank_cache
+
+
+class Reranker(ABC):
+    """
+    ממשק בסיס. מימוש מגדיר name (כולל גרסה – שינוי בה מבטל את המטמון) ו-score_batch.
+    rerank() מטפל במטמון, באצווה ובמיון – משותף לכל המימושים.
+    """
+
+    name = "base"
+    max_chars = 1500  # אורך הטקסט מכל עמוד שנשלח לדירוג
+
+    @abstractmethod
+    def score_batch(self, query: str, documents: list[str]) -> list[float]:
+        """ציון לכל מסמך, באותו סדר – גבוה יותר = רלוונטי יותר."""
+
+    def rerank(self, query: str, items: list[dict], top_n: int) -> list[dict]:
+        """
+        items: עמודים עם "full". מחזיר את top_n הטובים, ממוינים, עם "rerank_score".
+        רק עמודים שאין להם ציון במטמון נשלחים ל-score_batch (קריאה אחת).
+        """
+        מטמון = get_rerank_cache()
+        מסמכים = [item["full"][:self.max_chars] for item in items]
+        מפתחות = [content_key(self.name, query, content_key(מסמך)) for מסמך in מסמכים]
+
+        # שליפה אחת וכתיבה אחת למטמון לכל השאילתה – לא get / set לכל מועמד
+        במטמון = מטמון.get_many(מפתחות)
+        ציונים: list[float | None] = [במטמון.get(מפתח) for מפתח in מפתחות]
+        חסרים = [i for i, ציון in enumerate(ציונים) if ציון is None]
+        if חסרים:
+            חדשים = self.score_batch(query, [מסמכים[i] for i in חסרים])
+            for i, ציון in zip(חסרים, חדשים):
+                ציונים[i] = ציון
+            מטמון.set_many([(מפתחות[i], ציונים[i]) for i in חסרים])
+        print(
+            f"[CHECK] Rerank ({self.name}): {len(items) - len(חסרים)} cached, "
+            f"{len(חסרים)} scored"
+        )
+
+        סדר = sorted(range(len(items)), key=lambda i: ציונים[i], reverse=True)[:top_n]
+        return [{**items[i], "rerank_score": ציונים[i]} for i in סדר]
+
+
+class LexicalReranker(Reranker):
+    """
+    Reranker מקומי ללא מודל: לכל עמוד –
+    כיסוי  – חלק מונחי השאילתה (הייחודיים) שמופיעים בעמוד
+    קרבה  – כמה מהם מופיעים יחד בחלון הקצר ביותר (ביטוי מפוזר על פני העמוד מקבל פחות)
+    תדירות – רוויה לוגריתמית של מספר ההופעות
+    המונחים עוברים את אותו analyzer של BM25 (מספרים, יחידות, אותיות שימוש).
+    מהיר מספיק כדי לדרג את כל חלון ה-rerank בכל שאלה.
+    """
+
+    name = f"lexical-v2-a{ANALYZER_VERSION}"  # שינוי ב-analyzer משנה את הציונים
+    max_chars = 6000
+
+    def score_batch(self, query: str, documents: list[str]) -> list[float]:
+        מונחים = set(analyze(query))
+        if not מונחים:
+            return [0.0] * len(documents)
+        return [self._score(מונחים, מסמך) for מסמך in documents]
+
+    @staticmethod
+    def _score(terms: set[str], document: str) -> float:
+        מיקומים = [
+            (i, טוקן)
+            for i, טוקן in enumerate(analyze(document))
+            if טוקן in terms
+        ]
+        if not מיקומים:
+            return 0.0
+        שונים = {טוקן for _, טוקן in מיקומים}
+        כיסוי = len(שונים) / len(terms)
+
+        # החלון הקצר ביותר שמכיל את כל המונחים השונים שנמצאו (sliding window על ההופעות)
+        חלון_מינימלי = math.inf
+        ספירה: dict[str, int] = {}
+        שמאל = 0
+        for ימין, (עמדה, טוקן) in enumerate(מיקומים):
+            ספירה[טוקן] = ספירה.get(טוקן, 0) + 1
+            while len(ספירה) == len(שונים):
+                חלון_מינימלי = min(חלון_מינימלי, עמדה - מיקומים[שמאל][0] + 1)
+                טוקן_שמאל = מיקומים[שמאל][1]
+                ספירה[טוקן_שמאל] -= 1
+                if not ספירה[טוקן_שמאל]:
+                    del ספירה[טוקן_שמאל]
+                שמאל += 1
+        קרבה = len(שונים) / חלון_מינימלי
+
+        תדירות = math.log1p(len(מיקומים)) / math.log1p(len(מיקומים) + 10)
+        return 0.6 * כיסוי + 0.3 * קרבה + 0.1 * תדירות
+
+
+class CohereReranker(Reranker):
+    """rerank-v3.5 של Cohere – קריאת API אחת לכל העמודים שלא במטמון."""
+
+    name = "cohere-rerank-v3.5"
+
+    def __init__(self, api_key: str):
+        self._client = _cohere.ClientV2(api_key=api_key)
+
+    def score_batch(self, query: str, documents: list[str]) -> list[float]:
+        תגובה = self._client.rerank(
+            model="rerank-v3.5",
+            query=query,
+            documents=documents,
+            top_n=len(documents),
+        )
+        ציונים = [0.0] * len(documents)
+        for r in תגובה.results:
+            ציונים[r.index] = r.relevance_score
+        return ציונים
+
+
+def get_reranker(kind: str | None = None) -> Reranker | None:
+    """
+    בוחר reranker לפי kind או RAG_RERANKER: "cohere" | "lexical" | "none".
+    ברירת מחדל ("auto"): Cohere אם מותקן ויש מפתח, אחרת המקומי.
+    None = ללא reranking (סדר RRF).
+    """
+    kind = (kind or os.environ.get("RAG_RERANKER", "auto")).lower()
+    _cohere_key = os.environ.get("COHERE_API_KEY")
+    if kind == "none":
+        return None
+    if kind in ("cohere", "auto") and _COHERE_AVAILABLE and _cohere_key:
+        return CohereReranker(_cohere_key)
+    return LexicalReranker()
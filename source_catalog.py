@@ -0,0 +1,191 @@
+"""
+קטלוג מקורות: שורה אחת לכל מסמך מאונדקס – שם, מספר עמודים (וכמה מהם עם טקסט), מספר chunks,
+hash של תוכן הקובץ, גודל + mtime של הקובץ (לסריקת תיקייה בלי לקרוא קבצים) וזמן האינדוקס.
+רשימת המסמכים נקראת מכאן ב-O(מספר מסמכים), במקום לסרוק את המטא של כל ה-chunks ב-ChromaDB.
+נשמר באותו קובץ SQLite של אינדקס ה-BM25 ומאגר העמודים.
+"""
+import sqlite3
+import threading
+import time
+
+from bm25_index import INDEX_PATH
+
+# העמודות שמוחזרות ב-get / list
+_COLUMNS = ("source", "page_count", "chunk_count", "content_hash", "indexed_at",
+            "file_size", "file_mtime", "text_pages")
+
+
+class SourceCatalog:
+    """טבלת sources ב-SQLite. כל עדכון הוא טרנזקציה אחת."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                source       TEXT PRIMARY KEY,
+                page_count   INTEGER NOT NULL DEFAULT 0,
+                chunk_count  INTEGER NOT NULL DEFAULT 0,
+                content_hash TEXT NOT NULL DEFAULT '',
+                indexed_at   REAL NOT NULL,
+                file_size    INTEGER NOT NULL DEFAULT 0,
+                file_mtime   REAL NOT NULL DEFAULT 0,
+                text_pages   INTEGER NOT NULL DEFAULT -1
+            );
+            """
+        )
+        # קטלוג מגרסה קודמת – ללא עמודות הגודל וה-mtime
+        עמודות = {r[1] for r in self._conn.execute("PRAGMA table_info(sources)")}
+        if "file_size" not in עמודות:
+            self._conn.execute("ALTER TABLE sources ADD COLUMN file_size INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("ALTER TABLE sources ADD COLUMN file_mtime REAL NOT NULL DEFAULT 0")
+        # text_pages: עמודים שאינם ריקים (עמוד ריק לא נשמר במאגר העמודים); -1 = לא ידוע
+        if "text_pages" not in עמודות:
+            self._conn.execute("ALTER TABLE sources ADD COLUMN text_pages INTEGER NOT NULL DEFAULT -1")
+        self._conn.commit()
+
+    def add_chunks(self, counts: dict[str, tuple[int, int]]) -> None:
+        """
+        מעדכן אחרי שמירת אצווה: {source: (chunks שנוספו, מספר העמוד הגבוה באצווה)}.
+        מקור חדש נוצר אוטומטית – כך הקטלוג תואם לאוסף גם אם האינדוקס נקטע באמצע.
+        """
+        if not counts:
+            return
+        עכשיו = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO sources (source, page_count, chunk_count, indexed_at) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET "
+                "chunk_count = chunk_count + excluded.chunk_count, "
+                "page_count = MAX(page_count, excluded.page_count), "
+                "indexed_at = excluded.indexed_at",
+                [(מקור, עמוד, n, עכשיו) for מקור, (n, עמוד) in counts.items()],
+            )
+
+    def finish_source(
+        self,
+        source_name: str,
+        page_count: int,
+        content_hash: str,
+        file_size: int = 0,
+        file_mtime: float = 0.0,
+        text_pages: int = -1,
+    ) -> None:
+        """
+        נקרא בסוף אינדוקס קובץ: מספר העמודים האמיתי, כמה מהם עם טקסט,
+        ו-hash, גודל ו-mtime של הקובץ.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sources "
+                "(source, page_count, content_hash, indexed_at, file_size, file_mtime, text_pages) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET page_count = excluded.page_count, "
+                "content_hash = excluded.content_hash, indexed_at = excluded.indexed_at, "
+                "file_size = excluded.file_size, file_mtime = excluded.file_mtime, "
+                "text_pages = excluded.text_pages",
+                (source_name, page_count, content_hash, time.time(), file_size, file_mtime,
+                 text_pages),
+            )
+
+    def set_text_pages(self, source_name: str, text_pages: int) -> None:
+        """מספר העמודים שאינם ריקים – כשנקבע מחדש מהאוסף (מקור שאונדקס לפני העמודה)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sources SET text_pages = ? WHERE source = ?", (text_pages, source_name)
+            )
+
+    def set_file_stat(self, source_name: str, file_size: int, file_mtime: float) -> None:
+        """קובץ שה-mtime שלו השתנה אבל התוכן לא (הועתק מחדש) – הסריקה הבאה לא תחשב hash שוב."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sources SET file_size = ?, file_mtime = ? WHERE source = ?",
+                (file_size, file_mtime, source_name),
+            )
+
+    def remove_chunks(self, source_name: str, count: int) -> None:
+        """מפחית את מספר ה-chunks של מקור – אחרי מחיקת chunks של עמודים שהשתנו."""
+        if not count:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sources SET chunk_count = MAX(0, chunk_count - ?) WHERE source = ?",
+                (count, source_name),
+            )
+
+    def delete_source(self, source_name: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sources WHERE source = ?", (source_name,))
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sources")
+
+    def names(self) -> set[str]:
+        """שמות כל המסמכים המאונדקסים."""
+        with self._lock:
+            return {r[0] for r in self._conn.execute("SELECT source FROM sources")}
+
+    def get(self, source_name: str) -> dict | None:
+        """רשומת מקור אחד (כמו ב-list), או None אם אינו מאונדקס."""
+        with self._lock:
+            שורה = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM sources WHERE source = ?", (source_name,)
+            ).fetchone()
+        return dict(zip(_COLUMNS, שורה)) if שורה else None
+
+    def list(self) -> list[dict]:
+        """כל הרשומות, ממוינות לפי שם."""
+        with self._lock:
+            שורות = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM sources ORDER BY source"
+            ).fetchall()
+        return [dict(zip(_COLUMNS, שורה)) for שורה in שורות]
+
+    def total_chunks(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(chunk_count), 0) FROM sources"
+            ).fetchone()[0]
+
+    def ensure_synced(self, collection, batch_size: int = 2000) -> None:
+        """
+        בונה את הקטלוג מחדש מהמטא של האוסף אם סך ה-chunks לא תואם
+        (chroma_db שנבנה לפני הקטלוג, או אינדוקס שנקטע). content_hash לא ידוע במקרה זה.
+        """
+        if collection.count() == self.total_chunks():
+            return
+
+        ספירות: dict[str, list[int]] = {}
+        היסט = 0
+        while True:
+            אצווה = collection.get(include=["metadatas"], limit=batch_size, offset=היסט)
+            if not אצווה["ids"]:
+                break
+            היסט += len(אצווה["ids"])
+            for מטא in אצווה["metadatas"]:
+                רשומה = ספירות.setdefault(מטא["source"], [0, 0])
+                רשומה[0] += 1
+                רשומה[1] = max(רשומה[1], מטא.get("page_number", 0))
+
+        עכשיו = time.time()
+        with self._lock, self._conn:
+            קבצים = {
+                r[0]: r[1:] for r in self._conn.execute(
+                    "SELECT source, content_hash, file_size, file_mtime, text_pages FROM sources"
+                )
+            }
+            שורות = []
+            for מקור, (n, עמודים) in ספירות.items():
+                hash_, גודל, mtime, עם_טקסט = קבצים.get(מקור, ("", 0, 0.0, -1))
+                שורות.append((מקור, עמודים, n, hash_, עכשיו, גודל, mtime, עם_טקסט))
+            self._conn.execute("DELETE FROM sources")
+            self._conn.executemany(
+                "INSERT INTO sources (source, page_count, chunk_count, content_hash, indexed_at, "
+                "file_size, file_mtime, text_pages) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                שורות,
+            )
@@ -0,0 +1,102 @@
+"""
+מאגר משותף וארוך-חיים: לקוח ChromaDB יחיד + האוסף pdf_collection + אינדקס BM25 + מאגר העמודים
++ קטלוג המקורות.
+כל הפונקציות ב-rag.py עוברות דרך get_store() במקום לפתוח PersistentClient בכל קריאה,
+ו-app.py עוטף אותו ב-st.cache_resource כך שהוא משותף לכל ה-sessions של Streamlit.
+"""
+import os
+import threading
+
+import chromadb
+
+from bm25_index import BM25Index
+from page_store import PageStore
+from source_catalog import SourceCatalog
+
+CHROMA_PATH = "chroma_db"
+COLLECTION_NAME = "pdf_collection"
+
+
+class RagStore:
+    """
+    מחזיק את כל חיבורי האחסון של המערכת. כל רכיב נוצר בעצלות בגישה הראשונה,
+    תחת מנעול – בטוח לשימוש בו-זמני מכמה threads.
+    """
+
+    def __init__(self, path: str = CHROMA_PATH, collection_name: str = COLLECTION_NAME):
+        self.path = path
+        self.collection_name = collection_name
+        self._lock = threading.RLock()
+        self._client = None
+        self._collection = None
+        self._bm25 = None
+        self._pages = None
+        self._catalog = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = chromadb.PersistentClient(path=self.path)
+            return self._client
+
+    @property
+    def collection(self):
+        with self._lock:
+            if self._collection is None:
+                self._collection = self.client.get_or_create_collection(name=self.collection_name)
+            return self._collection
+
+    @property
+    def bm25(self) -> BM25Index:
+        with self._lock:
+            if self._bm25 is None:
+                self._bm25 = BM25Index(os.path.join(self.path, "rag_index.sqlite3"))
+            return self._bm25
+
+    @property
+    def pages(self) -> PageStore:
+        with self._lock:
+            if self._pages is None:
+                self._pages = PageStore(self.bm25.path)
+            return self._pages
+
+    @property
+    def catalog(self) -> SourceCatalog:
+        """קטלוג המקורות – מסונכרן מול האוסף פעם אחת, ביצירה (למשל chroma_db מוכן מראש)."""
+        with self._lock:
+            if self._catalog is None:
+                קטלוג = SourceCatalog(self.bm25.path)
+                קטלוג.ensure_synced(self.collection)
+                self._catalog = קטלוג
+            return self._catalog
+
+    def delete_collection(self) -> bool:
+        """
+        מוחק את האוסף ב-ChromaDB ומנקה את האינדקסים הנלווים.
+        מחזיר False אם האוסף לא היה קיים. הידית השמורה מתאפסת – תיווצר מחדש בגישה הבאה.
+        """
+        with self._lock:
+            try:
+                self.client.delete_collection(name=self.collection_name)
+                נמחק = True
+            except Exception:
+                נמחק = False
+            self._collection = None
+            self.bm25.clear()
+            self.pages.clear()
+            self.catalog.clear()
+            return נמחק
+
+
+_store: RagStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> RagStore:
+    """מחזיר את המאגר המשותף לתהליך (יוצר אותו בקריאה הראשונה)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RagStore()
+        return _store
@@ -0,0 +1,115 @@
+"""
+לקוחות stub מקומיים בממשק של anthropic.Anthropic – להרצה ומדידה ללא רשת וללא מפתח API.
+מחזירים תשובה קבועה אחרי השהייה מוגדרת, ויכולים להזריק שגיאות rate limit (429).
+שימוש: process_large_pdf(..., client=StubAnthropic(latency=0.3))
+תומכים גם ב-messages.stream(...) – התשובה נשלחת מילה אחר מילה (token_latency בין קטעים).
+"""
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+class StubRateLimitError(Exception):
+    """שגיאה עם status_code=429 – מזוהה ע"י _is_rate_limit_error כמו RateLimitError אמיתי."""
+    status_code = 429
+
+
+class _StubStream:
+    """context manager בממשק MessageStream: text_stream + get_final_message()."""
+
+    def __init__(self, owner: "StubAnthropic", kwargs: dict):
+        self._owner = owner
+        self._kwargs = kwargs
+        self._final = None
+
+    def __enter__(self):
+        # ההשהייה ושגיאות ה-429 חלות על פתיחת הזרם, כמו בבקשה אמיתית
+        self._final = self._owner.messages.create(**self._kwargs)
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        # קטעים בגודל מילה, כולל הרווח שאחריה – החיבור שלהם שווה לתשובה המלאה
+        for קטע in re.findall(r"\S+\s*|\s+", self._final.content[0].text):
+            time.sleep(self._owner.token_latency)
+            yield קטע
+
+    def get_final_message(self):
+        return self._final
+
+
+class _StubMessages:
+    def __init__(self, owner: "StubAnthropic"):
+        self._owner = owner
+
+    def stream(self, **kwargs) -> _StubStream:
+        return _StubStream(self._owner, kwargs)
+
+    def create(self, **kwargs):
+        בעלים = self._owner
+        with בעלים._lock:
+            בעלים.calls += 1
+            בעלים.requests.append(kwargs)
+            בעלים.in_flight += 1
+            בעלים.max_in_flight = max(בעלים.max_in_flight, בעלים.in_flight)
+            נכשלת = בעלים.calls <= בעלים.rate_limit_first
+        try:
+            time.sleep(בעלים.latency)
+            if נכשלת or (בעלים.rate_limit_ratio and random.random() < בעלים.rate_limit_ratio):
+                with בעלים._lock:
+                    בעלים.rate_limited += 1
+                raise StubRateLimitError("stub: rate limited")
+            טקסט = בעלים.reply(kwargs) if callable(בעלים.reply) else בעלים.reply
+            return SimpleNamespace(
+                content=[SimpleNamespace(type="text", text=טקסט)],
+                usage=SimpleNamespace(**{
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "cache_creation_input_tokens": 0,
+                    "cache_read_input_tokens": 0,
+                    **בעלים.usage,
+                }),
+            )
+        finally:
+            with בעלים._lock:
+                בעלים.in_flight -= 1
+
+
+class StubAnthropic:
+    """
+    לקוח stub: client.messages.create(...) מחזיר reply (מחרוזת, או פונקציה שמקבלת את ה-kwargs).
+    latency: השהייה בשניות לכל קריאה | rate_limit_ratio: הסתברות לשגיאת 429.
+    rate_limit_first: מספר הקריאות הראשונות שנכשלות ב-429 (הזרקה דטרמיניסטית לבדיקות).
+    token_latency: השהייה בין קטעים ב-messages.stream.
+    usage: שדות usage לכל תשובה (למשל cache_read_input_tokens) – ברירת מחדל 0.
+    מונים: calls, rate_limited, max_in_flight (מקסימום קריאות במקביל שנצפו);
+    requests – הפרמטרים של כל קריאה (create או stream), לפי הסדר.
+    """
+
+    def __init__(
+        self,
+        reply="stub context sentence",
+        latency: float = 0.0,
+        rate_limit_ratio: float = 0.0,
+        token_latency: float = 0.0,
+        rate_limit_first: int = 0,
+        usage: dict | None = None,
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.rate_limit_first = rate_limit_first
+        self.usage = usage or {}
+        self.calls = 0
+        self.requests: list[dict] = []
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.messages = _StubMessages(self)
@@ -0,0 +1,73 @@
+"""
+סביבת בדיקה: כל בדיקה רצה בתיקייה זמנית (chroma_db / cache חדשים), עם embedder מקומי
+דטרמיניסטי (ללא הורדת מודל) ולקוח Anthropic מדומה (stub_clients.StubAnthropic, ללא רשת).
+"""
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+from chromadb.api.shared_system_client import SharedSystemClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embeddings  # noqa: E402
+import rag  # noqa: E402
+import rerankers  # noqa: E402
+import store  # noqa: E402
+from stub_clients import StubAnthropic  # noqa: E402
+
+
+class HashEmbedder(embeddings.Embedder):
+    """וקטור bag-of-words מ-hash של המילים – מספיק לבדיקות אחסון ואינדוקס."""
+
+    def __init__(self):
+        super().__init__(model_name="test-hash")
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        וקטורים = np.zeros((len(texts), 32), dtype=np.float32)
+        for i, טקסט in enumerate(texts):
+            for מילה in טקסט.split():
+                וקטורים[i, int(hashlib.md5(מילה.encode()).hexdigest(), 16) % 32] += 1
+        return וקטורים / np.maximum(np.linalg.norm(וקטורים, axis=1, keepdims=True), 1e-9)
+
+
+@pytest.fixture
+def rag_env(tmp_path, monkeypatch):
+    """תיקייה זמנית + איפוס כל המאגרים והמטמונים המשותפים של התהליך."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "_store", None)
+    monkeypatch.setattr(embeddings, "_embedder", HashEmbedder())
+    for שם in ("_context_cache", "_query_cache", "_summary_cache", "_standards_cache"):
+        monkeypatch.setattr(rag, שם, None)
+    monkeypatch.setattr(rerankers, "_rerank_cache", None)
+    yield tmp_path
+    # chroma שומר system לכל נתיב ברמת התהליך – תיקייה זמנית שנמחקה לא תשמש את הבדיקה הבאה
+    SharedSystemClient.clear_system_cache()
+
+
+@pytest.fixture
+def stub_client():
+    return StubAnthropic()
+
+
+@pytest.fixture
+def make_pdf(rag_env, monkeypatch):
+    """
+    make_pdf(pages, name) → נתיב לקובץ "PDF" שהעמודים שלו הם pages (החילוץ עצמו לא נבדק).
+    תוכן הקובץ נגזר מהעמודים – hash הקובץ משתנה כשהם משתנים.
+    """
+    עמודים_לקובץ: dict[str, list[str]] = {}
+    monkeypatch.setattr(rag, "count_pdf_pages", lambda path: len(עמודים_לקובץ[path]))
+    monkeypatch.setattr(
+        rag, "load_pdf_pages", lambda path, profile=None: iter(עמודים_לקובץ[path])
+    )
+
+    def _make(pages: list[str], name: str = "doc.pdf") -> str:
+        נתיב = rag_env / name
+        נתיב.write_bytes("\f".join(pages).encode("utf-8"))
+        עמודים_לקובץ[str(נתיב)] = list(pages)
+        return str(נתיב)
+
+    return _make
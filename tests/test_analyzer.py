@@ -0,0 +1,58 @@
+"""מקרי זהב ל-analyzer: אותם מונחים באינדוקס ובשאילתה."""
+import pytest
+
+from analyzer import analyze
+
+
+@pytest.mark.parametrize("text, terms", [
+    ("6.10 Pumps", ["6.10", "pumps"]),
+    ("6.1 General", ["6.1", "general"]),
+    ("6.20.", ["6.20"]),
+    ("6.2.3", ["6.2.3"]),
+    ("1.18 mio m3", ["1180000", "m3"]),
+    ("1,180,000 m3", ["1180000", "m3"]),
+    ("1.5 MCM", ["1500000", "m3"]),
+    ("1.180 m", ["1.18", "m"]),
+    ("2.50 מ\"ק", ["2.5", "m3"]),
+    ("(m3),", ["m3"]),
+])
+def test_numbers_units_and_sections(text, terms):
+    assert analyze(text) == terms
+
+
+def test_two_level_sections_stay_distinct():
+    assert analyze("section 6.10") != analyze("section 6.1")
+    assert analyze("clause 6.20") != analyze("clause 6.2")
+
+
+def test_quantities_match_across_notations():
+    assert analyze("1.18 mio m3") == analyze("1,180,000 cubic meters")
+
+
+@pytest.mark.parametrize("prefixed, bare", [
+    ("המאגר", "מאגר"),
+    ("המשאבה", "משאבה"),
+    ("ובמאגר", "מאגר"),
+    ("והמשאבה", "משאבה"),
+    ("לסכר", "סכר"),
+])
+def test_hebrew_prefixed_and_bare_forms_share_a_term(prefixed, bare):
+    assert set(analyze(prefixed)) & set(analyze(bare))
+
+
+def test_hebrew_surface_form_is_kept():
+    # "מאגר" אינו "ה"+"אגר" – הצורה עצמה נשמרת, גם כשהאות הראשונה היא אות שימוש
+    assert analyze("מאגר")[0] == "מאגר"
+    assert analyze("המאגר")[0] == "המאגר"
+
+
+def test_bm25_matches_prefixed_form(tmp_path):
+    from bm25_index import BM25Index
+
+    אינדקס = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    אינדקס.add_chunks([
+        ("a", "doc.pdf", "נפח המאגר העליון"),
+        ("b", "doc.pdf", "תחנת השאיבה והמשאבה"),
+    ])
+    assert [מזהה for מזהה, _ in אינדקס.search("מאגר")] == ["a"]
+    assert [מזהה for מזהה, _ in אינדקס.search("משאבה")] == ["b"]
@@ -0,0 +1,119 @@
+"""search_and_answer_stream – סדר האירועים, התשובה המלאה ומבנה ה-prompt caching, מול StubAnthropic."""
+import json
+import re
+
+import pytest
+
+import rag
+from stub_clients import StubAnthropic
+
+PAGES = [
+    f"{i}. Section {i}\nThe pump station number {i} has a design flow of {i}0 m3/s. "
+    + " ".join(f"detail{i}_{j}" for j in range(40))
+    for i in range(1, 5)
+]
+ANSWER = "The design flow of pump station 2 is 20 m3/s [doc.pdf, page 2]."
+
+
+def _reply(kwargs) -> str:
+    """תשובה לפי סוג הבקשה: תרגום+הרחבה (JSON), תשובה (עם system), או הקשר לעמוד."""
+    if "system" in kwargs:
+        return ANSWER
+    if kwargs["messages"][0]["content"].startswith("Rewrite the following"):
+        return json.dumps({
+            "translation": "pump station design flow",
+            "alternatives": ["pump station flow m3/s", "pumping station discharge capacity"],
+        })
+    return "Page context."
+
+
+@pytest.fixture
+def indexed(make_pdf, monkeypatch):
+    monkeypatch.setenv("RAG_RERANKER", "lexical")
+    לקוח = StubAnthropic(reply=_reply)
+    rag.process_large_pdf(make_pdf(PAGES), "doc.pdf", client=לקוח)
+    לקוח.requests.clear()
+    return לקוח
+
+
+def test_stream_event_order_and_answer(indexed):
+    אירועים = list(rag.search_and_answer_stream("מה הספיקה של תחנת השאיבה?", client=indexed))
+
+    סוגים = [סוג for סוג, _ in אירועים]
+    assert [ערך for סוג, ערך in אירועים if סוג == "stage"] == [
+        "rewrite", "search", "rerank", "answer"
+    ]
+    # כל הקטעים אחרי שלב answer, ו-usage אחד בסוף
+    שלב_תשובה = אירועים.index(("stage", "answer"))
+    assert all(i > שלב_תשובה for i, סוג in enumerate(סוגים) if סוג == "token")
+    assert סוגים[-1] == "usage" and סוגים.count("usage") == 1
+    קטעים = [ערך for סוג, ערך in אירועים if סוג == "token"]
+    assert len(קטעים) > 1
+    assert "".join(קטעים) == ANSWER
+    assert אירועים[-1][1]["stage"] == "answer"
+
+
+def test_search_and_answer_joins_the_stream(indexed):
+    assert rag.search_and_answer("What is the design flow?", client=indexed) == ANSWER
+
+
+def _cache_points(request: dict) -> int:
+    """מספר נקודות ה-cache_control בבקשה (system + messages)."""
+    בלוקים = list(request["system"])
+    for הודעה in request["messages"]:
+        if isinstance(הודעה["content"], list):
+            בלוקים += הודעה["content"]
+    return sum(בלוק.get("cache_control") == {"type": "ephemeral"} for בלוק in בלוקים)
+
+
+def test_request_has_three_cache_breakpoints(indexed, make_pdf):
+    rag.process_large_pdf(make_pdf(PAGES, "annex.pdf"), "annex.pdf", client=indexed)
+    indexed.requests.clear()
+    היסטוריה = [("שאלה ראשונה", "תשובה ראשונה"), ("שאלה שנייה", "תשובה שנייה")]
+
+    list(rag.search_and_answer_stream(
+        "What is the design flow of pump station 3?", history=היסטוריה,
+        client=indexed, history_summary="סיכום קודם",
+    ))
+    [בקשה] = [r for r in indexed.requests if "system" in r]
+
+    כללים, הקשר, סיכום = בקשה["system"]
+    assert כללים["text"] == rag.ANSWER_RULES and כללים["cache_control"] == {"type": "ephemeral"}
+    assert הקשר["cache_control"] == {"type": "ephemeral"}
+    # הסיכום משתנה בכל סבב – אחרי נקודות ה-cache ובלי נקודה משלו
+    assert "cache_control" not in סיכום and "סיכום קודם" in סיכום["text"]
+
+    הודעות = בקשה["messages"]
+    assert [h["role"] for h in הודעות] == ["user", "assistant", "user", "assistant", "user"]
+    assert הודעות[-2]["content"] == [
+        {"type": "text", "text": "תשובה שנייה", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert isinstance(הודעות[-1]["content"], str)
+    assert _cache_points(בקשה) == 3
+
+    # בלוק ההקשר ממוין לפי (מקור, עמוד) – לא לפי הדירוג – כך שהקידומת יציבה
+    כותרות = re.findall(r"\[מקור: (.+?) \| עמוד (\d+)\]\n", הקשר["text"])
+    מקומות = [(מקור, int(עמוד)) for מקור, עמוד in כותרות]
+    assert len({מקור for מקור, _ in מקומות}) == 2
+    assert מקומות == sorted(מקומות)
+
+
+def test_first_question_has_two_cache_breakpoints(indexed):
+    list(rag.search_and_answer_stream("What is the design flow?", client=indexed))
+    [בקשה] = [r for r in indexed.requests if "system" in r]
+    assert len(בקשה["system"]) == 2
+    assert _cache_points(בקשה) == 2
+
+
+def test_usage_log_records_cache_tokens(indexed):
+    indexed.usage = {"input_tokens": 40, "output_tokens": 12,
+                     "cache_read_input_tokens": 3000, "cache_creation_input_tokens": 250}
+    *_, (סוג, רשומה) = rag.search_and_answer_stream("What is the design flow?", client=indexed)
+    assert סוג == "usage"
+
+    with open(rag.USAGE_LOG_PATH, encoding="utf-8") as f:
+        שורות = [json.loads(שורה) for שורה in f]
+    assert שורות[-1] == רשומה
+    assert רשומה["stage"] == "answer"
+    assert (רשומה["cache_read_tokens"], רשומה["cache_write_tokens"]) == (3000, 250)
+    assert (רשומה["input_tokens"], רשומה["output_tokens"]) == (40, 12)
@@ -0,0 +1,48 @@
+"""ensure_synced – בנייה מחדש רק כשהפער בספירות אינו כתיבה שבאמצע."""
+import pytest
+
+import rag
+from store import get_store
+
+PAGES = [f"{i}. Part {i}\n" + " ".join(f"item{i}_{j}" for j in range(120)) for i in range(1, 4)]
+
+
+@pytest.fixture
+def indexed(make_pdf, stub_client):
+    rag.process_large_pdf(make_pdf(PAGES), "doc.pdf", client=stub_client)
+    מאגר = get_store()
+    assert מאגר.bm25.count() == מאגר.collection.count()
+    return מאגר
+
+
+def _drop_from_bm25(מאגר) -> int:
+    """מוחק chunks של עמוד אחד מה-BM25 בלבד – פער כמו אחרי כתיבה שנקטעה."""
+    מזהים = rag._source_chunks_by_page("doc.pdf")[0][2]
+    מאגר.bm25.delete_chunks(מזהים)
+    return len(מזהים)
+
+
+def test_rebuild_on_count_mismatch(indexed):
+    _drop_from_bm25(indexed)
+    indexed.bm25.ensure_synced(indexed.collection)
+    assert indexed.bm25.count() == indexed.collection.count()
+
+
+def test_no_rebuild_while_write_in_flight(indexed):
+    חסרים = _drop_from_bm25(indexed)
+    with indexed.bm25.writing():
+        indexed.bm25.ensure_synced(indexed.collection)
+        assert indexed.bm25.count() == indexed.collection.count() - חסרים
+    # הכתיבה הסתיימה – generation עלה והספירות נבדקות שוב
+    indexed.bm25.ensure_synced(indexed.collection)
+    assert indexed.bm25.count() == indexed.collection.count()
+
+
+def test_verified_generation_skips_collection_count(indexed, monkeypatch):
+    indexed.bm25.ensure_synced(indexed.collection)
+
+    def _count():
+        raise AssertionError("collection.count() called without a new write")
+
+    monkeypatch.setattr(indexed.collection, "count", _count)
+    indexed.bm25.ensure_synced(indexed.collection)
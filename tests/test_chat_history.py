@@ -0,0 +1,67 @@
+"""ChatHistory – קיפול הסבבים הישנים לסיכום מצטבר, ברקע."""
+from chat_history import ChatHistory
+from stub_clients import StubAnthropic
+
+TURNS = [(f"question {i}", f"answer {i}") for i in range(1, 6)]
+
+
+def _fill(history: ChatHistory) -> None:
+    for שאלה, תשובה in TURNS:
+        history.add_turn(שאלה, תשובה)
+
+
+def test_old_turns_are_folded_into_summary(rag_env):
+    לקוח = StubAnthropic(reply="summary of 1-3")
+    היסטוריה = ChatHistory(keep_turns=2, client=לקוח)
+    _fill(היסטוריה)
+    היסטוריה.flush(timeout=5)
+
+    assert היסטוריה.snapshot() == ("summary of 1-3", TURNS[3:])
+    assert היסטוריה.summarized == 3
+    assert list(היסטוריה) == TURNS  # התצוגה שומרת את כל הסבבים
+    בקשות = "\n".join(r["messages"][0]["content"] for r in לקוח.requests)
+    assert all(f"Q: question {i}" in בקשות for i in (1, 2, 3))
+    assert "question 4" not in בקשות
+
+
+def test_snapshot_never_exceeds_keep_turns(rag_env):
+    # הקיפול איטי – snapshot נקרא לפני שהסתיים
+    לקוח = StubAnthropic(reply="folded", latency=0.2)
+    היסטוריה = ChatHistory(keep_turns=2, client=לקוח)
+    for i, (שאלה, תשובה) in enumerate(TURNS, start=1):
+        היסטוריה.add_turn(שאלה, תשובה)
+        סיכום, סבבים = היסטוריה.snapshot()
+        assert סבבים == TURNS[max(0, i - 2):i]
+        # סבבים שיצאו מהחלון ועוד לא קופלו – בסיכום, לא הולכים לאיבוד
+        for שאלה_ישנה, _ in TURNS[:max(0, i - 2)]:
+            assert שאלה_ישנה in סיכום or סיכום.startswith("folded")
+    היסטוריה.flush(timeout=5)
+    assert היסטוריה.snapshot() == ("folded", TURNS[3:])
+
+
+def test_failed_fold_keeps_turns(rag_env):
+    נכשל = StubAnthropic(rate_limit_first=100)
+    היסטוריה = ChatHistory(keep_turns=2, client=נכשל)
+    _fill(היסטוריה)
+    היסטוריה.flush(timeout=5)
+
+    assert היסטוריה.summarized == 0 and היסטוריה.summary == ""
+    assert list(היסטוריה) == TURNS
+    סיכום, סבבים = היסטוריה.snapshot()
+    assert סבבים == TURNS[3:]
+    assert all(f"Q: {ש}\nA: {ת}" in סיכום for ש, ת in TURNS[:3])
+
+    # הקיפול הבא (אחרי הסבב הבא) מצליח ומקפל גם את מה שנכשל קודם
+    היסטוריה._client = StubAnthropic(reply="recovered")
+    היסטוריה.add_turn("question 6", "answer 6")
+    היסטוריה.flush(timeout=5)
+    assert היסטוריה.snapshot() == ("recovered", TURNS[4:] + [("question 6", "answer 6")])
+    assert היסטוריה.summarized == 4
+
+
+def test_clear_discards_pending_summary(rag_env):
+    היסטוריה = ChatHistory(keep_turns=1, client=StubAnthropic(reply="stale", latency=0.1))
+    _fill(היסטוריה)
+    היסטוריה.clear()
+    היסטוריה.flush(timeout=5)
+    assert היסטוריה.snapshot() == ("", [])
@@ -0,0 +1,26 @@
+"""הגדרות מהסביבה – ערך לא מוכר נכשל בטעינה ולא מתנהג בשקט כמו ברירת המחדל."""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_rag(**env) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", "import rag; print(rag.EXTRACTION_PROFILE)"],
+        cwd=ROOT, env={**os.environ, **env}, capture_output=True, text=True,
+    )
+
+
+def test_unknown_extraction_profile_fails_at_import():
+    תוצאה = _import_rag(RAG_EXTRACTION_PROFILE="tables")
+    assert תוצאה.returncode != 0
+    assert "RAG_EXTRACTION_PROFILE='tables'" in תוצאה.stderr
+    assert "fast, balanced, full-tables" in תוצאה.stderr
+
+
+def test_extraction_profile_is_normalized():
+    תוצאה = _import_rag(RAG_EXTRACTION_PROFILE=" Full-Tables ")
+    assert תוצאה.returncode == 0, תוצאה.stderr
+    assert תוצאה.stdout.strip() == "full-tables"
@@ -0,0 +1,68 @@
+"""סיכום מסמך וספירת תקנים – תמיד על המסמך המלא, גם כשמאגר העמודים מולא חלקית."""
+import rag
+from store import get_store
+
+PAGES = [
+    f"{i}. Chapter {i}\nConcrete works shall comply with ISO 90{i:02d} for page {i}.\n"
+    + " ".join(f"filler{i}_{j}" for j in range(60))
+    for i in range(1, 5)
+]
+
+
+def _partial_store(make_pdf, client) -> None:
+    """אינדוקס, ואז מאגר עמודים שמכיל עמוד אחד בלבד – כמו אחרי שאלה אחת על chroma_db מוכן."""
+    rag.process_large_pdf(make_pdf(PAGES), "doc.pdf", client=client)
+    get_store().pages.clear()
+    rag.fetch_full_pages([("doc.pdf", 3)], get_store().collection)
+    assert len(get_store().pages.get_source_pages("doc.pdf")) == 1
+
+
+def _prompts(client) -> str:
+    return "\n".join(str(r["messages"]) for r in client.requests)
+
+
+def test_count_standards_backfills_missing_pages(make_pdf, stub_client):
+    _partial_store(make_pdf, stub_client)
+    stub_client.requests.clear()
+
+    rag.count_standards("doc.pdf", client=stub_client)
+    for i in range(1, 5):
+        assert f"ISO 90{i:02d}" in _prompts(stub_client)
+    assert len(get_store().pages.get_source_pages("doc.pdf")) == len(PAGES)
+
+
+def test_summary_covers_every_page(make_pdf, stub_client):
+    _partial_store(make_pdf, stub_client)
+    stub_client.requests.clear()
+
+    rag.summarize_file("doc.pdf", client=stub_client)
+    for i in range(1, 5):
+        assert f"filler{i}_0" in _prompts(stub_client)
+
+
+def test_unavailable_document_is_not_summarized(rag_env, stub_client):
+    assert rag.count_standards("missing.pdf", client=stub_client).startswith("קובץ לא נמצא")
+    assert rag.summarize_file("missing.pdf", client=stub_client).startswith("לא נמצאו נתונים")
+    assert stub_client.calls == 0
+
+
+def test_blank_pages_keep_the_fast_path(make_pdf, stub_client, monkeypatch):
+    """עמוד ריק לא נשמר – המסמך עדיין נחשב שלם בלי לסרוק את האוסף."""
+    עמודים = PAGES[:2] + ["   "] + PAGES[2:]
+    rag.process_large_pdf(make_pdf(עמודים), "doc.pdf", client=stub_client)
+    assert get_store().catalog.get("doc.pdf")["text_pages"] == len(PAGES)
+
+    def _no_scan(*args, **kwargs):
+        raise AssertionError("collection scanned although every page is stored")
+
+    monkeypatch.setattr(get_store().collection, "get", _no_scan)
+    assert [עמוד for עמוד, _ in rag.load_source_pages("doc.pdf")] == [1, 2, 4, 5]
+
+
+def test_unknown_text_pages_recorded_after_one_scan(make_pdf, stub_client):
+    """מקור שאונדקס לפני text_pages – סריקה אחת של האוסף, ואחריה המסלול המהיר."""
+    rag.process_large_pdf(make_pdf(PAGES), "doc.pdf", client=stub_client)
+    get_store().catalog.set_text_pages("doc.pdf", -1)
+
+    assert len(rag.load_source_pages("doc.pdf")) == len(PAGES)
+    assert get_store().catalog.get("doc.pdf")["text_pages"] == len(PAGES)
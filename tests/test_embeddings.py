@@ -0,0 +1,31 @@
+"""Embedder – אצוות למודל ברירת המחדל דרך ה-embedding function הציבורי, ומטמון לפי טקסט."""
+import numpy as np
+
+import embeddings
+
+
+class FakeMiniLM:
+    """כמו ONNXMiniLM_L6_V2: קריאה עם רשימת טקסטים → וקטור לכל טקסט."""
+
+    def __init__(self):
+        self.batches: list[int] = []
+
+    def __call__(self, input):
+        self.batches.append(len(input))
+        return [np.full(4, len(t), dtype=np.float32) for t in input]
+
+
+def test_default_model_batches_and_caches(rag_env, monkeypatch, capsys):
+    מודל = FakeMiniLM()
+    monkeypatch.setattr(embeddings, "_onnx_minilm", lambda: מודל)
+    embedder = embeddings.Embedder(model_name=embeddings.DEFAULT_EMBEDDING_MODEL, batch_size=2)
+    טקסטים = ["a", "bb", "ccc", "dddd", "a"]
+
+    וקטורים = embedder.embed(טקסטים)
+    assert מודל.batches == [2, 2]  # "a" הכפול מחושב פעם אחת
+    assert [v[0] for v in וקטורים] == [1, 2, 3, 4, 1]
+
+    embedder.embed(["dddd", "eeeee"])
+    assert מודל.batches == [2, 2, 1]
+    # embed() נקרא בכל שאילתה – בלי הדפסה לכל קריאה
+    assert "Embeddings" not in capsys.readouterr().out
@@ -0,0 +1,79 @@
+"""האיחוד הווקטורי (accumulate_scores, ranked_order, rrf_fuse) זהה לצבירה ב-dict ומיון יציב."""
+import numpy as np
+import pytest
+
+from bm25_index import accumulate_scores, ranked_order
+from rag import rrf_fuse
+
+K_RRF = 60
+
+
+def _random_query(rng, n_chunks: int, n_results: int):
+    """מונחים עם חפיפה רבה ביניהם וציונים מעוגלים (שוויונות), ותוצאות סמנטיות שחלקן גם ב-BM25."""
+    מונחים = []
+    for _ in range(int(rng.integers(1, 6))):
+        df = int(rng.integers(1, n_chunks))
+        מזהים = rng.choice(n_chunks, size=df, replace=False).astype(np.int64)
+        ציונים = rng.integers(1, 4, size=df).astype(float) * 0.5
+        מונחים.append((מזהים, ציונים, int(rng.integers(1, 3))))
+    סמנטי = [int(m) for m in rng.choice(n_chunks, size=min(n_results, n_chunks), replace=False)]
+    return מונחים, סמנטי
+
+
+def _dict_bm25(מונחים) -> list[tuple[int, float]]:
+    ציונים: dict[int, float] = {}
+    for מזהים, ציוני_מונח, חזרות in מונחים:
+        for מזהה, ציון in zip(מזהים.tolist(), ציוני_מונח.tolist()):
+            ציונים[מזהה] = ציונים.get(מזהה, 0.0) + חזרות * ציון
+    return sorted(ציונים.items(), key=lambda x: x[1], reverse=True)
+
+
+def _dict_rrf(דירוג_bm25, סמנטי, n_results):
+    ציוני_rrf: dict[str, float] = {}
+    for דרגה, (מזהה, _) in enumerate(דירוג_bm25):
+        ציוני_rrf[f"c{מזהה}"] = ציוני_rrf.get(f"c{מזהה}", 0.0) + 0.5 / (דרגה + K_RRF)
+    for דרגה, מזהה in enumerate(סמנטי):
+        ציוני_rrf[f"c{מזהה}"] = ציוני_rrf.get(f"c{מזהה}", 0.0) + 0.5 / (דרגה + K_RRF)
+    מוויינים = sorted(ציוני_rrf, key=ציוני_rrf.__getitem__, reverse=True)[:n_results]
+    return מוויינים, {מזהה: ציוני_rrf[מזהה] for מזהה in מוויינים}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_accumulate_scores_matches_dict(seed):
+    rng = np.random.default_rng(seed)
+    מונחים, סמנטי = _random_query(rng, n_chunks=int(rng.integers(5, 80)), n_results=10)
+    ייחוס = _dict_bm25(מונחים)
+
+    for top_k in (None, 1, 7, len(ייחוס) + 3):
+        מזהים, ציונים, דרגות = accumulate_scores(מונחים, top_k, rank_of=np.array(סמנטי))
+        צפוי = ייחוס if top_k is None else ייחוס[:top_k]
+        assert list(zip(מזהים.tolist(), ציונים.tolist())) == צפוי
+        מלא = {מזהה: דרגה for דרגה, (מזהה, _) in enumerate(ייחוס)}
+        assert דרגות == {m: מלא[m] for m in סמנטי if m in מלא}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_rrf_fuse_matches_dict(seed):
+    rng = np.random.default_rng(1000 + seed)
+    n_results = int(rng.integers(3, 15))
+    מונחים, סמנטי = _random_query(rng, n_chunks=int(rng.integers(5, 60)), n_results=n_results)
+
+    מזהים, _, דרגות = accumulate_scores(מונחים, n_results, rank_of=np.array(סמנטי))
+    בפועל = rrf_fuse(
+        [f"c{m}" for m in מזהים.tolist()],
+        [f"c{m}" for m in סמנטי],
+        K_RRF,
+        n_results,
+        {f"c{m}": d for m, d in דרגות.items()},
+    )
+    assert בפועל == _dict_rrf(_dict_bm25(מונחים), סמנטי, n_results)
+
+
+def test_ranked_order_breaks_ties_by_first_seen():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        ציונים = rng.integers(0, 4, size=int(rng.integers(1, 40))).astype(float)
+        הכנסה = rng.permutation(len(ציונים))
+        צפוי = sorted(range(len(ציונים)), key=lambda i: (-ציונים[i], הכנסה[i]))
+        for k in (None, 1, 5, len(ציונים)):
+            assert ranked_order(ציונים, הכנסה, k).tolist() == (צפוי if k is None else צפוי[:k])
@@ -0,0 +1,39 @@
+"""תור האינדוקס – העלאה בזמן שעבודה לאותו מקור רצה."""
+from index_jobs import JobQueue
+
+
+def _upload(folder, name: str, data: bytes) -> str:
+    נתיב = folder / f".{name}.{len(data)}.upload"
+    נתיב.write_bytes(data)
+    return str(נתיב)
+
+
+def test_upload_while_running_waits_for_running_job(tmp_path):
+    תור = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    יעד = tmp_path / "doc.pdf"
+
+    ראשונה = תור.enqueue(str(יעד), "doc.pdf", staged_path=_upload(tmp_path, "doc.pdf", b"v1"))
+    assert תור.claim()["id"] == ראשונה
+    assert יעד.read_bytes() == b"v1"
+
+    # עבודה רצה – ההעלאה החדשה היא עבודת המשך, והקובץ של הרצה הנוכחית לא מוחלף
+    המשך = תור.enqueue(str(יעד), "doc.pdf", staged_path=_upload(tmp_path, "doc.pdf", b"v2"))
+    assert המשך not in (None, ראשונה)
+    assert תור.claim() is None
+    assert יעד.read_bytes() == b"v1"
+
+    # העלאה נוספת לפני שעבודת ההמשך נלקחה – מחליפה את הקובץ הזמני שלה
+    זמני_v3 = _upload(tmp_path, "doc.pdf", b"version3")
+    assert תור.enqueue(str(יעד), "doc.pdf", staged_path=זמני_v3) == המשך
+    assert sorted(p.name for p in tmp_path.glob("*.upload")) == [".doc.pdf.8.upload"]
+
+    תור.finish(ראשונה, 0)
+    assert תור.claim()["id"] == המשך
+    assert יעד.read_bytes() == b"version3"
+    assert not list(tmp_path.glob("*.upload"))
+
+
+def test_scan_does_not_duplicate_queued_job(tmp_path):
+    תור = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    assert תור.enqueue("pdfs/a.pdf", "a.pdf") is not None
+    assert תור.enqueue("pdfs/a.pdf", "a.pdf") is None
@@ -0,0 +1,69 @@
+"""אריזת ההקשר בתקציב טוקנים – pack_context ו-_trim_around."""
+import rag
+from rag import estimate_tokens
+
+
+def _page(tag: str, lines: int) -> str:
+    """עמוד ASCII של lines שורות (~10 טוקנים לשורה)."""
+    return "\n".join(f"{tag} line {i:04d} filler text" for i in range(lines))
+
+
+def _item(tag: str, lines: int, score: float, chunk: str | None = None) -> dict:
+    full = _page(tag, lines)
+    return {"source": "doc.pdf", "page": tag, "full": full, "chunk": chunk or full[:300],
+            "ציון": score}
+
+
+def test_trim_keeps_matched_chunk_in_window():
+    full = _page("p", 600)
+    # chunk מאמצע העמוד, עם הקשר ו-prefix כמו באינדוקס
+    גוף = "\n".join(full.split("\n")[400:410])
+    chunk = f"Page context sentence.\n[מקור: doc.pdf | עמוד 1]\n{גוף}"
+
+    חתוך = rag._trim_around(full, chunk, 300)
+    assert גוף in חתוך
+    assert estimate_tokens(חתוך) <= 300 + 5  # + סימני ההשמטה
+    assert חתוך.startswith("…\n") and חתוך.endswith("\n…")
+
+
+def test_trim_without_match_starts_at_page_top():
+    full = _page("p", 600)
+    חתוך = rag._trim_around(full, "text that is not on the page", 200)
+    assert חתוך.startswith("p line 0000")
+    assert rag._trim_around("short page", "x", 200) == "short page"
+
+
+def test_packed_context_never_exceeds_budget():
+    items = [_item(f"p{i}", 40 + 25 * i, score=1.0 / (i + 1)) for i in range(12)]
+    for תקציב in (500, 1200, 3000):
+        נבחרו = rag.pack_context(items, budget_tokens=תקציב, page_cap=800)
+        assert נבחרו
+        assert sum(i["tokens"] for i in נבחרו) <= תקציב
+        assert all(i["tokens"] == estimate_tokens(i["full"]) for i in נבחרו)
+        # בסדר הדירוג המקורי
+        assert [i["page"] for i in נבחרו] == sorted((i["page"] for i in נבחרו),
+                                                     key=lambda p: int(p[1:]))
+
+
+def test_top_page_always_included_and_trimmed_to_cap():
+    # העמוד הראשון ארוך מהתקרה וצפיפות הציון שלו הנמוכה ביותר
+    items = [_item("top", 1000, score=0.01)] + [_item(f"p{i}", 30, score=1.0) for i in range(20)]
+    נבחרו = rag.pack_context(items, budget_tokens=2000, page_cap=500)
+    assert נבחרו[0]["page"] == "top"
+    assert estimate_tokens(items[0]["full"]) > 500 >= נבחרו[0]["tokens"]
+
+
+def test_small_remainder_is_dropped_not_truncated():
+    # העמוד השני משאיר פחות מ-MIN_PAGE_TOKENS – השלישי לא נחתך לשארית
+    ראשון = _item("a", 60, score=1.0)
+    שני = _item("b", 60, score=0.9)
+    שלישי = _item("c", 60, score=0.8)
+    תקציב = estimate_tokens(ראשון["full"]) + estimate_tokens(שני["full"]) + rag.MIN_PAGE_TOKENS - 1
+
+    נבחרו = rag.pack_context([ראשון, שני, שלישי], budget_tokens=תקציב, page_cap=תקציב)
+    assert [i["page"] for i in נבחרו] == ["a", "b"]
+
+    # שארית של MIN_PAGE_TOKENS ומעלה – העמוד נחתך לתוכה
+    נבחרו = rag.pack_context([ראשון, שני, שלישי], budget_tokens=תקציב + 60, page_cap=תקציב)
+    assert [i["page"] for i in נבחרו] == ["a", "b", "c"]
+    assert נבחרו[2]["tokens"] < estimate_tokens(שלישי["full"])
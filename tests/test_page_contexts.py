@@ -0,0 +1,66 @@
+"""Contextual Retrieval בזמן אינדוקס – סדר העמודים, תקרת המקביליות וניסיון חוזר על 429."""
+import functools
+import re
+import time
+
+import pytest
+
+import rag
+from stub_clients import StubAnthropic
+
+PAGES = [f"Page {i} body text about item {i}" for i in range(1, 13)]
+
+
+def _page_number(kwargs) -> int:
+    return int(re.search(r"Page (\d+) body", kwargs["messages"][0]["content"]).group(1))
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    """backoff של מילישניות במקום שניות – אותו מסלול ניסיון חוזר."""
+    monkeypatch.setattr(
+        rag, "_generate_chunk_context",
+        functools.partial(rag._generate_chunk_context, base_delay=0.001),
+    )
+
+
+def _slower_for_early_pages(kwargs) -> str:
+    """עמודים מוקדמים איטיים יותר – מסתיימים אחרי המאוחרים."""
+    עמוד = _page_number(kwargs)
+    time.sleep(0.005 * (len(PAGES) + 1 - עמוד))
+    return f"context {עמוד}"
+
+
+def test_yields_in_page_order(rag_env):
+    לקוח = StubAnthropic(reply=_slower_for_early_pages)
+    pages = PAGES[:5] + ["   "] + PAGES[6:]
+    תוצאות = list(rag._iter_page_contexts(pages, לקוח, "doc.pdf", concurrency=4))
+    assert [n for n, _, _ in תוצאות] == list(range(1, 13))
+    assert [h for _, _, h in תוצאות] == [
+        "" if n == 6 else f"context {n}" for n in range(1, 13)
+    ]
+    assert לקוח.calls == 11  # עמוד ריק לא נשלח
+
+
+def test_never_exceeds_concurrency(rag_env):
+    לקוח = StubAnthropic(latency=0.02)
+    list(rag._iter_page_contexts(PAGES, לקוח, "doc.pdf", concurrency=3))
+    assert לקוח.calls == len(PAGES)
+    assert לקוח.max_in_flight == 3
+
+
+def test_retries_after_rate_limit(rag_env, fast_backoff):
+    לקוח = StubAnthropic(reply=lambda kw: f"context {_page_number(kw)}", rate_limit_first=3)
+    תוצאות = list(rag._iter_page_contexts(PAGES[:2], לקוח, "doc.pdf", concurrency=1))
+    assert [h for _, _, h in תוצאות] == ["context 1", "context 2"]
+    assert לקוח.rate_limited == 3
+    assert לקוח.calls == 5
+
+
+def test_cached_contexts_skip_the_client(rag_env):
+    list(rag._iter_page_contexts(PAGES[:3], StubAnthropic(), "doc.pdf", concurrency=2))
+    לקוח = StubAnthropic()
+    סטטיסטיקה: dict = {}
+    list(rag._iter_page_contexts(PAGES[:3], לקוח, "doc.pdf", cache_stats=סטטיסטיקה))
+    assert לקוח.calls == 0
+    assert סטטיסטיקה == {"hits": 3, "misses": 0}
@@ -0,0 +1,74 @@
+"""עמוד מלא אחד לעמוד ב-ChromaDB + מאגר העמודים המקומי כמטמון שנבנה ממנו."""
+import embeddings
+
+import rag
+from store import get_store
+
+PAGES = [f"{i}. Chapter {i}\n" + " ".join(f"term{i}_{j}" for j in range(120)) for i in range(1, 4)]
+
+
+def _carriers(source: str) -> dict[int, list[str]]:
+    """{page_number: [ids של chunks שנושאים full_page_content]}."""
+    תוצאות = get_store().collection.get(where={"source": source}, include=["metadatas"])
+    נושאים: dict[int, list[str]] = {}
+    for מזהה, מטא in zip(תוצאות["ids"], תוצאות["metadatas"]):
+        נושאים.setdefault(מטא["page_number"], [])
+        if "full_page_content" in מטא:
+            נושאים[מטא["page_number"]].append(מזהה)
+    return נושאים
+
+
+def test_one_copy_per_page_in_collection(make_pdf, stub_client):
+    rag.process_large_pdf(make_pdf(PAGES), "doc.pdf", client=stub_client)
+    assert get_store().collection.count() > len(PAGES)
+    assert {עמוד: len(ids) for עמוד, ids in _carriers("doc.pdf").items()} == {1: 1, 2: 1, 3: 1}
+
+
+def test_full_pages_without_local_page_store(make_pdf, stub_client):
+    """chroma_db שהגיע בלי rag_index.sqlite3 (פריסה) – העמודים נשלפים מהאוסף."""
+    rag.process_large_pdf(make_pdf(PAGES), "doc.pdf", client=stub_client)
+    get_store().pages.clear()
+
+    עמודים = rag.fetch_full_pages([("doc.pdf", 1), ("doc.pdf", 3)], get_store().collection)
+    assert עמודים == {("doc.pdf", 1): PAGES[0], ("doc.pdf", 3): PAGES[2]}
+    # ונשמרו מחדש במאגר המקומי
+    assert get_store().pages.get_pages([("doc.pdf", 3)]) == {("doc.pdf", 3): PAGES[2]}
+
+
+def _add_legacy_chunks(with_content: bool) -> None:
+    """3 chunks לעמוד, כמו לפני מאגר העמודים – full_page_content על כל chunk (או על אף אחד)."""
+    מזהים, מסמכים, מטא = [], [], []
+    for עמוד, טקסט in enumerate(PAGES, start=1):
+        for סידורי in range(3):
+            מזהים.append(f"legacy.pdf__p{עמוד}__s{עמוד * 10 + סידורי}")
+            מסמכים.append(טקסט[סידורי * 100:סידורי * 100 + 300])
+            m = {"source": "legacy.pdf", "page_number": עמוד, "chunk_serial": עמוד * 10 + סידורי}
+            if with_content:
+                m["full_page_content"] = טקסט
+            מטא.append(m)
+    get_store().collection.add(
+        ids=מזהים, embeddings=embeddings.get_embedder().embed(מסמכים),
+        documents=מסמכים, metadatas=מטא,
+    )
+
+
+def test_migrate_legacy_layout(rag_env):
+    _add_legacy_chunks(with_content=True)
+    assert rag.migrate_page_store() == 6  # 2 עותקים עודפים לכל עמוד
+    assert _carriers("legacy.pdf") == {
+        עמוד: [f"legacy.pdf__p{עמוד}__s{עמוד * 10}"] for עמוד in (1, 2, 3)
+    }
+    assert [t for _, t in get_store().pages.get_source_pages("legacy.pdf")] == PAGES
+    # ההסבה רצה פעם אחת
+    assert rag.migrate_page_store() == 0
+
+
+def test_migrate_restores_pages_stripped_from_collection(rag_env):
+    """הסבה קודמת מחקה את השדה מכל ה-chunks – הטקסט מוחזר מהמאגר המקומי לאוסף."""
+    _add_legacy_chunks(with_content=False)
+    get_store().pages.put_pages([("legacy.pdf", i, t) for i, t in enumerate(PAGES, start=1)])
+    assert rag.migrate_page_store() == 3
+    get_store().pages.clear()
+    assert rag.fetch_full_pages([("legacy.pdf", 2)], get_store().collection) == {
+        ("legacy.pdf", 2): PAGES[1]
+    }
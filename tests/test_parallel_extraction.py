@@ -0,0 +1,50 @@
+"""load_pdf_pages_parallel – חילוץ ב-ProcessPool מחזיר את אותם עמודים, באותו סדר, כמו חילוץ סדרתי."""
+import rag
+
+N_PAGES = 7
+
+
+def _write_pdf(path, pages: list[str]) -> None:
+    """PDF מינימלי אמיתי (Helvetica, שורה אחת לעמוד) – תהליכי ה-worker קוראים את הקובץ בעצמם."""
+    n = len(pages)
+    גופנים = 3 + 2 * n
+    אובייקטים = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(n)), n),
+    ]
+    for i, טקסט in enumerate(pages):
+        אובייקטים.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {גופנים} 0 R >> >> >>"
+        )
+        זרם = f"BT /F1 14 Tf 72 720 Td ({טקסט}) Tj ET"
+        אובייקטים.append(f"<< /Length {len(זרם)} >>\nstream\n{זרם}\nendstream")
+    אובייקטים.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    תוכן = b"%PDF-1.4\n"
+    מיקומים = []
+    for מספר, גוף in enumerate(אובייקטים, start=1):
+        מיקומים.append(len(תוכן))
+        תוכן += f"{מספר} 0 obj\n{גוף}\nendobj\n".encode("latin-1")
+    xref = len(תוכן)
+    תוכן += f"xref\n0 {len(אובייקטים) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    תוכן += "".join(f"{m:010d} 00000 n \n" for m in מיקומים).encode("latin-1")
+    תוכן += (f"trailer\n<< /Size {len(אובייקטים) + 1} /Root 1 0 R >>\n"
+             f"startxref\n{xref}\n%%EOF\n").encode("latin-1")
+    path.write_bytes(תוכן)
+
+
+def test_parallel_pages_match_serial_in_order(tmp_path):
+    נתיב = tmp_path / "multi.pdf"
+    _write_pdf(נתיב, [f"Page {i} pump station flow" for i in range(1, N_PAGES + 1)])
+    assert rag.count_pdf_pages(str(נתיב)) == N_PAGES
+
+    סדרתי = list(rag.load_pdf_pages_parallel(str(נתיב), workers=1, pages_per_shard=2))
+    assert [f"Page {i} pump" in עמוד for i, עמוד in enumerate(סדרתי, start=1)] == [True] * N_PAGES
+
+    # 4 טווחים על 2 תהליכים – יותר טווחים מ-workers, והאחרון חלקי
+    מקבילי = list(rag.load_pdf_pages_parallel(
+        str(נתיב), workers=2, pages_per_shard=2, total_pages=N_PAGES,
+    ))
+    assert מקבילי == סדרתי
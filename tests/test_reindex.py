@@ -0,0 +1,67 @@
+"""אינדוקס חוזר אינקרמנטלי (process_large_pdf) – המשך אחרי אצווה שנכשלה."""
+import embeddings
+import pytest
+
+import rag
+from store import get_store
+
+PAGES = [
+    f"{i}. Section {i}\n" + " ".join(f"word{i}_{j}" for j in range(150))
+    for i in range(1, 6)
+]
+TOTAL_CHUNKS = 20  # 4 chunks לכל עמוד (500 תווים, חפיפה 100)
+
+
+@pytest.fixture
+def pdf(make_pdf):
+    return make_pdf(PAGES)
+
+
+def _index(pdf, client):
+    return rag.process_large_pdf(pdf, "doc.pdf", batch_size=3, client=client)
+
+
+def test_resume_after_failed_batch(pdf, stub_client, monkeypatch):
+    embedder = embeddings.get_embedder()
+    embed = embedder.embed
+    קריאות = []
+
+    def _נכשל_באצווה_השנייה(texts):
+        קריאות.append(len(texts))
+        if len(קריאות) == 2:
+            raise RuntimeError("embedding failed")
+        return embed(texts)
+
+    monkeypatch.setattr(embedder, "embed", _נכשל_באצווה_השנייה)
+    with pytest.raises(RuntimeError):
+        _index(pdf, stub_client)
+    monkeypatch.setattr(embedder, "embed", embed)
+
+    מאגר = get_store()
+    אחרי_כישלון = מאגר.collection.count()
+    assert 0 < אחרי_כישלון < TOTAL_CHUNKS
+    # עמוד שה-chunks שלו לא נשמרו לא נכתב למאגר העמודים
+    assert [עמוד for עמוד, _ in מאגר.pages.get_source_pages("doc.pdf")] == [1]
+
+    נכתבו = _index(pdf, stub_client)
+    assert נכתבו == TOTAL_CHUNKS - אחרי_כישלון
+    assert מאגר.collection.count() == TOTAL_CHUNKS
+    assert מאגר.bm25.count(["doc.pdf"]) == TOTAL_CHUNKS
+    assert len(מאגר.pages.get_source_pages("doc.pdf")) == 5
+    assert מאגר.catalog.get("doc.pdf")["chunk_count"] == TOTAL_CHUNKS
+
+    # הקובץ אונדקס במלואו – הרצה נוספת לא עושה כלום
+    assert _index(pdf, stub_client) == 0
+
+
+def test_page_missing_from_bm25_is_reindexed(pdf, stub_client):
+    assert _index(pdf, stub_client) == TOTAL_CHUNKS
+    מאגר = get_store()
+    עמוד_3 = rag._source_chunks_by_page("doc.pdf")[0][3]
+    מאגר.bm25.delete_chunks(עמוד_3)
+
+    # ה-hash של העמוד במאגר תואם, אבל ה-chunks שלו חסרים ב-BM25 – לא נחשב "ללא שינוי"
+    מאגר.catalog.finish_source("doc.pdf", 5, "stale-hash")
+    assert _index(pdf, stub_client) == len(עמוד_3)
+    assert מאגר.collection.count() == TOTAL_CHUNKS
+    assert מאגר.bm25.count(["doc.pdf"]) == TOTAL_CHUNKS
@@ -0,0 +1,40 @@
+"""Rerankers – מטמון הציונים נקרא ונכתב באצווה אחת לכל שאילתה."""
+import pytest
+
+import rerankers
+
+DOCS = [f"pump turbine governor section {i} " + "filler " * i for i in range(6)]
+
+
+class CountingReranker(rerankers.LexicalReranker):
+    name = "counting-test"
+
+    def __init__(self):
+        self.scored: list[int] = []
+
+    def score_batch(self, query, documents):
+        self.scored.append(len(documents))
+        return super().score_batch(query, documents)
+
+
+def test_rerank_uses_batch_cache_calls(rag_env, monkeypatch):
+    מטמון = rerankers.get_rerank_cache()
+    for שם in ("get", "set"):
+        monkeypatch.setattr(מטמון, שם, pytest.fail)
+    reranker = CountingReranker()
+    items = [{"full": d} for d in DOCS]
+
+    ראשון = reranker.rerank("pump governor", items, top_n=6)
+    שני = reranker.rerank("pump governor", items[:4] + [{"full": "pump governor new"}], top_n=5)
+    # רק העמוד החדש נשלח לדירוג; השאר מהמטמון, עם אותו ציון
+    assert reranker.scored == [6, 1]
+    ציונים = {i["full"]: i["rerank_score"] for i in ראשון}
+    assert all(ציונים[i["full"]] == i["rerank_score"] for i in שני if i["full"] in ציונים)
+
+
+def test_reranker_requires_score_batch():
+    class Incomplete(rerankers.Reranker):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
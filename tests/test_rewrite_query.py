@@ -0,0 +1,94 @@
+"""תרגום + הרחבת שאילתה – המטמון המתמשך של rewrite_query, ופענוח התשובה המשולבת."""
+import json
+import time
+
+import pytest
+
+import disk_cache
+import rag
+from stub_clients import StubAnthropic
+
+REWRITE = {"translation": "pump station design flow",
+           "alternatives": ["pump station flow m3/s", "pumping station discharge capacity"]}
+
+
+def _reply(kwargs) -> str:
+    """JSON לבקשה המשולבת; תרגום לבקשת תרגום בלבד."""
+    תוכן = kwargs["messages"][0]["content"]
+    if תוכן.startswith("Rewrite the following"):
+        return json.dumps(REWRITE)
+    return "pump station design flow"
+
+
+def test_repeated_and_normalized_question_hits_cache(rag_env):
+    לקוח = StubAnthropic(reply=_reply)
+    ראשון = rag.rewrite_query(לקוח, "מה הספיקה של תחנת השאיבה?")
+    assert ראשון == (REWRITE["translation"], REWRITE["alternatives"])
+    assert לקוח.calls == 1
+
+    assert rag.rewrite_query(לקוח, "מה הספיקה של תחנת השאיבה?") == ראשון
+    assert rag.rewrite_query(לקוח, "  מה הספיקה   של תחנת השאיבה  ") == ראשון
+    assert לקוח.calls == 1
+
+
+def test_expired_entry_is_rewritten(rag_env, monkeypatch):
+    לקוח = StubAnthropic(reply=_reply)
+    rag.rewrite_query(לקוח, "What is the design flow?")
+    עכשיו = time.time()
+    monkeypatch.setattr(disk_cache.time, "time", lambda: עכשיו + rag.QUERY_CACHE_TTL + 1)
+    rag.rewrite_query(לקוח, "What is the design flow?")
+    assert לקוח.calls == 2
+
+
+def test_translation_only_uses_its_own_key(rag_env):
+    לקוח = StubAnthropic(reply=_reply)
+    assert rag.rewrite_query(לקוח, "design flow", expand=False) == (REWRITE["translation"], [])
+    assert לקוח.calls == 1
+    # רשומת התרגום בלבד לא מחזירה שאילתה בלי גרסאות למסלול המלא
+    assert rag.rewrite_query(לקוח, "design flow") == (REWRITE["translation"], REWRITE["alternatives"])
+    assert לקוח.calls == 2
+    rag.rewrite_query(לקוח, "design flow", expand=False)
+    rag.rewrite_query(לקוח, "design flow")
+    assert לקוח.calls == 2
+
+
+def _fallback_client(combined_reply: str) -> StubAnthropic:
+    """הבקשה המשולבת מחזירה combined_reply; התרגום וההרחבה (המסלול הישן) – תשובות קבועות."""
+    def _reply(kwargs) -> str:
+        תוכן = kwargs["messages"][0]["content"]
+        if תוכן.startswith("Rewrite the following"):
+            return combined_reply
+        if תוכן.startswith("Translate the following"):
+            return "fallback translation"
+        return "fallback alt one\nfallback alt two\nfallback alt three"
+
+    return StubAnthropic(reply=_reply)
+
+
+FALLBACK = ("fallback translation", ["fallback alt one", "fallback alt two"])
+
+
+def test_single_call_parses_json_inside_prose(rag_env):
+    לקוח = _fallback_client(
+        'Here you go:\n{"translation": " pump flow ", "alternatives": ["a", " ", 3, "b", "c"]}'
+    )
+    assert rag._rewrite_query_single_call(לקוח, "q") == ("pump flow", ["a", "b"])
+    assert rag.rewrite_query(לקוח, "q") == ("pump flow", ["a", "b"])
+    assert לקוח.calls == 2  # קריאה משולבת אחת בכל אחת מהשתיים – בלי המסלול הישן
+
+
+@pytest.mark.parametrize("reply", [
+    '{"translation": "pump flow", "alternatives": ["a", "b"]',    # JSON שבור
+    "pump flow",                                                  # בלי אובייקט JSON
+    '{"translation": "pump flow"}',                               # חסר alternatives
+    '{"alternatives": ["a", "b"]}',                               # חסר translation
+    '{"translation": "pump flow", "alternatives": "a, b"}',       # alternatives אינו רשימה
+    '{"translation": ["pump flow"], "alternatives": ["a"]}',      # translation אינו מחרוזת
+    '{"translation": "  ", "alternatives": ["a"]}',               # translation ריק
+    '["pump flow", ["a", "b"]]',                                  # רשימה ולא אובייקט
+])
+def test_invalid_response_falls_back_to_two_calls(rag_env, reply):
+    לקוח = _fallback_client(reply)
+    assert rag._rewrite_query_single_call(לקוח, "q") is None
+    assert rag.rewrite_query(לקוח, "q") == FALLBACK
+    assert לקוח.calls == 4  # משולבת בבדיקה הישירה + משולבת, תרגום והרחבה
@@ -0,0 +1,33 @@
+"""scan_pdf_folder – רק קבצים חדשים או שתוכנם השתנה חוזרים לאינדוקס."""
+import os
+
+import rag
+from store import get_store
+
+
+def _pages(tag: str) -> list[str]:
+    return [f"{i}. {tag} part {i}\n" + " ".join(f"{tag}{i}_{j}" for j in range(60)) for i in range(1, 3)]
+
+
+def _bump_mtime(path: str) -> None:
+    מצב = os.stat(path)
+    os.utime(path, (מצב.st_atime, מצב.st_mtime + 10))
+
+
+def test_only_new_and_changed_files_are_returned(rag_env, make_pdf, stub_client):
+    for שם in ("touched.pdf", "kept.pdf", "same.pdf"):
+        rag.process_large_pdf(make_pdf(_pages(שם[:4]), שם), שם, client=stub_client)
+    (rag_env / "notes.txt").write_text("not a pdf")
+
+    # touched – תוכן חדש ו-mtime חדש; same – רק mtime (hash זהה); added – לא אונדקס
+    _bump_mtime(make_pdf(_pages("edit"), "touched.pdf"))
+    _bump_mtime(str(rag_env / "same.pdf"))
+    make_pdf(_pages("addd"), "added.pdf")
+
+    תוצאה = rag.scan_pdf_folder(str(rag_env))
+    assert תוצאה == {"new": ["added.pdf"], "changed": ["touched.pdf"],
+                     "unchanged": ["kept.pdf", "same.pdf"]}
+
+    # ה-hash של same.pdf נבדק פעם אחת – ה-mtime החדש נשמר בקטלוג והסריקה הבאה לא קוראת אותו
+    assert get_store().catalog.get("same.pdf")["file_mtime"] == os.stat(rag_env / "same.pdf").st_mtime
+    assert rag.scan_pdf_folder(str(rag_env)) == תוצאה